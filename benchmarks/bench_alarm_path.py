@@ -0,0 +1,70 @@
+"""
+Load test: alarm notification path against the in-process SNS stand-in.
+- Simulates `--invocations` handler invocations from `--threads` concurrent workers; each queues
+  `--alarms-per-invocation` alerts with metric_processor.send_notification and publishes them with flush_notifications
+  (a coroutine, run with asyncio.run in each worker). Alerts are queued per invocation context, so each worker's
+  report covers exactly its own alerts.
+- Latency, throttling and failures are injected by aws_fakes.FakeSNS, seeded for reproducible runs.
+
+Usage: python benchmarks/bench_alarm_path.py --invocations 5000 --alarms-per-invocation 3 --threads 16 --throttle-rate 0.05
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda_functions'))
+os.environ.setdefault('SNS_TOPIC_ARN', 'arn:aws:sns:us-east-1:123456789012:benchmark')
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+import aws_fakes  # noqa: E402
+import metric_processor  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--invocations', type=int, default=5000, help='Simulated invocations')
+    parser.add_argument('--alarms-per-invocation', type=int, default=1, help='Alerts queued per invocation')
+    parser.add_argument('--threads', type=int, default=8, help='Concurrent workers')
+    parser.add_argument('--latency-ms', type=float, default=0, help='Latency injected into every SNS call')
+    parser.add_argument('--throttle-rate', type=float, default=0, help='Share of calls failing with a throttling error')
+    parser.add_argument('--failure-rate', type=float, default=0, help='Share of calls failing with an internal error')
+    parser.add_argument('--max-tps', type=float, default=None, help='SNS quota (calls/s) enforced with a token bucket')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    fake_sns = aws_fakes.FakeSNS(latency=args.latency_ms / 1000, throttle_rate=args.throttle_rate,
+                                 failure_rate=args.failure_rate, max_calls_per_second=args.max_tps, seed=args.seed)
+    metric_processor.set_client('sns', fake_sns)
+
+    reports = []
+
+    def invoke(i):
+        for alarm in range(args.alarms_per_invocation):
+            metric_processor.send_notification(f'i-{(i + alarm) % 100:04d}', 'CPUUtilization', 95.0, 80.0)
+        reports.append(asyncio.run(metric_processor.flush_notifications()))
+
+    with open(os.devnull, 'w') as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.threads) as executor:
+                for start in range(0, args.invocations, 1000):
+                    list(executor.map(invoke, range(start, min(start + 1000, args.invocations))))
+                    metric_processor.flush_logs(summarize=True)
+            elapsed = time.perf_counter() - started
+        finally:
+            sys.stdout = stdout
+
+    print(f"invocations: {args.invocations}  threads: {args.threads}  wall: {elapsed:.2f}s  rate: {args.invocations / elapsed:.0f}/s")
+    print(f"alerts published: {sum(report['published'] for report in reports)}  failed: {sum(report['failed'] for report in reports)}")
+    print(f"SNS calls: {len(fake_sns.calls)}  injected errors: {fake_sns.error_counts}")
+
+
+if __name__ == '__main__':
+    main()
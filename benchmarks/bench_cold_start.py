@@ -0,0 +1,59 @@
+"""
+Benchmark: cold-start cost of lazy vs. eager AWS client construction.
+- Each sample runs in a fresh Python process, like a new Lambda container.
+- "lazy" imports metric_processor and runs one (non-alarming) invocation.
+- "eager" does the same, but first builds the cloudwatch / sns / logs clients at import time,
+  which is what the module used to do.
+
+Usage: python benchmarks/bench_cold_start.py [runs]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda_functions')
+
+COLD_START_SNIPPET = r'''
+import base64, gzip, json, sys, time
+started = time.perf_counter()
+import metric_processor
+if sys.argv[1] == 'eager':
+    for service_name in ('cloudwatch', 'sns', 'logs'):
+        metric_processor.get_client(service_name)
+imported = time.perf_counter()
+payload = {'logGroup': 'ServerMetricsLogGroup', 'logStream': 'i-0', 'logEvents': [
+    {'id': str(i), 'timestamp': i, 'message': json.dumps({'CPUUtilization': 10})} for i in range(100)]}
+event = {'awslogs': {'data': base64.b64encode(gzip.compress(json.dumps(payload).encode())).decode()}}
+metric_processor.lambda_handler(event, None)
+finished = time.perf_counter()
+sys.stderr.write(json.dumps({'import': imported - started, 'first_invocation': finished - imported}))
+'''
+
+
+def run_once(mode):
+    """
+    Runs one cold start in a subprocess and returns its timings in seconds.
+    """
+    env = dict(os.environ, AWS_DEFAULT_REGION=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
+    result = subprocess.run(
+        [sys.executable, '-c', COLD_START_SNIPPET, mode],
+        cwd=LAMBDA_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(result.stderr.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    print(f"{'mode':<6} {'import ms':>10} {'1st invoke ms':>14} {'total ms':>10}   (median of {runs} runs)")
+    for mode in ('eager', 'lazy'):
+        samples = [run_once(mode) for _ in range(runs)]
+        imported = statistics.median(sample['import'] for sample in samples) * 1000
+        invoked = statistics.median(sample['first_invocation'] for sample in samples) * 1000
+        total = statistics.median(sample['import'] + sample['first_invocation'] for sample in samples) * 1000
+        print(f"{mode:<6} {imported:>10.1f} {invoked:>14.1f} {total:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
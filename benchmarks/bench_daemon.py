@@ -0,0 +1,77 @@
+"""
+Benchmark: per-delivery lambda_handler invocations vs. the long-running consumer (lambda_functions/metric_daemon.py).
+- The same synthetic log events (see synthetic.py) are split into small subscription deliveries.
+- "lambda" runs lambda_handler once per delivery (base64 + gzip decode and per-invocation setup every time).
+- "daemon" puts the deliveries as gzip records into the in-process Kinesis stand-in (aws_fakes.FakeKinesis) and
+  consumes them with metric_daemon, which batches them into payloads of up to --batch-size events.
+Thresholds are set above every sample, so the measurement covers ingestion, extraction and evaluation only.
+
+Usage: python benchmarks/bench_daemon.py [--events 200000] [--delivery-size 50] [--batch-size 10000]
+"""
+import argparse
+import base64
+import os
+import sys
+import threading
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, '..', 'lambda_functions'))
+
+import synthetic  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=200000, help='Log events in total')
+    parser.add_argument('--delivery-size', type=int, default=50, help='Log events per subscription delivery')
+    parser.add_argument('--batch-size', type=int, default=10000, help='DAEMON_BATCH_MAX_EVENTS of the consumer')
+    parser.add_argument('--message-size', type=int, default=200, help='Approximate characters per log message')
+    args = parser.parse_args()
+
+    os.environ.update({
+        'METRIC_NAMES_TO_MONITOR': ','.join(synthetic.DEFAULT_METRIC_NAMES),
+        'ALARM_THRESHOLD_CPU': '1000',
+        'GROUP_BY': 'host',
+        'AWS_CLIENT_BACKEND': 'local',
+        'LOG_LEVEL': 'WARNING',
+    })
+    import metric_daemon
+    import metric_processor
+
+    log_events = synthetic.generate_log_events(args.events, message_size=args.message_size)
+    deliveries = [synthetic.encode_payload(synthetic.build_payload(log_events[start:start + args.delivery_size])) for start in range(0, args.events, args.delivery_size)]
+    print(f"{args.events} events in {len(deliveries)} deliveries of {args.delivery_size}")
+    print(f"{'mode':<8} {'events/s':>12} {'batches':>8}")
+
+    with open(os.devnull, 'w') as devnull:
+        stdout, sys.stdout = sys.stdout, devnull # Handler logs are not part of the measurement output
+        try:
+            lambda_events = [{'awslogs': {'data': base64.b64encode(delivery).decode()}} for delivery in deliveries]
+            started = time.perf_counter()
+            for event in lambda_events:
+                metric_processor.lambda_handler(event, None)
+            lambda_time = time.perf_counter() - started
+
+            kinesis = metric_processor.get_client('kinesis')
+            kinesis.put_records(StreamName='bench', Records=[{'Data': delivery, 'PartitionKey': str(index)} for index, delivery in enumerate(deliveries)])
+            source = metric_daemon.KinesisSource('bench', kinesis, metric_processor.LOG_GROUP_NAME, 'bench', poll_interval=metric_daemon.KINESIS_MIN_READ_INTERVAL, iterator_type='TRIM_HORIZON')
+            daemon = metric_daemon.MetricDaemon(source, metric_daemon.EventBatcher(args.batch_size, max_seconds=0.0))
+            started = time.perf_counter()
+            thread = threading.Thread(target=daemon.run)
+            thread.start()
+            while daemon.events < args.events:
+                time.sleep(0.001)
+            daemon_time = time.perf_counter() - started
+            daemon.stop()
+            thread.join()
+        finally:
+            sys.stdout = stdout
+
+    print(f"{'lambda':<8} {args.events / lambda_time:>12.0f} {len(deliveries):>8}")
+    print(f"{'daemon':<8} {args.events / daemon_time:>12.0f} {daemon.batches:>8}")
+    print(f"daemon speedup: {lambda_time / daemon_time:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
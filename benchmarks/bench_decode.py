@@ -0,0 +1,72 @@
+"""
+Benchmark: streaming awslogs decode vs. the original three-copy decode.
+- Builds synthetic CloudWatch Logs subscription payloads with 1k / 10k / 50k events.
+- Reports peak traced memory (tracemalloc) and wall time for each decode path.
+
+Usage: python benchmarks/bench_decode.py
+"""
+import base64
+import gzip
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda_functions'))
+import metric_processor  # noqa: E402
+import synthetic  # noqa: E402
+
+EVENT_COUNTS = (1000, 10000, 50000)
+
+
+def decode_three_copies(event):
+    """
+    Original decode path: base64 -> gzip -> json on the whole payload.
+    """
+    compressed_payload = base64.b64decode(event['awslogs']['data'])
+    uncompressed_payload = gzip.decompress(compressed_payload)
+    log_data = json.loads(uncompressed_payload)
+    count = 0
+    for _ in log_data['logEvents']:
+        count += 1
+    return count
+
+
+def decode_streaming(event):
+    """
+    Streaming decode path used by lambda_handler.
+    """
+    count = 0
+    for _ in metric_processor.iter_log_events(event['awslogs']['data']):
+        count += 1
+    return count
+
+
+def measure(decode, event):
+    """
+    Returns (events, peak_bytes, seconds) for one decode path.
+    - Wall time is taken on an untraced run, since tracemalloc slows down every allocation.
+    """
+    started = time.perf_counter()
+    count = decode(event)
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    decode(event)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, peak, elapsed
+
+
+def main():
+    print(f"{'events':>8} {'path':<12} {'peak MiB':>10} {'wall ms':>10}")
+    for event_count in EVENT_COUNTS:
+        event = synthetic.build_lambda_event(event_count)
+        for name, decode in (('three-copy', decode_three_copies), ('streaming', decode_streaming)):
+            count, peak, elapsed = measure(decode, event)
+            assert count == event_count
+            print(f"{event_count:>8} {name:<12} {peak / 2 ** 20:>10.2f} {elapsed * 1000:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark: extraction throughput per log format (see lambda_functions/extractors.py).
+- Runs metric_processor.extract_metric_columns over the same synthetic samples rendered as flat JSON
+  (parsed fully and scanned lazily with json_scan), nested JSON, EMF, logfmt and a regex-parsed plain-text line.
+- `--extra-fields` widens the JSON messages with that many unrelated fields (wide agent messages).
+- `--metric-fraction` of the messages carry metrics; the rest are plain application logs that the
+  prefilter should reject cheaply.
+
+Usage: python benchmarks/bench_extractors.py [--events 50000] [--repeat 5] [--extra-fields 40]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda_functions'))
+
+import extractors  # noqa: E402
+import metric_processor  # noqa: E402
+
+METRIC_NAMES = ('CPUUtilization', 'MemoryUtilization', 'DiskUtilization')
+SHORT_NAMES = {'CPUUtilization': 'cpu', 'MemoryUtilization': 'mem', 'DiskUtilization': 'disk'}
+
+
+def render(log_format, host, sample, extra):
+    """
+    Renders one metric sample (dict of metric name -> value) as a message in `log_format`.
+    - `extra` holds unrelated fields added to the JSON formats.
+    """
+    if log_format in ('json', 'json_scan'):
+        return json.dumps({'host': host, 'level': 'INFO', **extra, **sample})
+    if log_format == 'json_nested':
+        return json.dumps({'host': {'id': host}, 'level': 'INFO', **extra, 'metrics': {SHORT_NAMES[name]: {'util': value} for name, value in sample.items()}})
+    if log_format == 'emf':
+        return json.dumps({
+            '_aws': {'Timestamp': 1700000000000, 'CloudWatchMetrics': [{'Namespace': 'Servers', 'Dimensions': [['host']], 'Metrics': [{'Name': name, 'Unit': 'Percent'} for name in sample]}]},
+            'host': host, **extra, **sample,
+        })
+    pairs = ' '.join(f'{SHORT_NAMES[name]}={value}' for name, value in sample.items())
+    if log_format == 'logfmt':
+        return f'level=info host={host} msg="metrics report" {pairs}'
+    return f'{host} metrics report {pairs}' # regex
+
+
+EXTRACTOR_OPTIONS = {
+    'json': {'log_format': 'json', 'group_field': 'host'},
+    'json_scan': {'log_format': 'json_scan', 'group_field': 'host'},
+    'json_nested': {'log_format': 'json', 'group_field': 'host.id', 'metric_fields': {name: f'metrics.{short}.util' for name, short in SHORT_NAMES.items()}},
+    'emf': {'log_format': 'emf', 'group_field': 'host'},
+    'logfmt': {'log_format': 'logfmt', 'group_field': 'host', 'metric_fields': SHORT_NAMES},
+    'regex': {'log_format': 'regex', 'group_field': 'host', 'metric_fields': SHORT_NAMES, 'pattern': r'^(?P<host>\S+) metrics report cpu=(?P<cpu>[\d.]+) mem=(?P<mem>[\d.]+) disk=(?P<disk>[\d.]+)'},
+}
+
+
+def generate(log_format, event_count, metric_fraction, extra_fields=0, seed=0):
+    rng = random.Random(seed)
+    extra = {f'field_{i}': (f'value-{i}' if i % 2 else i * 1.5) for i in range(extra_fields)}
+    log_events = []
+    for i in range(event_count):
+        host = f'i-{i % 10:017x}'
+        if rng.random() < metric_fraction:
+            message = render(log_format, host, {name: round(rng.uniform(5, 99), 2) for name in METRIC_NAMES}, extra)
+        else:
+            message = f'{host} app[{i}]: GET /api/v1/items/{i} 200 {rng.randint(1, 500)}ms'
+        log_events.append({'id': str(i), 'timestamp': 1700000000000 + i, 'message': message})
+    return log_events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=50000, help='Log events per run')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per format (best is reported)')
+    parser.add_argument('--metric-fraction', type=float, default=0.5, help='Share of messages carrying metrics')
+    parser.add_argument('--extra-fields', type=int, default=0, help='Unrelated fields added to every JSON message')
+    args = parser.parse_args()
+
+    print(f"{'format':<12} {'events/s':>12} {'us/event':>9} {'samples':>8}")
+    with open(os.devnull, 'w') as devnull:
+        for name, options in EXTRACTOR_OPTIONS.items():
+            options = dict(options)
+            extractor = extractors.compile_extractor(options.pop('log_format'), METRIC_NAMES, **options)
+            log_events = generate(name, args.events, args.metric_fraction, args.extra_fields)
+            best = None
+            for _ in range(args.repeat):
+                stdout, sys.stdout = sys.stdout, devnull # Per-message warnings are not part of the measurement output
+                try:
+                    started = time.perf_counter()
+                    groups = metric_processor.extract_metric_columns(log_events, METRIC_NAMES, group_field=options['group_field'], default_group='unknown', extractor=extractor)
+                    elapsed = time.perf_counter() - started
+                    metric_processor.flush_logs()
+                finally:
+                    sys.stdout = stdout
+                best = elapsed if best is None else min(best, elapsed)
+            samples = sum(len(column) for columns in groups.values() for column in columns.values())
+            print(f"{name:<12} {args.events / best:>12.0f} {best / args.events * 1e6:>9.2f} {samples:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark: JSON decoding backends (see lambda_functions/json_backend.py) on realistic log messages.
+- "loads" decodes every JSON message of a synthetic batch (see synthetic.py) with each installed backend.
+- "extract" runs metric_processor.extract_metric_columns over the whole batch (prefilter, non-JSON and
+  missing-metric messages included) with an extractor compiled for each backend.
+Backends that are not installed are reported as such.
+
+Usage: python benchmarks/bench_json_backend.py [--events 50000] [--message-size 200] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, '..', 'lambda_functions'))
+
+import extractors  # noqa: E402
+import json_backend  # noqa: E402
+import metric_processor  # noqa: E402
+import synthetic  # noqa: E402
+
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=50000, help='Log events in the batch')
+    parser.add_argument('--message-size', type=int, default=200, help='Approximate characters per log message')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per backend (best is reported)')
+    args = parser.parse_args()
+
+    log_events = synthetic.generate_log_events(args.events, message_size=args.message_size)
+    json_messages = [log_event['message'] for log_event in log_events if log_event['message'].startswith('{')]
+    print(f"{args.events} events, {len(json_messages)} JSON messages of ~{args.message_size} chars")
+    print(f"{'backend':<10} {'loads msg/s':>12} {'extract events/s':>17} {'vs stdlib':>10}")
+    baseline = None
+    with open(os.devnull, 'w') as devnull:
+        for name in ('stdlib',) + json_backend.BACKEND_PREFERENCE:
+            try:
+                _, loads = json_backend.select_backend(name)
+            except ImportError:
+                print(f"{name:<10} {'not installed':>12}")
+                continue
+            loads_time = best_time(lambda: [loads(message) for message in json_messages], args.repeat)
+            extractor = extractors.compile_extractor('json', synthetic.DEFAULT_METRIC_NAMES, group_field='host', loads=loads)
+
+            def extract():
+                stdout, sys.stdout = sys.stdout, devnull # Per-message warnings are not part of the measurement output
+                try:
+                    metric_processor.extract_metric_columns(log_events, synthetic.DEFAULT_METRIC_NAMES, group_field='host', default_group='unknown', extractor=extractor)
+                    metric_processor.flush_logs()
+                finally:
+                    sys.stdout = stdout
+            extract_time = best_time(extract, args.repeat)
+            baseline = baseline or extract_time
+            print(f"{name:<10} {len(json_messages) / loads_time:>12.0f} {args.events / extract_time:>17.0f} {baseline / extract_time:>9.2f}x")
+
+
+if __name__ == '__main__':
+    main()
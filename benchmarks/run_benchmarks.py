@@ -0,0 +1,166 @@
+"""
+Benchmark suite for metric_processor.lambda_handler.
+- Runs the handler end to end on synthetic awslogs payloads (see synthetic.py) with the in-process SNS
+  stand-in (aws_fakes.py) and a no-op recovery script, so no AWS access is needed.
+- Reports throughput (events/s), per-invocation latency percentiles and peak traced memory.
+- Writes the results as JSON (--output) and can compare them against an earlier results file (--compare).
+
+Usage: python benchmarks/run_benchmarks.py --events 1000 10000 --iterations 20 --output bench_results.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import stat
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, '..', 'lambda_functions'))
+
+import synthetic  # noqa: E402
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, nargs='+', default=[1000, 10000, 50000], help='Log events per invocation (one scenario each)')
+    parser.add_argument('--iterations', type=int, default=10, help='Invocations per scenario')
+    parser.add_argument('--message-size', type=int, default=200, help='Approximate characters per log message')
+    parser.add_argument('--json-fraction', type=float, default=0.9, help='Share of JSON log messages')
+    parser.add_argument('--missing-metric-fraction', type=float, default=0.3, help='Share of JSON messages without a monitored metric')
+    parser.add_argument('--hosts', type=int, default=10, help='Distinct hosts in the batch')
+    parser.add_argument('--threshold', type=float, default=90, help='Alarm threshold for all metrics')
+    parser.add_argument('--sns-latency-ms', type=float, default=0, help='Latency injected into every SNS call')
+    parser.add_argument('--output', default='bench_results.json', help='Machine-readable results file')
+    parser.add_argument('--compare', help='Earlier results file to compare against')
+    return parser.parse_args()
+
+
+def load_metric_processor(args):
+    """
+    Imports metric_processor with the benchmark configuration and local stubs installed.
+    """
+    recovery_script = tempfile.NamedTemporaryFile('w', suffix='.sh', delete=False)
+    recovery_script.write('#!/bin/sh\nexit 0\n')
+    recovery_script.close()
+    os.chmod(recovery_script.name, stat.S_IRWXU)
+
+    os.environ.update({
+        'METRIC_NAMES_TO_MONITOR': ','.join(synthetic.DEFAULT_METRIC_NAMES),
+        'ALARM_THRESHOLD_CPU': str(args.threshold),
+        'GROUP_BY': 'host',
+        'SNS_TOPIC_ARN': 'arn:aws:sns:us-east-1:123456789012:benchmark',
+        'RECOVERY_SCRIPT_PATH': recovery_script.name,
+    })
+    import aws_fakes
+    import metric_processor
+    fake_sns = aws_fakes.FakeSNS(latency=args.sns_latency_ms / 1000)
+    metric_processor.set_client('sns', fake_sns)
+    return metric_processor, fake_sns
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(round((len(ordered) - 1) * fraction)))]
+
+
+def run_scenario(metric_processor, fake_sns, event_count, args):
+    """
+    Runs one scenario and returns its result record.
+    """
+    event = synthetic.build_lambda_event(
+        event_count,
+        message_size=args.message_size,
+        json_fraction=args.json_fraction,
+        missing_metric_fraction=args.missing_metric_fraction,
+        host_count=args.hosts,
+    )
+    calls_before = len(fake_sns.calls)
+    latencies = []
+    with open(os.devnull, 'w') as devnull:
+        stdout, sys.stdout = sys.stdout, devnull # Handler logs are not part of the measurement output
+        try:
+            for _ in range(args.iterations):
+                started = time.perf_counter()
+                response = metric_processor.lambda_handler(event, None)
+                latencies.append(time.perf_counter() - started)
+                assert response['statusCode'] == 200, response
+            tracemalloc.start()
+            metric_processor.lambda_handler(event, None)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        finally:
+            sys.stdout = stdout
+
+    ordered = sorted(latencies)
+    return {
+        'events': event_count,
+        'iterations': args.iterations,
+        'payload_bytes': len(event['awslogs']['data']),
+        'throughput_events_per_s': event_count * len(latencies) / sum(latencies),
+        'latency_ms': {
+            'mean': statistics.fmean(latencies) * 1000,
+            'p50': percentile(ordered, 0.50) * 1000,
+            'p95': percentile(ordered, 0.95) * 1000,
+            'p99': percentile(ordered, 0.99) * 1000,
+        },
+        'peak_memory_bytes': peak,
+        'sns_calls_per_invocation': (len(fake_sns.calls) - calls_before) / (args.iterations + 1),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCHMARK_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """
+    Prints throughput / p95 latency / peak memory ratios against an earlier results file.
+    """
+    with open(baseline_path) as baseline_file:
+        baseline = {scenario['events']: scenario for scenario in json.load(baseline_file)['scenarios']}
+    print(f"\nvs. {baseline_path}")
+    print(f"{'events':>8} {'throughput':>11} {'p95 latency':>12} {'peak mem':>9}")
+    for scenario in results['scenarios']:
+        before = baseline.get(scenario['events'])
+        if before:
+            print(f"{scenario['events']:>8} "
+                  f"{scenario['throughput_events_per_s'] / before['throughput_events_per_s']:>10.2f}x "
+                  f"{scenario['latency_ms']['p95'] / before['latency_ms']['p95']:>11.2f}x "
+                  f"{scenario['peak_memory_bytes'] / before['peak_memory_bytes']:>8.2f}x")
+
+
+def main():
+    args = parse_args()
+    metric_processor, fake_sns = load_metric_processor(args)
+    results = {
+        'revision': git_revision(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'options': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        'scenarios': [],
+    }
+    print(f"{'events':>8} {'events/s':>12} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak MiB':>9}")
+    for event_count in args.events:
+        scenario = run_scenario(metric_processor, fake_sns, event_count, args)
+        results['scenarios'].append(scenario)
+        latency = scenario['latency_ms']
+        print(f"{event_count:>8} {scenario['throughput_events_per_s']:>12.0f} {latency['p50']:>9.2f} "
+              f"{latency['p95']:>9.2f} {latency['p99']:>9.2f} {scenario['peak_memory_bytes'] / 2 ** 20:>9.2f}")
+
+    with open(args.output, 'w') as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Synthetic CloudWatch Logs subscription payloads for benchmarks.
+- Generates `awslogs` Lambda events shaped like real subscription deliveries.
+- Configurable event count, message size, share of JSON / non-JSON / missing-metric messages and host cardinality.
+"""
+import base64
+import gzip
+import json
+import random
+
+DEFAULT_METRIC_NAMES = ('CPUUtilization', 'MemoryUtilization', 'DiskUtilization')
+BASE_TIMESTAMP_MS = 1700000000000
+
+
+def generate_log_events(event_count, message_size=200, json_fraction=0.9, missing_metric_fraction=0.3,
+                        host_count=10, metric_names=DEFAULT_METRIC_NAMES, host_field='host', seed=0):
+    """
+    Returns a list of CloudWatch Logs events (id, timestamp, message).
+    - `json_fraction` of the messages are JSON; of those, `missing_metric_fraction` carry no monitored metric.
+    - Metric messages carry every name in `metric_names` and a `host_field` out of `host_count` hosts.
+    - Messages are padded to roughly `message_size` characters.
+    """
+    rng = random.Random(seed)
+    log_events = []
+    for i in range(event_count):
+        host = f'i-{i % host_count:017x}'
+        roll = rng.random()
+        if roll >= json_fraction:
+            message = f'{host} app[{i}]: GET /api/v1/items/{i} 200 {rng.randint(1, 500)}ms'
+        elif rng.random() < missing_metric_fraction:
+            message = {host_field: host, 'level': 'INFO', 'event': 'request', 'path': f'/api/v1/items/{i}'}
+        else:
+            message = {host_field: host, 'level': 'INFO'}
+            for metric_name in metric_names:
+                message[metric_name] = round(rng.uniform(5, 99), 2)
+        if isinstance(message, dict):
+            message = json.dumps(message)
+            padding = message_size - len(message) - len(', "pad": ""')
+            if padding > 0:
+                message = message[:-1] + ', "pad": "' + 'x' * padding + '"}'
+        elif len(message) < message_size:
+            message += ' ' + 'x' * (message_size - len(message) - 1)
+        log_events.append({
+            'id': str(36000000000000000000000000000000000000000000000000000000 + i),
+            'timestamp': BASE_TIMESTAMP_MS + i * 10,
+            'message': message,
+        })
+    return log_events
+
+
+def build_payload(log_events, log_group='ServerMetricsLogGroup', log_stream='i-0123456789abcdef0'):
+    """
+    Wraps log events into a DATA_MESSAGE subscription payload (uncompressed dict).
+    """
+    return {
+        'messageType': 'DATA_MESSAGE',
+        'owner': '123456789012',
+        'logGroup': log_group,
+        'logStream': log_stream,
+        'subscriptionFilters': ['metric-processor'],
+        'logEvents': log_events,
+    }
+
+
+def encode_payload(payload):
+    """
+    Returns the gzip-compressed JSON bytes of a subscription payload (the form delivered to Kinesis / Firehose).
+    """
+    return gzip.compress(json.dumps(payload).encode())
+
+
+def build_lambda_event(event_count, **options):
+    """
+    Returns a Lambda `awslogs` event with `event_count` synthetic log events (see generate_log_events for options).
+    """
+    payload = build_payload(generate_log_events(event_count, **options))
+    return {'awslogs': {'data': base64.b64encode(encode_payload(payload)).decode()}}
@@ -0,0 +1,131 @@
+"""
+Anomaly detection baselines: exponentially weighted mean / variance per series, optionally per hour of the week.
+- A batch of samples is folded into the baseline in closed form (decay-weighted sums computed by C-level iterators),
+  not with a per-sample Python update loop; each update is O(n) in C and the state is O(1).
+- Samples further than `sigma` standard deviations from the baseline (as it was before the batch) are flagged,
+  counted with two binary searches over the sorted batch.
+- SeasonalBaseline keeps one baseline per hour of the week (168 slots, UTC) next to a global one, so a nightly
+  batch job is compared with previous nights rather than with daytime load.
+"""
+import bisect
+import itertools
+import math
+import operator
+from array import array
+
+HOURS_PER_WEEK = 168
+EPOCH_HOUR_OF_WEEK = 72 # 1970-01-01 00:00 UTC was a Thursday; slot 0 is Monday 00:00 UTC
+
+
+class EwmaBaseline:
+    """
+    Exponentially weighted mean and variance with smoothing factor `alpha`.
+    - Keeps decayed sums of weights, values and squared values; dividing by the weight sum removes the start-up bias.
+    """
+
+    def __init__(self, alpha, state=None):
+        self.alpha = alpha
+        self.weight, self.value_sum, self.square_sum, self.count = state or (0.0, 0.0, 0.0, 0)
+
+    @property
+    def mean(self):
+        return self.value_sum / self.weight if self.weight else None
+
+    def stddev(self, floor=0.0):
+        if not self.weight:
+            return None
+        variance = self.square_sum / self.weight - self.mean ** 2
+        return max(floor, math.sqrt(max(0.0, variance)))
+
+    def update(self, values):
+        """
+        Folds a column of samples (oldest first) into the baseline; equivalent to one EWMA step per sample.
+        """
+        count = len(values)
+        if not count:
+            return
+        weights = decay_weights(self.alpha, count) # weights[k] belongs to the k-th newest sample
+        decay = (1 - self.alpha) ** count
+        self.weight = decay * self.weight + math.fsum(weights)
+        self.value_sum = decay * self.value_sum + math.fsum(map(operator.mul, weights, reversed(values)))
+        self.square_sum = decay * self.square_sum + math.fsum(map(operator.mul, weights, map(operator.mul, reversed(values), reversed(values))))
+        self.count += count
+
+    def to_state(self):
+        return [self.weight, self.value_sum, self.square_sum, self.count]
+
+
+def decay_weights(alpha, count):
+    """
+    Returns array('d') [alpha, alpha*(1-alpha), alpha*(1-alpha)^2, ...] of length `count`, built in C.
+    """
+    return array('d', itertools.accumulate(itertools.repeat(1 - alpha, count - 1), operator.mul, initial=alpha))
+
+
+def flag_samples(ordered, mean, stddev, sigma):
+    """
+    Counts samples of a sorted column outside mean +- sigma * stddev.
+    - Returns (low count, high count, lower bound, upper bound).
+    """
+    lower, upper = mean - sigma * stddev, mean + sigma * stddev
+    return bisect.bisect_left(ordered, lower), len(ordered) - bisect.bisect_right(ordered, upper), lower, upper
+
+
+def hour_of_week(timestamp):
+    """
+    Returns the hour-of-week slot (0-167, Monday 00:00 UTC = 0) of an epoch timestamp in seconds.
+    """
+    return int((timestamp // 3600 + EPOCH_HOUR_OF_WEEK) % HOURS_PER_WEEK)
+
+
+class SeasonalBaseline:
+    """
+    A global EwmaBaseline plus, if `seasonal`, one per hour-of-week slot (created as the slots are seen).
+    """
+
+    def __init__(self, alpha, seasonal=False, state=None):
+        state = state or {}
+        self.alpha = alpha
+        self.seasonal = seasonal
+        self.overall = EwmaBaseline(alpha, state.get('all'))
+        self.slots = {int(slot): EwmaBaseline(alpha, slot_state) for slot, slot_state in state.get('slots', {}).items()} if seasonal else {}
+
+    def baseline_for(self, slot, min_samples):
+        """
+        Returns the slot's baseline once it has `min_samples`, else the global one, else None (still warming up).
+        """
+        slot_baseline = self.slots.get(slot)
+        if slot_baseline is not None and slot_baseline.count >= min_samples:
+            return slot_baseline
+        return self.overall if self.overall.count >= min_samples else None
+
+    def update(self, slot, values):
+        self.overall.update(values)
+        if self.seasonal:
+            slot_baseline = self.slots.get(slot)
+            if slot_baseline is None:
+                slot_baseline = self.slots[slot] = EwmaBaseline(self.alpha)
+            slot_baseline.update(values)
+
+    def to_state(self):
+        state = {'all': self.overall.to_state()}
+        if self.seasonal:
+            state['slots'] = {str(slot): baseline.to_state() for slot, baseline in self.slots.items()}
+        return state
+
+
+def split_by_hour_of_week(timestamps, values):
+    """
+    Splits a column of samples into hour-of-week slots; returns {slot: values}.
+    - A batch almost always falls into a single slot, which is detected from its min / max timestamp
+      without looking at the individual samples.
+    """
+    if not timestamps:
+        return {}
+    first_slot = hour_of_week(min(timestamps))
+    if first_slot == hour_of_week(max(timestamps)) and max(timestamps) - min(timestamps) < 3600:
+        return {first_slot: values}
+    slots = {}
+    for timestamp, value in zip(timestamps, values):
+        slots.setdefault(hour_of_week(timestamp), array('d')).append(value)
+    return slots
@@ -0,0 +1,267 @@
+"""
+In-process stand-ins for the AWS clients used by metric_processor (SNS, SQS, CloudWatch, CloudWatch Logs, Kinesis).
+- Every call is recorded in `client.calls` as (operation, parameters).
+- Latency, throttling and failures can be injected; a seeded RNG makes injected errors reproducible.
+- Errors are raised as botocore ClientError when botocore is installed, so callers see the same exception type as in AWS.
+
+Enable them for the whole function with AWS_CLIENT_BACKEND=local, or per client with metric_processor.set_client().
+"""
+import itertools
+import os
+import random
+import threading
+import time
+import zlib
+
+try:
+    from botocore.exceptions import ClientError
+except ImportError: # Running without boto3 installed (local load tests)
+    class ClientError(Exception):
+        """
+        Minimal stand-in for botocore.exceptions.ClientError (same `response` / `operation_name` attributes).
+        """
+
+        def __init__(self, error_response, operation_name):
+            self.response = error_response
+            self.operation_name = operation_name
+            error = error_response.get('Error', {})
+            super().__init__(f"An error occurred ({error.get('Code')}) when calling the {operation_name} operation: {error.get('Message')}")
+
+
+def options_from_environment():
+    """
+    Reads fault injection options for clients created through AWS_CLIENT_BACKEND=local.
+    """
+    return {
+        'latency': float(os.environ.get('AWS_FAKE_LATENCY_MS', 0)) / 1000, # Added to every call
+        'throttle_rate': float(os.environ.get('AWS_FAKE_THROTTLE_RATE', 0)), # Share of calls failing with a throttling error
+        'failure_rate': float(os.environ.get('AWS_FAKE_FAILURE_RATE', 0)), # Share of calls failing with an internal error
+        'max_calls_per_second': float(os.environ.get('AWS_FAKE_MAX_TPS', 0)) or None, # Token bucket quota, throttling beyond it
+        'seed': int(os.environ.get('AWS_FAKE_SEED', 0)),
+    }
+
+
+class FakeClient:
+    """
+    Base class for fake AWS clients: call recording and fault injection.
+    """
+    THROTTLING_CODE = 'Throttling'
+
+    def __init__(self, latency=0.0, throttle_rate=0.0, failure_rate=0.0, max_calls_per_second=None, seed=0):
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.failure_rate = failure_rate
+        self.max_calls_per_second = max_calls_per_second
+        self.calls = []
+        self.error_counts = {} # Error code -> number of injected errors
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._tokens = max_calls_per_second or 0.0
+        self._refilled_at = time.monotonic()
+
+    def _call(self, operation, params):
+        """
+        Records a call and applies injected latency, quota throttling and random errors.
+        """
+        with self._lock:
+            self.calls.append((operation, params))
+            roll = self._rng.random()
+            over_quota = self.max_calls_per_second is not None and not self._take_token()
+        if self.latency:
+            time.sleep(self.latency)
+        if over_quota or roll < self.throttle_rate:
+            raise self._error(operation, self.THROTTLING_CODE, 'Rate exceeded', 400)
+        if roll < self.throttle_rate + self.failure_rate:
+            raise self._error(operation, 'InternalError', 'Injected failure', 500)
+
+    def _take_token(self):
+        now = time.monotonic()
+        self._tokens = min(self.max_calls_per_second, self._tokens + (now - self._refilled_at) * self.max_calls_per_second)
+        self._refilled_at = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _error(self, operation, code, message, status):
+        with self._lock:
+            self.error_counts[code] = self.error_counts.get(code, 0) + 1
+        return ClientError({'Error': {'Code': code, 'Message': message}, 'ResponseMetadata': {'HTTPStatusCode': status}}, operation)
+
+    def _next_id(self):
+        with self._lock:
+            return f'{next(self._ids):08d}-fake'
+
+    def calls_to(self, operation):
+        return [params for name, params in self.calls if name == operation]
+
+
+class FakeSNS(FakeClient):
+    """
+    SNS stand-in supporting publish and publish_batch (with per-entry failures for publish_batch).
+    """
+    THROTTLING_CODE = 'Throttled'
+
+    def publish(self, **params):
+        self._call('Publish', params)
+        return {'MessageId': self._next_id()}
+
+    def publish_batch(self, **params):
+        self._call('PublishBatch', params)
+        successful, failed = [], []
+        for entry in params['PublishBatchRequestEntries']:
+            with self._lock:
+                entry_roll = self._rng.random()
+            if entry_roll < self.failure_rate:
+                failed.append({'Id': entry['Id'], 'Code': 'InternalError', 'Message': 'Injected failure', 'SenderFault': False})
+            else:
+                successful.append({'Id': entry['Id'], 'MessageId': self._next_id()})
+        return {'Successful': successful, 'Failed': failed}
+
+
+class FakeCloudWatch(FakeClient):
+    """
+    CloudWatch stand-in; metric data is kept in `metric_data` per namespace.
+    """
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.metric_data = {}
+
+    def put_metric_data(self, **params):
+        self._call('PutMetricData', params)
+        with self._lock:
+            self.metric_data.setdefault(params['Namespace'], []).extend(params['MetricData'])
+        return {}
+
+
+class FakeCloudWatchLogs(FakeClient):
+    """
+    CloudWatch Logs stand-in; log events are kept in `log_events` per (log group, log stream).
+    """
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.log_events = {}
+
+    def put_log_events(self, **params):
+        self._call('PutLogEvents', params)
+        with self._lock:
+            self.log_events.setdefault((params['logGroupName'], params['logStreamName']), []).extend(params['logEvents'])
+        return {'nextSequenceToken': self._next_id()}
+
+    def get_log_events(self, **params):
+        self._call('GetLogEvents', params)
+        with self._lock:
+            events = list(self.log_events.get((params['logGroupName'], params['logStreamName']), []))
+        return {'events': events[:params.get('limit', 10000)]}
+
+
+class FakeSQS(FakeClient):
+    """
+    SQS stand-in supporting send_message_batch (with per-entry failures); sent bodies are kept in `messages` per queue URL.
+    """
+    THROTTLING_CODE = 'RequestThrottled'
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.messages = {}
+
+    def send_message_batch(self, **params):
+        self._call('SendMessageBatch', params)
+        successful, failed = [], []
+        for entry in params['Entries']:
+            with self._lock:
+                entry_roll = self._rng.random()
+                if entry_roll < self.failure_rate:
+                    failed.append({'Id': entry['Id'], 'Code': 'InternalError', 'Message': 'Injected failure', 'SenderFault': False})
+                    continue
+                self.messages.setdefault(params['QueueUrl'], []).append(entry['MessageBody'])
+            successful.append({'Id': entry['Id'], 'MessageId': self._next_id()})
+        return {'Successful': successful, 'Failed': failed}
+
+
+class FakeKinesis(FakeClient):
+    """
+    Kinesis Data Streams stand-in (the source of metric_daemon.py): put_record(s), list_shards, get_shard_iterator, get_records.
+    - Streams are created on first use with `shard_count` shards; records are routed to shards by partition key.
+    - Shard iterators are "<stream>|<shard id>|<position>" strings; records are kept in memory until the client is dropped.
+    """
+    THROTTLING_CODE = 'ProvisionedThroughputExceededException'
+
+    def __init__(self, shard_count=1, **options):
+        super().__init__(**options)
+        self.shard_count = shard_count
+        self.streams = {} # Stream name -> list of shards (lists of records)
+
+    def _shards(self, stream_name):
+        with self._lock:
+            return self.streams.setdefault(stream_name, [[] for _ in range(self.shard_count)])
+
+    def create_stream(self, **params):
+        self._call('CreateStream', params)
+        with self._lock:
+            self.streams.setdefault(params['StreamName'], [[] for _ in range(params.get('ShardCount', self.shard_count))])
+        return {}
+
+    def put_record(self, **params):
+        self._call('PutRecord', params)
+        return self._append(params['StreamName'], params)
+
+    def put_records(self, **params):
+        self._call('PutRecords', params)
+        return {'FailedRecordCount': 0, 'Records': [self._append(params['StreamName'], record) for record in params['Records']]}
+
+    def _append(self, stream_name, record):
+        shards = self._shards(stream_name)
+        shard_index = zlib.crc32(record['PartitionKey'].encode()) % len(shards)
+        data = record['Data'].encode() if isinstance(record['Data'], str) else bytes(record['Data'])
+        with self._lock:
+            sequence_number = f'{len(shards[shard_index]):020d}'
+            shards[shard_index].append({'Data': data, 'PartitionKey': record['PartitionKey'], 'SequenceNumber': sequence_number, 'ApproximateArrivalTimestamp': time.time()})
+        return {'ShardId': f'shardId-{shard_index:012d}', 'SequenceNumber': sequence_number}
+
+    def list_shards(self, **params):
+        self._call('ListShards', params)
+        return {'Shards': [{'ShardId': f'shardId-{index:012d}'} for index in range(len(self._shards(params['StreamName'])))]}
+
+    def get_shard_iterator(self, **params):
+        self._call('GetShardIterator', params)
+        shard_index = int(params['ShardId'].rsplit('-', 1)[-1])
+        records = self._shards(params['StreamName'])[shard_index]
+        if params['ShardIteratorType'] == 'LATEST':
+            position = len(records)
+        elif params['ShardIteratorType'] == 'AFTER_SEQUENCE_NUMBER':
+            position = int(params['StartingSequenceNumber']) + 1
+        else: # TRIM_HORIZON (records are never trimmed)
+            position = 0
+        return {'ShardIterator': f"{params['StreamName']}|{shard_index}|{position}"}
+
+    def get_records(self, **params):
+        self._call('GetRecords', params)
+        stream_name, shard_index, position = params['ShardIterator'].rsplit('|', 2)
+        records = self._shards(stream_name)[int(shard_index)]
+        with self._lock:
+            batch = records[int(position):int(position) + params.get('Limit', 10000)]
+            behind = len(records) - int(position) - len(batch)
+        next_iterator = f'{stream_name}|{shard_index}|{int(position) + len(batch)}'
+        return {'Records': batch, 'NextShardIterator': next_iterator, 'MillisBehindLatest': 0 if not behind else 1000}
+
+
+FAKE_CLIENT_CLASSES = {
+    'sns': FakeSNS,
+    'sqs': FakeSQS,
+    'cloudwatch': FakeCloudWatch,
+    'logs': FakeCloudWatchLogs,
+    'kinesis': FakeKinesis,
+}
+
+
+def create_fake_client(service_name, **options):
+    """
+    Creates the fake client for `service_name`; options default to the AWS_FAKE_* environment variables.
+    """
+    if service_name not in FAKE_CLIENT_CLASSES:
+        raise ValueError(f"No local stand-in for AWS service '{service_name}'")
+    return FAKE_CLIENT_CLASSES[service_name](**(options or options_from_environment()))
@@ -0,0 +1,174 @@
+"""
+Per-event outcome tracking for one delivery (batch) of log events.
+- EventOutcomes records, per event position, which group its samples went to and whether it was quarantined.
+- Processed positions are checkpointed as a compressed bitmap keyed by log stream and first event id, so a
+  retried delivery of the same batch skips the events that were already processed.
+- Dead-letter sinks receive the quarantined events (unparseable messages, invalid values) with the reason.
+"""
+import base64
+import json
+import re
+import zlib
+from array import array
+
+DEAD_LETTER_MESSAGE_MAX_CHARS = 200000 # Log message text kept per dead-letter record (sinks may truncate further)
+_JSON_STRING_UNIT = re.compile(r'\\u[dD][89abAB][0-9a-fA-F]{2}\\u[0-9a-fA-F]{4}|\\u[0-9a-fA-F]{4}|\\.|[^\\]+') # Indivisible pieces of an encoded JSON string
+
+
+class EventOutcomes:
+    """
+    Outcomes of the events of one delivery, by position in the batch.
+    - `processed` is the bitmap restored from an earlier attempt's checkpoint (bytearray, bit i = event i).
+    - `envelope` is the delivery's awslogs envelope (logGroup / logStream), copied into dead-letter records.
+    """
+
+    def __init__(self, processed=None, envelope=None):
+        self.processed = processed or bytearray()
+        self.envelope = envelope if envelope is not None else {}
+        self.events = 0 # Events seen, skipped ones included
+        self.skipped = 0
+        self.group_events = {} # Group -> array('I') of positions of events with samples in that group
+        self.quarantined = [] # Dead-letter records
+        self._quarantined_positions = set()
+
+    def already_processed(self, position):
+        byte = position >> 3
+        return byte < len(self.processed) and self.processed[byte] >> (position & 7) & 1
+
+    def add_sample_event(self, position, group):
+        positions = self.group_events.get(group)
+        if positions is None:
+            positions = self.group_events[group] = array('I')
+        positions.append(position)
+
+    def quarantine(self, position, log_event, reason, error=None):
+        """
+        Records a dead-letter entry for an event (once per event; the first reason wins).
+        """
+        if position in self._quarantined_positions:
+            return
+        self._quarantined_positions.add(position)
+        self.quarantined.append({
+            'id': log_event.get('id'),
+            'timestamp': log_event.get('timestamp'),
+            'logGroup': self.envelope.get('logGroup'),
+            'logStream': self.envelope.get('logStream'),
+            'reason': reason,
+            'error': error,
+            'message': str(log_event.get('message'))[:DEAD_LETTER_MESSAGE_MAX_CHARS],
+        })
+
+    def checkpoint_bitmap(self, failed_groups=(), quarantine_failed=False):
+        """
+        Returns the bitmap of all events now processed: every event seen, except those whose group failed to
+        evaluate and, if the dead-letter write failed, the quarantined ones (a retry then handles them again).
+        """
+        bitmap = bytearray(b'\xff' * (self.events >> 3)) + bytearray(1)
+        bitmap[-1] = (1 << (self.events & 7)) - 1
+        retry_positions = [position for group in failed_groups for position in self.group_events.get(group, ())]
+        if quarantine_failed:
+            retry_positions.extend(self._quarantined_positions)
+        for position in retry_positions:
+            bitmap[position >> 3] &= ~(1 << (position & 7)) & 0xff
+        return bitmap
+
+    def counts(self, failed_groups=()):
+        failed = sum(len(self.group_events.get(group, ())) for group in failed_groups)
+        return {
+            'events': self.events,
+            'skipped': self.skipped,
+            'quarantined': len(self.quarantined),
+            'failed': failed,
+            'processed': self.events - self.skipped - failed,
+        }
+
+
+def encode_bitmap(bitmap):
+    return base64.b64encode(zlib.compress(bytes(bitmap))).decode()
+
+
+def decode_bitmap(encoded):
+    return bytearray(zlib.decompress(base64.b64decode(encoded))) if encoded else bytearray()
+
+
+class FileDeadLetterSink:
+    """
+    Appends dead-letter records as JSON lines to a local file (e.g. /tmp on Lambda, a volume in containers).
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, records):
+        with open(self.path, 'a') as sink_file:
+            sink_file.writelines(json.dumps(record) + '\n' for record in records)
+
+
+class SqsDeadLetterSink:
+    """
+    Sends dead-letter records to an SQS queue with send_message_batch.
+    - A batch holds at most 10 records and 256 KiB of message bodies (the limit applies to the whole request).
+    - Sizes are counted on the encoded JSON, where non-ASCII text is escaped (up to 6 bytes per character); a
+      record that is too large on its own has its message truncated to fit and is flagged `truncated`.
+    """
+    BATCH_SIZE = 10
+    MAX_BATCH_BYTES = 256 * 1024
+
+    def __init__(self, queue_url, client):
+        self.queue_url = queue_url
+        self._client = client
+
+    def write(self, records):
+        batch, batch_bytes = [], 0
+        for body in (encode_record(record, self.MAX_BATCH_BYTES) for record in records):
+            if batch and (len(batch) == self.BATCH_SIZE or batch_bytes + len(body) > self.MAX_BATCH_BYTES):
+                self._send(batch)
+                batch, batch_bytes = [], 0
+            batch.append(body)
+            batch_bytes += len(body)
+        if batch:
+            self._send(batch)
+
+    def _send(self, bodies):
+        entries = [{'Id': str(index), 'MessageBody': body} for index, body in enumerate(bodies)]
+        failed = self._client.send_message_batch(QueueUrl=self.queue_url, Entries=entries).get('Failed', [])
+        if failed:
+            raise RuntimeError(f"SQS rejected {len(failed)} dead-letter records: {failed[0].get('Code')} {failed[0].get('Message')}")
+
+
+def encode_record(record, max_bytes):
+    """
+    Encodes a dead-letter record as ASCII JSON of at most `max_bytes` bytes, truncating its message if needed.
+    - The message is cut on its encoded text, between escape sequences (a surrogate pair is kept whole).
+    """
+    body = json.dumps(record)
+    if len(body) <= max_bytes:
+        return body
+    encoded = json.dumps(str(record.get('message') or ''))[1:-1]
+    record = dict(record, message='', truncated=True)
+    budget = max_bytes - len(json.dumps(record))
+    if budget < 0:
+        raise ValueError(f"Dead-letter record of {len(body)} bytes exceeds {max_bytes} bytes without its message")
+    end = 0
+    for unit in _JSON_STRING_UNIT.finditer(encoded):
+        if unit.end() > budget:
+            if unit.group()[0] != '\\':
+                end = budget # Plain ASCII runs can be cut anywhere
+            break
+        end = unit.end()
+    record['message'] = json.loads(f'"{encoded[:end]}"')
+    return json.dumps(record)
+
+
+def open_dead_letter_sink(spec, get_client):
+    """
+    Creates a sink from a spec string: 'file:<path>' or 'sqs:<queue url>'; returns None for an empty spec.
+    """
+    if not spec:
+        return None
+    kind, _, location = spec.partition(':')
+    if kind == 'file':
+        return FileDeadLetterSink(location)
+    if kind == 'sqs':
+        return SqsDeadLetterSink(location, get_client('sqs'))
+    raise ValueError(f"Unknown dead-letter sink '{spec}' (expected file:<path> or sqs:<queue url>)")
@@ -0,0 +1,170 @@
+"""
+Log message extractors: turn one raw log message into a flat dict of {metric name: raw value, group field: value}.
+- json: JSON messages; metrics at the top level or at nested paths ("metrics.cpu.util").
+- json_scan: JSON messages read lazily; only the configured top-level keys are located and their values parsed,
+  without decoding the rest of the message into a dict. Much cheaper on wide messages, at the cost of validation:
+  malformed JSON is not detected, and a configured key nested inside another object is also picked up.
+- emf: CloudWatch Embedded Metric Format documents (metric values may be arrays of samples).
+- logfmt: "key=value key2=\"quoted value\"" lines.
+- regex: a regular expression with named groups (one per metric field, plus the group field).
+Each extractor is compiled once per container (paths split, regexes built) and only applied per message. It also
+carries a prefilter that rejects messages which cannot contain any metric before they are parsed.
+"""
+import json
+import re
+
+EXTRACTOR_FORMATS = ('json', 'json_scan', 'emf', 'logfmt', 'regex')
+_MISSING = object()
+_JSON_LITERALS = {'true': True, 'false': False, 'null': None}
+_JSON_SCAN_VALUE = r'\s*:\s*(?:"((?:[^"\\]|\\.)*)"|(-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null))'
+_LOGFMT_PAIR = re.compile(r'([^\s=]+)=(?:"((?:[^"\\]|\\.)*)"|(\S*))')
+
+
+class Extractor:
+    """
+    A compiled extractor.
+    - parse(message) returns the flat field dict (empty if the message holds none of the fields).
+    - prefilter(message) is truthy if the message may hold a metric (None: no prefilter).
+    - parse_errors are the exceptions parse() raises for messages not in the expected format.
+    """
+
+    def __init__(self, log_format, parse, prefilter, parse_errors=()):
+        self.log_format = log_format
+        self.parse = parse
+        self.prefilter = prefilter
+        self.parse_errors = parse_errors
+
+
+def quoted_key_prefilter(keys):
+    """
+    Returns a regex `search` that is truthy only if the raw text contains one of the keys as a quoted JSON string.
+    - One alternation scan per message is much cheaper than json.loads on messages that cannot hold any metric.
+    """
+    return re.compile('|'.join(re.escape(json.dumps(key, ensure_ascii=False)) for key in keys)).search
+
+
+def compile_extractor(log_format, metric_names, metric_fields=None, group_field=None, pattern=None, loads=json.loads):
+    """
+    Compiles the extractor for `log_format`.
+    - `metric_fields` maps metric names to their field (JSON path, logfmt key or regex group); default: the name itself.
+    - `group_field` (path / key / regex group) is also extracted, under its own name, when present in the message.
+    - `loads` is the JSON decoder used by the json and emf formats.
+    - Raises ValueError for an unknown format or a regex lacking a group for a metric field.
+    """
+    metric_fields = metric_fields or {}
+    fields = {name: metric_fields.get(name, name) for name in metric_names}
+    if group_field:
+        fields.setdefault(group_field, group_field)
+    identity = all(name == field for name, field in fields.items())
+
+    if log_format == 'json' and identity and not any('.' in field for field in fields.values()):
+        return Extractor('json', loads, quoted_key_prefilter([fields[name] for name in metric_names]), (json.JSONDecodeError,)) # Flat JSON: the parsed message is the field dict
+    if log_format == 'json':
+        getters = [(name, _path_getter(field)) for name, field in fields.items()]
+
+        def parse_json_paths(message):
+            document = loads(message)
+            extracted = {}
+            for name, get in getters:
+                value = get(document)
+                if value is not _MISSING:
+                    extracted[name] = value
+            return extracted
+        leaf_keys = [_last_key(fields[name]) for name in metric_names]
+        prefilter = quoted_key_prefilter(leaf_keys + [fields[name] for name in metric_names]) if all(leaf_keys) else None # A path of list indices only has no key to look for
+        return Extractor('json', parse_json_paths, prefilter, (json.JSONDecodeError,))
+
+    if log_format == 'json_scan':
+        if any('.' in field for field in metric_fields.values()):
+            raise ValueError("LOG_FORMAT=json_scan reads top-level keys only; use LOG_FORMAT=json for nested METRIC_FIELDS paths")
+        keys = '|'.join(re.escape(json.dumps(field, ensure_ascii=False)[1:-1]) for field in fields.values())
+        find_values = re.compile(f'"({keys})"' + _JSON_SCAN_VALUE).findall
+        remap = _remapper(fields, identity)
+
+        def parse_json_scan(message):
+            values = {}
+            for key, string_value, bare_value in find_values(message):
+                if bare_value:
+                    values[key] = _JSON_LITERALS.get(bare_value, bare_value) # Numbers stay text; float() converts them
+                else:
+                    values[key] = json.loads(f'"{string_value}"') if '\\' in string_value else string_value
+            return remap(values)
+        return Extractor('json_scan', parse_json_scan, None) # The key scan itself is the filter
+
+    if log_format == 'emf':
+        remap = _remapper(fields, identity)
+
+        def parse_emf(message):
+            document = loads(message)
+            if type(document) is not dict or '_aws' not in document: # Plain JSON log line, not an EMF document
+                return {}
+            return remap(document)
+        return Extractor('emf', parse_emf, quoted_key_prefilter([fields[name] for name in metric_names]), (json.JSONDecodeError,))
+
+    if log_format == 'logfmt':
+        remap = _remapper(fields, identity)
+        find_pairs = _LOGFMT_PAIR.findall
+
+        def parse_logfmt(message):
+            return remap({key: quoted or bare for key, quoted, bare in find_pairs(message)})
+        prefilter = re.compile('|'.join(re.escape(fields[name]) + '=' for name in metric_names)).search
+        return Extractor('logfmt', parse_logfmt, prefilter)
+
+    if log_format == 'regex':
+        compiled = re.compile(pattern or '')
+        missing = [field for name, field in fields.items() if field not in compiled.groupindex and name in metric_names]
+        if missing:
+            raise ValueError(f"LOG_PATTERN has no named group for: {', '.join(missing)}")
+        remap = _remapper(fields, identity)
+        search = compiled.search
+
+        def parse_regex(message):
+            match = search(message)
+            return remap({key: value for key, value in match.groupdict().items() if value is not None}) if match else {}
+        return Extractor('regex', parse_regex, None) # The regex itself is the filter
+
+    raise ValueError(f"Unknown log format '{log_format}' (expected one of {', '.join(EXTRACTOR_FORMATS)})")
+
+
+def _path_getter(path):
+    """
+    Returns a function reading a dotted path ("metrics.cpu.util", list items by index) from a parsed JSON document.
+    - A top-level key spelled like the whole path ("system.cpu.util": 95) is read first, so metric names containing
+      dots keep working without a METRIC_FIELDS entry.
+    """
+    keys = tuple(int(key) if key.isdigit() else key for key in path.split('.'))
+    if len(keys) == 1 and type(keys[0]) is str:
+        return lambda document: document.get(path, _MISSING) if type(document) is dict else _MISSING
+
+    def get(document):
+        if type(document) is dict and path in document:
+            return document[path]
+        for key in keys:
+            if type(document) is dict:
+                document = document.get(key, _MISSING)
+            elif type(document) is list and type(key) is int and key < len(document):
+                document = document[key]
+            else:
+                return _MISSING
+            if document is _MISSING:
+                return _MISSING
+        return document
+    return get
+
+
+def _last_key(path):
+    """
+    Returns the last object key of a dotted path, skipping list indices ("cpu.0" -> "cpu"), or None if it has none.
+    """
+    keys = [key for key in path.split('.') if not key.isdigit()]
+    return keys[-1] if keys else None
+
+
+def _remapper(fields, identity):
+    """
+    Returns a function renaming source fields to metric / group names (a no-op if they are the same).
+    """
+    if identity:
+        return lambda values: values
+    pairs = tuple(fields.items())
+    return lambda values: {name: values[field] for name, field in pairs if field in values}
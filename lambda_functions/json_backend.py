@@ -0,0 +1,55 @@
+"""
+JSON decoding backends: orjson or pysimdjson when present in the deployment package / layer, else the standard library.
+- Every backend's loads(text) returns the same Python objects as json.loads for valid JSON.
+- Invalid input always raises json.JSONDecodeError (orjson's error subclasses it; simdjson errors are converted),
+  so callers keep catching the stdlib exception whichever backend is active.
+- Known difference: orjson and simdjson reject the non-standard NaN / Infinity literals that json.loads accepts.
+"""
+import json
+
+BACKEND_PREFERENCE = ('orjson', 'simdjson') # Tried in this order by 'auto'
+
+
+def _orjson_loads():
+    import orjson
+    return orjson.loads # orjson.JSONDecodeError is a subclass of json.JSONDecodeError
+
+
+def _simdjson_loads():
+    import simdjson
+    simdjson_loads = simdjson.loads
+
+    def loads(text):
+        try:
+            return simdjson_loads(text)
+        except ValueError as e:
+            if isinstance(e, json.JSONDecodeError):
+                raise
+            document = text if isinstance(text, str) else bytes(text).decode('utf-8', 'replace')
+            raise json.JSONDecodeError(str(e), document, 0) from None
+    return loads
+
+
+BACKENDS = {
+    'orjson': _orjson_loads,
+    'simdjson': _simdjson_loads,
+    'stdlib': lambda: json.loads,
+}
+
+
+def select_backend(name='auto'):
+    """
+    Returns (backend name, loads function).
+    - 'auto' picks the first importable backend of BACKEND_PREFERENCE, falling back to 'stdlib'.
+    - An explicitly named backend that is not installed raises ImportError (a misconfigured deployment should fail loudly).
+    """
+    if name == 'auto':
+        for candidate in BACKEND_PREFERENCE:
+            try:
+                return candidate, BACKENDS[candidate]()
+            except ImportError:
+                continue
+        return 'stdlib', json.loads
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown JSON backend '{name}' (expected auto, {', '.join(BACKENDS)})")
+    return name, BACKENDS[name]()
@@ -0,0 +1,407 @@
+"""
+Long-running consumer: runs the metric_processor pipeline continuously on a container instead of once per Lambda invocation.
+- Reads log events from a source: a tailed log file, a Unix socket (newline-delimited messages) or a Kinesis stream
+  (CloudWatch Logs subscription records or plain lines, from AWS or any Kinesis-compatible endpoint).
+- Events are batched per log stream until DAEMON_BATCH_MAX_EVENTS or DAEMON_BATCH_MAX_SECONDS, then handed to
+  metric_processor.handle_event as decoded payloads: there is no base64 / gzip stage, and AWS clients, compiled
+  extractors, cooldowns, windows and baselines stay hot in memory between batches.
+- Runs on one event loop: the source is polled in a worker thread and the alarm actions of up to
+  DAEMON_MAX_INFLIGHT_BATCHES batches run while the next events are ingested and evaluated (in a worker thread with a
+  durable STATE_STORE, whose calls would otherwise block the loop).
+- SIGTERM / SIGINT stop the consumer once the pending batches are processed.
+
+Usage: python lambda_functions/metric_daemon.py [--source file:/var/log/server-metrics.log] [--from-start]
+"""
+import argparse
+import asyncio
+import gzip
+import itertools
+import os
+import selectors
+import signal
+import socket
+import stat
+import threading
+import time
+
+import metric_processor
+
+# --- Environment Variable Configuration (metric_processor's variables apply as well) ---
+DAEMON_SOURCE = os.environ.get('DAEMON_SOURCE', 'file:/var/log/server-metrics.log') # Where log events come from: file:<path>, unix:<socket path> or kinesis:<stream name>
+DAEMON_BATCH_MAX_EVENTS = int(os.environ.get('DAEMON_BATCH_MAX_EVENTS', 10000)) # A log stream's batch is processed once it holds this many events...
+DAEMON_BATCH_MAX_SECONDS = float(os.environ.get('DAEMON_BATCH_MAX_SECONDS', 5)) # ...or once its oldest event has waited this long
+DAEMON_BATCH_TIMEOUT_SECONDS = float(os.environ.get('DAEMON_BATCH_TIMEOUT_SECONDS', 60)) # Time budget per batch, split by DEADLINE_BUDGET like a Lambda timeout
+DAEMON_MAX_INFLIGHT_BATCHES = int(os.environ.get('DAEMON_MAX_INFLIGHT_BATCHES', 4)) # Batches whose alarm actions may still be running while ingestion continues
+DAEMON_POLL_INTERVAL_SECONDS = float(os.environ.get('DAEMON_POLL_INTERVAL_SECONDS', 0.5)) # Wait between reads of an idle file or Kinesis shard
+DAEMON_LOG_STREAM = os.environ.get('DAEMON_LOG_STREAM', socket.gethostname()) # Log stream name of file / socket / plain-text Kinesis messages
+DAEMON_KINESIS_ITERATOR = os.environ.get('DAEMON_KINESIS_ITERATOR', 'LATEST') # Where reading a Kinesis shard starts: LATEST or TRIM_HORIZON
+
+IDLE_POLL_SECONDS = 1.0 # Longest wait for events while no batch is pending (bounds the reaction time to SIGTERM)
+KINESIS_MIN_READ_INTERVAL = 0.2 # GetRecords is limited to 5 calls per second per shard
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+class BatchContext:
+    """
+    Stand-in for the Lambda context: gives each batch DAEMON_BATCH_TIMEOUT_SECONDS for the deadline-aware scheduler.
+    """
+
+    def __init__(self, timeout):
+        self.deadline = time.monotonic() + timeout
+
+    def get_remaining_time_in_millis(self):
+        return int(max(0.0, self.deadline - time.monotonic()) * 1000)
+
+
+class EventBatcher:
+    """
+    Collects log events per (log group, log stream) and releases them as decoded payloads by size or age.
+    """
+
+    def __init__(self, max_events, max_seconds):
+        self.max_events = max_events
+        self.max_seconds = max_seconds
+        self._batches = {} # (log group, log stream) -> [first event arrival (monotonic), log events]
+
+    def add(self, log_group, log_stream, log_events):
+        if not log_events:
+            return
+        batch = self._batches.get((log_group, log_stream))
+        if batch is None:
+            batch = self._batches[(log_group, log_stream)] = [time.monotonic(), []]
+        batch[1].extend(log_events)
+
+    def wait_time(self):
+        """
+        Seconds until the oldest batch is due, or None if no events are pending.
+        """
+        if not self._batches:
+            return None
+        return max(0.0, min(started for started, _ in self._batches.values()) + self.max_seconds - time.monotonic())
+
+    def take_due(self, force=False):
+        """
+        Returns the payloads of the batches that are full or old enough (all of them with `force`).
+        - A batch that grew past max_events in one read is split into payloads of at most max_events events.
+        """
+        now = time.monotonic()
+        due = [key for key, (started, log_events) in self._batches.items() if force or len(log_events) >= self.max_events or now - started >= self.max_seconds]
+        payloads = []
+        for log_group, log_stream in due:
+            _, log_events = self._batches.pop((log_group, log_stream))
+            for start in range(0, len(log_events), self.max_events):
+                payloads.append({'messageType': 'DATA_MESSAGE', 'logGroup': log_group, 'logStream': log_stream, 'logEvents': log_events[start:start + self.max_events]})
+        return payloads
+
+
+def line_events(lines, event_ids):
+    """
+    Turns raw lines (bytes) into log events stamped with the arrival time; blank lines are dropped.
+    """
+    timestamp = int(time.time() * 1000)
+    log_events = []
+    for line, event_id in zip(lines, event_ids):
+        message = line.decode('utf-8', 'replace').rstrip('\r')
+        if message.strip():
+            log_events.append({'id': str(event_id), 'timestamp': timestamp, 'message': message})
+    return log_events
+
+
+# --- Sources (poll(timeout) returns a list of (log group, log stream, log events) within about `timeout` seconds) ---
+class FileTailSource:
+    """
+    Follows a log file like `tail -F`: every complete new line is a log message.
+    - Starts at the end of the file unless `from_start`; a rotated (new inode) or truncated file is reread from its start.
+    - Event ids are the byte offsets of the lines.
+    """
+    READ_SIZE = 1 << 20
+
+    def __init__(self, path, log_group, log_stream, poll_interval, from_start=False):
+        self.path = path
+        self.log_group = log_group
+        self.log_stream = log_stream
+        self.poll_interval = poll_interval
+        self._file = None
+        self._partial = b''
+        self._line_offset = 0 # Byte offset of the first line not yet returned
+        self._open(from_start)
+
+    def _open(self, from_start):
+        try:
+            self._file = open(self.path, 'rb')
+        except FileNotFoundError: # Not created yet; retried on every poll
+            self._file = None
+            return
+        if not from_start:
+            self._file.seek(0, os.SEEK_END)
+        self._partial = b''
+        self._line_offset = self._file.tell()
+
+    def poll(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            log_events = self._read()
+            remaining = deadline - time.monotonic()
+            if log_events or remaining <= 0:
+                return [(self.log_group, self.log_stream, log_events)] if log_events else []
+            time.sleep(min(self.poll_interval, remaining))
+
+    def _read(self):
+        if self._file is None:
+            self._open(from_start=True) # A file created after start-up is read in full
+            if self._file is None:
+                return []
+        data = self._file.read(self.READ_SIZE)
+        if not data:
+            self._check_rotation()
+            return []
+        *lines, self._partial = (self._partial + data).split(b'\n')
+        event_ids = []
+        for line in lines:
+            event_ids.append(self._line_offset)
+            self._line_offset += len(line) + 1
+        return line_events(lines, event_ids)
+
+    def _check_rotation(self):
+        try:
+            current = os.stat(self.path)
+        except FileNotFoundError: # Rotated away, new file not created yet
+            return
+        if current.st_ino != os.fstat(self._file.fileno()).st_ino:
+            self._file.close()
+            self._open(from_start=True)
+        elif current.st_size < self._file.tell(): # Truncated in place (copytruncate)
+            self._file.seek(0)
+            self._partial = b''
+            self._line_offset = 0
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class UnixSocketSource:
+    """
+    Listens on a Unix stream socket; every connected client writes newline-delimited log messages.
+    """
+    READ_SIZE = 1 << 20
+
+    def __init__(self, path, log_group, log_stream):
+        self.path = path
+        self.log_group = log_group
+        self.log_stream = log_stream
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode): # Stale socket left by an earlier run
+            os.unlink(path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(path)
+        self._server.listen()
+        self._server.setblocking(False)
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._server, selectors.EVENT_READ)
+        self._partials = {} # Connection -> incomplete last line
+        self._ids = itertools.count()
+
+    def poll(self, timeout):
+        lines = []
+        for key, _ in self._selector.select(timeout):
+            if key.fileobj is self._server:
+                connection, _ = self._server.accept()
+                connection.setblocking(False)
+                self._selector.register(connection, selectors.EVENT_READ)
+                self._partials[connection] = b''
+                continue
+            connection = key.fileobj
+            try:
+                data = connection.recv(self.READ_SIZE)
+            except BlockingIOError:
+                continue
+            except OSError: # Reset by the client
+                data = b''
+            if data:
+                *complete, self._partials[connection] = (self._partials[connection] + data).split(b'\n')
+                lines.extend(complete)
+            else: # Client closed: its last line needs no trailing newline
+                lines.append(self._partials.pop(connection))
+                self._selector.unregister(connection)
+                connection.close()
+        log_events = line_events(lines, self._ids)
+        return [(self.log_group, self.log_stream, log_events)] if log_events else []
+
+    def close(self):
+        for connection in list(self._partials):
+            connection.close()
+        self._selector.close()
+        self._server.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class KinesisSource:
+    """
+    Reads every shard of a Kinesis stream with GetRecords.
+    - Records holding CloudWatch Logs subscription data (gzip JSON) keep their log group, log stream and events;
+      other records are read as newline-delimited log messages of `log_stream`.
+    - The client comes from metric_processor.get_client('kinesis'): AWS, a Kinesis-compatible endpoint
+      (AWS_ENDPOINT_URL_KINESIS) or, with AWS_CLIENT_BACKEND=local, the in-process FakeKinesis.
+    - Shards closed by resharding are dropped; their child shards are not followed.
+    """
+
+    def __init__(self, stream_name, client, log_group, log_stream, poll_interval, iterator_type='LATEST'):
+        self.stream_name = stream_name
+        self.log_group = log_group
+        self.log_stream = log_stream
+        self.poll_interval = poll_interval
+        self.iterator_type = iterator_type
+        self._client = client
+        self._iterators = {}
+        self._sequence_numbers = {} # Shard id -> last record read (to resume after an expired iterator)
+        self._next_read = 0.0
+        for shard in client.list_shards(StreamName=stream_name)['Shards']:
+            self._iterators[shard['ShardId']] = self._shard_iterator(shard['ShardId'])
+
+    def _shard_iterator(self, shard_id):
+        sequence_number = self._sequence_numbers.get(shard_id)
+        if sequence_number is None:
+            return self._client.get_shard_iterator(StreamName=self.stream_name, ShardId=shard_id, ShardIteratorType=self.iterator_type)['ShardIterator']
+        return self._client.get_shard_iterator(StreamName=self.stream_name, ShardId=shard_id, ShardIteratorType='AFTER_SEQUENCE_NUMBER', StartingSequenceNumber=sequence_number)['ShardIterator']
+
+    def poll(self, timeout):
+        wait = self._next_read - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return []
+        if wait > 0:
+            time.sleep(wait)
+        batches = []
+        behind = False
+        for shard_id, iterator in list(self._iterators.items()):
+            try:
+                response = self._client.get_records(ShardIterator=iterator, Limit=10000)
+            except Exception as e:
+                metric_processor.log_warning(f"Kinesis GetRecords failed: {e}", shard=shard_id)
+                if 'ExpiredIterator' in str(e):
+                    self._iterators[shard_id] = self._shard_iterator(shard_id)
+                continue
+            if response.get('NextShardIterator'):
+                self._iterators[shard_id] = response['NextShardIterator']
+            else: # Shard closed
+                del self._iterators[shard_id]
+            for record in response['Records']:
+                batches.extend(self._decode(record))
+                self._sequence_numbers[shard_id] = record['SequenceNumber']
+            behind = behind or bool(response.get('MillisBehindLatest'))
+        self._next_read = time.monotonic() + (KINESIS_MIN_READ_INTERVAL if behind else self.poll_interval)
+        return batches
+
+    def _decode(self, record):
+        data = record['Data']
+        if data[:2] == GZIP_MAGIC: # CloudWatch Logs subscription record
+            try:
+                payload = metric_processor.json_loads(gzip.decompress(data))
+            except Exception as e:
+                metric_processor.log_warning(f"Undecodable Kinesis record skipped: {e}", sequence_number=record['SequenceNumber'])
+                return []
+            if payload.get('messageType') != 'DATA_MESSAGE': # CONTROL_MESSAGE sent when the subscription is created
+                return []
+            return [(payload.get('logGroup'), payload.get('logStream'), payload.get('logEvents', []))]
+        lines = data.split(b'\n')
+        log_events = line_events(lines, (f"{record['SequenceNumber']}-{index}" for index in range(len(lines))))
+        return [(self.log_group, self.log_stream, log_events)] if log_events else []
+
+    def close(self):
+        pass
+
+
+def open_source(spec, from_start=False):
+    """
+    Creates a source from a spec string: 'file:<path>', 'unix:<socket path>' or 'kinesis:<stream name>'.
+    """
+    kind, _, location = spec.partition(':')
+    log_group = metric_processor.LOG_GROUP_NAME
+    if kind == 'file':
+        return FileTailSource(location, log_group, DAEMON_LOG_STREAM, DAEMON_POLL_INTERVAL_SECONDS, from_start)
+    if kind == 'unix':
+        return UnixSocketSource(location, log_group, DAEMON_LOG_STREAM)
+    if kind == 'kinesis':
+        iterator_type = 'TRIM_HORIZON' if from_start else DAEMON_KINESIS_ITERATOR
+        return KinesisSource(location, metric_processor.get_client('kinesis'), log_group, DAEMON_LOG_STREAM, DAEMON_POLL_INTERVAL_SECONDS, iterator_type)
+    raise ValueError(f"Unknown daemon source '{spec}' (expected file:<path>, unix:<socket path> or kinesis:<stream name>)")
+
+
+# --- Consumer Loop ---
+class MetricDaemon:
+    """
+    Polls a source, batches its events and runs each batch through metric_processor.handle_event.
+    """
+
+    def __init__(self, source, batcher, batch_timeout=DAEMON_BATCH_TIMEOUT_SECONDS, max_inflight=DAEMON_MAX_INFLIGHT_BATCHES):
+        self.source = source
+        self.batcher = batcher
+        self.batch_timeout = batch_timeout
+        self.max_inflight = max(1, max_inflight)
+        self.batches = 0
+        self.events = 0
+        self._stop = threading.Event()
+
+    def stop(self, *_):
+        """
+        Stops the loop after the current poll (usable as a signal handler).
+        """
+        self._stop.set()
+
+    def run(self):
+        """
+        Runs until stop() on a new event loop; see run_async().
+        """
+        asyncio.run(self.run_async())
+
+    async def run_async(self):
+        """
+        Runs until stop(); pending batches and their alarm actions finish and the source is closed before returning.
+        """
+        loop = asyncio.get_running_loop()
+        inflight = set()
+        try:
+            while not self._stop.is_set():
+                wait = self.batcher.wait_time()
+                polled = await loop.run_in_executor(None, self.source.poll, IDLE_POLL_SECONDS if wait is None else min(wait, IDLE_POLL_SECONDS))
+                for log_group, log_stream, log_events in polled:
+                    self.batcher.add(log_group, log_stream, log_events)
+                for payload in self.batcher.take_due():
+                    if len(inflight) >= self.max_inflight: # Back-pressure: slow alarm actions throttle ingestion
+                        _, inflight = await asyncio.wait(inflight, return_when=asyncio.FIRST_COMPLETED)
+                    inflight.add(asyncio.create_task(self.process(payload)))
+        finally:
+            for payload in self.batcher.take_due(force=True):
+                inflight.add(asyncio.create_task(self.process(payload)))
+            if inflight:
+                await asyncio.wait(inflight)
+            self.source.close()
+
+    async def process(self, payload):
+        response = await metric_processor.handle_event(payload, BatchContext(self.batch_timeout), checkpoint=False) # Batches are never retried, and file offsets / socket ids repeat
+        self.batches += 1
+        self.events += len(payload['logEvents'])
+        if response.get('statusCode') != 200:
+            metric_processor.log_error("Batch processing failed", log_stream=payload['logStream'], events=len(payload['logEvents']), status=response.get('statusCode'), body=response.get('body'))
+            metric_processor.flush_logs()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', default=DAEMON_SOURCE, help='file:<path>, unix:<socket path> or kinesis:<stream name> (default: DAEMON_SOURCE)')
+    parser.add_argument('--from-start', action='store_true', help='Read the existing file content / the Kinesis stream from its trim horizon')
+    args = parser.parse_args()
+
+    daemon = MetricDaemon(open_source(args.source, args.from_start), EventBatcher(DAEMON_BATCH_MAX_EVENTS, DAEMON_BATCH_MAX_SECONDS))
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    metric_processor.log_info("Metric daemon started", source=args.source, batch_max_events=DAEMON_BATCH_MAX_EVENTS, batch_max_seconds=DAEMON_BATCH_MAX_SECONDS)
+    metric_processor.flush_logs()
+    daemon.run()
+    metric_processor.log_info("Metric daemon stopped", batches=daemon.batches, events=daemon.events)
+    metric_processor.flush_logs(summarize=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,33 @@
-import boto3
 import os
 import json
+import asyncio
 import base64
-import gzip
+import codecs
+import collections
+import contextlib
+import contextvars
+import functools
+import itertools
+import math
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+import zlib
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+import anomaly_detector
+import event_outcomes
+import extractors
+import json_backend
+import quantile_sketch
+import rule_engine
+import sliding_window
+import state_store
 
 # --- Environment Variable Configuration (Set in Lambda Environment Settings) ---
 ALARM_THRESHOLD_CPU = float(os.environ.get('ALARM_THRESHOLD_CPU', 80))  # CPU Utilization Alarm Threshold (%)
@@ -10,168 +35,1543 @@ RECOVERY_SCRIPT_PATH = os.environ.get('RECOVERY_SCRIPT_PATH', '/opt/restart_serv
 SNS_TOPIC_ARN = os.environ.get('SNS_TOPIC_ARN') # SNS Topic ARN for notifications
 LOG_GROUP_NAME = os.environ.get('LOG_GROUP_NAME', 'ServerMetricsLogGroup') # CloudWatch Log Group Name (configurable)
 METRIC_NAME_TO_MONITOR = os.environ.get('METRIC_NAME_TO_MONITOR', 'CPUUtilization') # Metric Name to Monitor (configurable)
+METRIC_NAMES_TO_MONITOR = [name.strip() for name in os.environ.get('METRIC_NAMES_TO_MONITOR', METRIC_NAME_TO_MONITOR).split(',') if name.strip()] # Metric Names to Monitor, comma-separated (all extracted in one pass)
+ALARM_THRESHOLDS = os.environ.get('ALARM_THRESHOLDS', '') # Per-metric thresholds, e.g. "CPUUtilization=80,MemoryUtilization=85" (default: ALARM_THRESHOLD_CPU)
+GROUP_BY = os.environ.get('GROUP_BY', 'logStream') # Dimension samples are grouped and evaluated by: logStream / logGroup, or a message field such as instance_id or hostname
+ALARM_AGGREGATE = os.environ.get('ALARM_AGGREGATE', 'p95') # Batch aggregate compared against thresholds (count, min, max, mean, last, p50, p95, p99)
+ALARM_RULES = os.environ.get('ALARM_RULES', '') # Declarative alarm rules replacing the thresholds, e.g. "cpu > 90 and mem > 85 for 3m -> restart; disk > 95 -> notify"
+ALARM_RULES_FILE = os.environ.get('ALARM_RULES_FILE', '') # File with more rules (one per line), e.g. /opt/alarm_rules.txt from a Lambda layer
+RULE_METRIC_ALIASES = os.environ.get('RULE_METRIC_ALIASES', 'cpu=CPUUtilization,mem=MemoryUtilization,memory=MemoryUtilization,disk=DiskUtilization') # Short metric names usable in rules
+RULE_STATE_GAP_SECONDS = float(os.environ.get('RULE_STATE_GAP_SECONDS', 300)) # A "for <duration>" condition restarts if no batch confirmed it for this long
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json') # Log message format: json (top-level or nested fields), emf, logfmt or regex
+METRIC_FIELDS = os.environ.get('METRIC_FIELDS', '') # Where each metric is found, e.g. "CPUUtilization=metrics.cpu.util" (JSON path, logfmt key or regex group; default: the metric name)
+JSON_BACKEND = os.environ.get('JSON_BACKEND', 'auto') # JSON decoder for log messages: auto (orjson / simdjson if installed, else stdlib), orjson, simdjson or stdlib
+LOG_PATTERN = os.environ.get('LOG_PATTERN', '') # Regex with named groups for LOG_FORMAT=regex, e.g. "cpu=(?P<CPUUtilization>[\d.]+)"
+METRIC_UNITS = os.environ.get('METRIC_UNITS', '') # Units shown in alerts, e.g. "Latency=ms" (default: % for *Utilization metrics, none otherwise)
 NOTIFICATION_SUBJECT = os.environ.get('NOTIFICATION_SUBJECT', '[Warning] High Server Metric Alert') # Notification Subject
 NOTIFICATION_MESSAGE_PREFIX = os.environ.get('NOTIFICATION_MESSAGE_PREFIX', 'Server Metric Alert: ') # Notification Message Prefix
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper() # Minimum log level written (DEBUG, INFO, WARNING, ERROR)
+LOG_WARNING_SAMPLES = int(os.environ.get('LOG_WARNING_SAMPLES', 3)) # Per-message warnings of each kind logged in full per invocation; the rest are summarized
+LOG_BUFFER_MAX_LINES = int(os.environ.get('LOG_BUFFER_MAX_LINES', 1000)) # Buffered log lines before an early flush (bounds memory on huge batches)
+ALERT_COOLDOWN_SECONDS = float(os.environ.get('ALERT_COOLDOWN_SECONDS', 300)) # Suppress repeat notifications / restarts for the same (metric, group) within this window (0 disables)
+STATE_STORE = os.environ.get('STATE_STORE', 'memory') # Durable state shared across containers: memory, sqlite:<path> or dynamodb:<table>
+DEAD_LETTER_SINK = os.environ.get('DEAD_LETTER_SINK', '') # Quarantine for log events that fail to parse: file:<path> or sqs:<queue url> (empty: log only)
+CHECKPOINT_TTL_SECONDS = float(os.environ.get('CHECKPOINT_TTL_SECONDS', 0)) # Remember processed events per delivery this long, so a retried delivery skips them (0 disables)
+WINDOW_SAMPLES = int(os.environ.get('WINDOW_SAMPLES', 0)) # N: alarm on the last N samples per (group, metric) across invocations instead of one batch (0 disables)
+WINDOW_MIN_BREACHES = int(os.environ.get('WINDOW_MIN_BREACHES', 0)) or WINDOW_SAMPLES # M: breaching samples within the window needed to alarm (default N)
+WINDOW_SECONDS = float(os.environ.get('WINDOW_SECONDS', 0)) # T: also drop samples older than this before the newest one (0 disables)
+WINDOW_STATE_TTL_SECONDS = float(os.environ.get('WINDOW_STATE_TTL_SECONDS', 3600)) # Windows of series that stop reporting are forgotten after this long
+SKETCH_WINDOW_SECONDS = float(os.environ.get('SKETCH_WINDOW_SECONDS', 0)) # Keep per-series quantile sketches over this many seconds (enables window_p50/p95/p99; 0 disables)
+SKETCH_BUCKET_SECONDS = float(os.environ.get('SKETCH_BUCKET_SECONDS', 60)) # Time resolution of the sketch window
+SKETCH_RELATIVE_ACCURACY = float(os.environ.get('SKETCH_RELATIVE_ACCURACY', 0.01)) # Relative error bound of window quantiles
+ANOMALY_DETECTION = os.environ.get('ANOMALY_DETECTION', 'off') # off (static thresholds), ewma, or hour_of_week (EWMA baseline per hour of the week)
+ANOMALY_SIGMA = float(os.environ.get('ANOMALY_SIGMA', 3)) # Samples more than this many standard deviations above the baseline are anomalous
+ANOMALY_ALPHA = float(os.environ.get('ANOMALY_ALPHA', 0.01)) # EWMA smoothing factor per sample (smaller = longer memory)
+ANOMALY_MIN_SAMPLES = int(os.environ.get('ANOMALY_MIN_SAMPLES', 100)) # Baseline warm-up; static thresholds apply until a series has this many samples
+ANOMALY_MIN_FLAGGED = int(os.environ.get('ANOMALY_MIN_FLAGGED', 3)) # Anomalous samples in a batch needed to alarm
+ANOMALY_MIN_STDDEV = float(os.environ.get('ANOMALY_MIN_STDDEV', 1.0)) # Floor for the baseline deviation, so flat series do not alarm on noise
+ANOMALY_STATE_TTL_SECONDS = float(os.environ.get('ANOMALY_STATE_TTL_SECONDS', 14 * 86400)) # Baselines of series that stop reporting are forgotten after this long
+NOTIFICATION_DIGEST_THRESHOLD = int(os.environ.get('NOTIFICATION_DIGEST_THRESHOLD', 20)) # More alerts than this in one invocation are sent as a single digest message
+NOTIFICATION_MAX_ATTEMPTS = int(os.environ.get('NOTIFICATION_MAX_ATTEMPTS', 3)) # Publish attempts per notification (only failed entries are retried)
+RECOVERY_TIMEOUT_SECONDS = float(os.environ.get('RECOVERY_TIMEOUT_SECONDS', 15)) # Upper bound for one recovery script run
+RECOVERY_MAX_CONCURRENCY = int(os.environ.get('RECOVERY_MAX_CONCURRENCY', 8)) # Recovery scripts run in parallel for multi-host incidents
+RECOVERY_TARGET_TIMEOUTS = os.environ.get('RECOVERY_TARGET_TIMEOUTS', '') # Per-target timeout overrides, e.g. "i-0abc=30,db-1=60" (seconds)
+RECOVERY_OUTPUT_TAIL_LINES = int(os.environ.get('RECOVERY_OUTPUT_TAIL_LINES', 20)) # Last stdout / stderr lines kept per recovery run for the outcome report
+ACTION_DEADLINE_MARGIN_MS = int(os.environ.get('ACTION_DEADLINE_MARGIN_MS', 1000)) # Invocation time kept free after alarm actions for reporting and log flushing
+DEADLINE_BUDGET = os.environ.get('DEADLINE_BUDGET', 'parse=0.5,evaluate=0.1,actions=0.4') # Share of the invocation's time budgeted per phase; a phase finishing late sheds non-essential work
+RECOVERY_MIN_SECONDS = float(os.environ.get('RECOVERY_MIN_SECONDS', 3)) # Recovery runs are deferred to the next invocation rather than started with less time than this
+DEFERRED_ACTION_TTL_SECONDS = float(os.environ.get('DEFERRED_ACTION_TTL_SECONDS', 900)) # How long deferred notifications / recoveries wait for a later invocation to retry them
+AWS_CLIENT_BACKEND = os.environ.get('AWS_CLIENT_BACKEND', 'boto3') # 'boto3' for real AWS, 'local' for the in-process stand-ins in aws_fakes.py (load testing)
+AWS_IO_MAX_CONCURRENCY = int(os.environ.get('AWS_IO_MAX_CONCURRENCY', 16)) # AWS API calls in flight at once (threads behind the async client wrappers)
+STAGE_METRICS_ENABLED = os.environ.get('STAGE_METRICS_ENABLED', 'false').lower() == 'true' # Record per-stage timings, return them in the response and emit them as EMF
+STAGE_METRICS_NAMESPACE = os.environ.get('STAGE_METRICS_NAMESPACE', 'ServerMonitoring/MetricProcessor') # CloudWatch namespace of the per-stage EMF metrics
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', 64 * 1024)) # Base64 characters / inflated bytes handled per streaming decode step
+
+def parse_thresholds(spec, metric_names, default_threshold):
+    """
+    Parses a "Name=value,Name=value" spec (thresholds, timeouts) into a dict covering every name in `metric_names`.
+    - Names without an explicit entry use `default_threshold`.
+    """
+    thresholds = {name: default_threshold for name in metric_names}
+    for entry in spec.split(','):
+        if entry.strip():
+            name, _, value = entry.partition('=')
+            thresholds[name.strip()] = float(value)
+    return thresholds
+
+
+def parse_mapping(spec):
+    """
+    Parses a "name=value,name=value" spec (aliases, units) into a dict of strings.
+    """
+    return {name.strip(): value.strip() for name, _, value in (entry.partition('=') for entry in spec.split(',')) if name.strip()}
+
+METRIC_THRESHOLDS = parse_thresholds(ALARM_THRESHOLDS, METRIC_NAMES_TO_MONITOR, ALARM_THRESHOLD_CPU)
+DEADLINE_BUDGET_SHARES = parse_thresholds(DEADLINE_BUDGET, (), 0.0)
+RECOVERY_TIMEOUTS = parse_thresholds(RECOVERY_TARGET_TIMEOUTS, (), RECOVERY_TIMEOUT_SECONDS)
+
+AGGREGATE_NAMES = ('count', 'min', 'max', 'mean', 'last', 'p50', 'p95', 'p99')
+WINDOW_QUANTILES = {'window_p50': 0.50, 'window_p95': 0.95, 'window_p99': 0.99} # Quantiles over SKETCH_WINDOW_SECONDS
+if ALARM_AGGREGATE not in AGGREGATE_NAMES + (tuple(WINDOW_QUANTILES) if SKETCH_WINDOW_SECONDS else ()):
+    raise ValueError(f"ALARM_AGGREGATE must be one of {', '.join(AGGREGATE_NAMES)} (or window_p50/p95/p99 with SKETCH_WINDOW_SECONDS set), got '{ALARM_AGGREGATE}'")
+if ANOMALY_DETECTION not in ('off', 'ewma', 'hour_of_week'):
+    raise ValueError(f"ANOMALY_DETECTION must be off, ewma or hour_of_week, got '{ANOMALY_DETECTION}'")
+if WINDOW_SAMPLES and not 0 < WINDOW_MIN_BREACHES <= WINDOW_SAMPLES:
+    raise ValueError(f"WINDOW_MIN_BREACHES must be between 1 and WINDOW_SAMPLES ({WINDOW_SAMPLES}), got {WINDOW_MIN_BREACHES}")
+METRIC_UNIT_OVERRIDES = parse_mapping(METRIC_UNITS)
+
+
+def load_alarm_rules():
+    """
+    Compiles ALARM_RULES and ALARM_RULES_FILE once at cold start; returns None if no rules are configured.
+    - Syntax errors fail the cold start (rule_engine.RuleSyntaxError names the offending rule).
+    """
+    text = ALARM_RULES
+    if ALARM_RULES_FILE:
+        with open(ALARM_RULES_FILE) as rules_file:
+            text += '\n' + rules_file.read()
+    if not text.strip():
+        return None
+    aggregate_names = AGGREGATE_NAMES + (tuple(WINDOW_QUANTILES) if SKETCH_WINDOW_SECONDS else ())
+    return rule_engine.compile_rules(text, parse_mapping(RULE_METRIC_ALIASES), ALARM_AGGREGATE, aggregate_names)
+
+ALARM_RULE_SET = load_alarm_rules()
+if ALARM_RULE_SET is not None: # Metrics used by rules are extracted along with the monitored ones
+    METRIC_NAMES_TO_MONITOR += [name for name in ALARM_RULE_SET.metric_names if name not in METRIC_NAMES_TO_MONITOR]
+    for metric_name in METRIC_NAMES_TO_MONITOR:
+        METRIC_THRESHOLDS.setdefault(metric_name, ALARM_THRESHOLD_CPU)
+JSON_BACKEND_NAME, json_loads = json_backend.select_backend(JSON_BACKEND)
+LOG_EXTRACTOR = extractors.compile_extractor(LOG_FORMAT, METRIC_NAMES_TO_MONITOR, parse_mapping(METRIC_FIELDS), GROUP_BY, LOG_PATTERN, loads=json_loads) # Compiled once per container
+
+# --- AWS Clients (created lazily on first use, then cached for the container's lifetime) ---
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(service_name):
+    """
+    Returns the AWS client for `service_name` ('sns', 'cloudwatch', 'logs', ...), creating it on first use.
+    - boto3 is imported here, so cold starts and invocations that never raise an alarm skip loading botocore service models.
+    - With AWS_CLIENT_BACKEND=local, in-process fakes (aws_fakes.py) are created instead of boto3 clients.
+    """
+    client = _clients.get(service_name)
+    if client is None:
+        with _clients_lock: # Clients may be requested from worker threads
+            client = _clients.get(service_name)
+            if client is None:
+                if AWS_CLIENT_BACKEND == 'local':
+                    import aws_fakes
+                    client = aws_fakes.create_fake_client(service_name)
+                else:
+                    import boto3
+                    client = boto3.client(service_name)
+                _clients[service_name] = client
+    return client
+
+
+def set_client(service_name, client):
+    """
+    Replaces the client used for `service_name` (e.g. with an aws_fakes stand-in for load tests).
+    """
+    with _clients_lock:
+        _clients[service_name] = client
+
+
+def reset_clients():
+    """
+    Drops all cached clients; they are recreated on next use.
+    """
+    with _clients_lock:
+        _clients.clear()
+
+
+class AsyncClient:
+    """
+    Asyncio view of an AWS client: every API method is a coroutine function (e.g. `await client.publish_batch(...)`).
+    - boto3 and aws_fakes clients are blocking but thread-safe, so calls run on a shared pool of AWS_IO_MAX_CONCURRENCY
+      threads and many of them can be in flight while the event loop keeps running.
+    - The client is looked up with get_client() on every call, so set_client() / reset_clients() apply here as well.
+    """
+
+    def __init__(self, service_name):
+        self.service_name = service_name
+
+    def __getattr__(self, operation):
+        async def call(**params):
+            return await asyncio.get_running_loop().run_in_executor(get_io_executor(), lambda: getattr(get_client(self.service_name), operation)(**params))
+        call.__name__ = operation
+        return call
+
+
+_io_executor = None
+
+
+def get_io_executor():
+    """
+    Returns the thread pool running blocking AWS calls for AsyncClient (created on first use).
+    """
+    global _io_executor
+    if _io_executor is None:
+        with _clients_lock:
+            if _io_executor is None:
+                _io_executor = ThreadPoolExecutor(max_workers=max(1, AWS_IO_MAX_CONCURRENCY), thread_name_prefix='aws-io')
+    return _io_executor
+
+
+def get_async_client(service_name):
+    """
+    Returns the AsyncClient for an AWS service (cheap: the underlying client is created lazily by get_client).
+    """
+    return AsyncClient(service_name)
 
-# --- Initialize AWS Clients ---
-cloudwatch = boto3.client('cloudwatch')
-sns = boto3.client('sns')
-logs_client = boto3.client('logs') # CloudWatch Logs client for more detailed log retrieval (optional, for future enhancement)
 
 def lambda_handler(event, context):
     """
     Lambda function to process CloudWatch Logs events for server metric monitoring and auto-recovery.
+    - Thin synchronous adapter: runs handle_event() on the container's event loop (kept across warm invocations).
+    - CloudWatch Logs invokes the function asynchronously, so a returned error status counts as success and is never
+      retried. When groups failed to evaluate and CHECKPOINT_TTL_SECONDS is set, PartialFailureError is raised
+      instead (after the checkpoint is saved and the actions of the other groups ran), so Lambda retries the
+      delivery and the retry handles only the failed groups' events.
+    """
+    response = run_coroutine(handle_event(event, context))
+    failed_events = (response.get('events') or {}).get('failed')
+    if failed_events and CHECKPOINT_TTL_SECONDS > 0:
+        raise PartialFailureError(f"{failed_events} log events of groups that failed to evaluate are left for a retry", response)
+    return response
+
+
+class PartialFailureError(RuntimeError):
+    """
+    Raised by lambda_handler so that a partially failed delivery is retried; `response` is the handler's response.
+    """
+
+    def __init__(self, message, response):
+        super().__init__(message)
+        self.response = response
+
+
+_event_loop = None
+
+
+def run_coroutine(coroutine):
+    """
+    Runs a coroutine to completion on the container's event loop (created on first use).
+    - Must not be called from a running event loop; asynchronous callers await handle_event() directly.
     """
-    print("Lambda function started")
-    print("Event:", event)
+    global _event_loop
+    if _event_loop is None or _event_loop.is_closed():
+        _event_loop = asyncio.new_event_loop()
+    return _event_loop.run_until_complete(coroutine)
 
+
+async def handle_event(event, context, checkpoint=True):
+    """
+    Asynchronous processing core: processes one event, then runs its alarm actions concurrently.
+    - `checkpoint=False` turns off the checkpoints of processed events (see process_event).
+    - Extraction and evaluation run one event at a time (concurrent events of long-running consumers such as
+      metric_daemon.py never interleave them). With the memory STATE_STORE they are CPU-bound and run inline on the
+      event loop. With a durable STATE_STORE, evaluation makes blocking store calls (cooldown claims, windows,
+      sketches, baselines, rule state), so process_event runs in a worker thread and alarm actions of earlier
+      events keep progressing meanwhile; AWS calls run on the AWS I/O threads, scripts as subprocesses.
+    - Log lines are buffered for the whole invocation and written once at the end (even on errors).
+    - Per-invocation state (deadline, stage timings, log shedding, per-message warning counts, queued alarm actions)
+      is kept in context variables, so concurrent invocations in one event loop do not share it.
+    - With STAGE_METRICS_ENABLED, per-stage timings are returned in the response body and emitted as EMF.
+    """
+    stage_timings = StageTimings() if STAGE_METRICS_ENABLED else None
+    timings_token = _stage_timings.set(stage_timings)
+    deadline_token = _deadline.set(InvocationDeadline(context, ACTION_DEADLINE_MARGIN_MS / 1000, DEADLINE_BUDGET_SHARES))
+    shedding_token = _log_shedding.set(False)
+    warnings_token = _message_warning_counts.set({})
+    actions_token = _pending_actions.set(([], []))
     try:
-        # --- 1. Decode and Decompress CloudWatch Logs Data ---
-        compressed_payload = base64.b64decode(event['awslogs']['data'])
-        uncompressed_payload = gzip.decompress(compressed_payload)
-        log_data = json.loads(uncompressed_payload)
-
-        log_events = log_data['logEvents']
-        if not log_events:
-            print("No log events received in this batch.")
-            return { 'statusCode': 200, 'body': 'No log events to process' } # Exit gracefully if no logs
+        if get_state_store() is None:
+            response = process_event(event, context, checkpoint)
+        else: # Durable store calls are network / disk I/O: keep them off the event loop
+            evaluation_context = contextvars.copy_context()
+            response = await asyncio.get_running_loop().run_in_executor(None, evaluation_context.run, process_event_serialized, event, context, checkpoint)
+            set_log_shedding(evaluation_context[_log_shedding]) # Load shedding switched on during evaluation applies to the actions too
+        actions = take_alarm_actions()
+        action_report = await dispatch_alarm_actions(actions) # Notifications and recoveries queued by this event (plus deferred ones)
+        if action_report is not None:
+            response['actions'] = action_report
+        if stage_timings is not None:
+            response['body'] = {'message': response['body'], 'stages': stage_timings.as_dict()}
+            for document in stage_timings.emf_documents(STAGE_METRICS_NAMESPACE):
+                log_metric(document)
+        return response
+    finally:
+        flush_logs(summarize=True)
+        _stage_timings.reset(timings_token)
+        _deadline.reset(deadline_token)
+        _log_shedding.reset(shedding_token)
+        _message_warning_counts.reset(warnings_token)
+        _pending_actions.reset(actions_token)
 
-        print(f"Processing {len(log_events)} log events...")
 
-        # --- 2. Extract Metric Value from Log Events ---
-        metric_value = extract_metric_value_from_logs(log_events, METRIC_NAME_TO_MONITOR) # Pass Metric Name
+_evaluation_lock = threading.Lock() # One process_event at a time across worker threads (warm caches are shared)
 
-        if metric_value is not None: # Check if metric value was successfully extracted
-            print(f"Monitored Metric ({METRIC_NAME_TO_MONITOR}) Value: {metric_value}")
 
-            # --- 3. Check Alarm Threshold and Trigger Actions ---
-            if metric_value >= ALARM_THRESHOLD_CPU:
-                print(f"**Alarm Triggered! Metric ({METRIC_NAME_TO_MONITOR}) exceeds threshold ({ALARM_THRESHOLD_CPU}%): {metric_value}%**")
-                trigger_alarm_actions(metric_value)
-            else:
-                print(f"Metric ({METRIC_NAME_TO_MONITOR}) is within normal range.")
+def process_event_serialized(event, context, checkpoint=True):
+    """
+    process_event for worker threads: waits for any other thread's evaluation to finish first.
+    """
+    with _evaluation_lock:
+        return process_event(event, context, checkpoint)
+
+
+def process_event(event, context, checkpoint=True):
+    """
+    Processes one CloudWatch Logs subscription event: decode, extract, evaluate and act.
+    - `event` is the Lambda event ({'awslogs': {'data': ...}}) or an already decoded payload with a `logEvents` list
+      (logGroup, logStream, ...), as built by the long-running consumer in metric_daemon.py.
+    - With `checkpoint=False`, no delivery checkpoint is read or written even if CHECKPOINT_TTL_SECONDS is set: for
+      callers that never retry a batch and whose event ids are not unique across batches (metric_daemon.py).
+    """
+    try:
+        # --- 1. Decode and Decompress CloudWatch Logs Data (streamed, one log event at a time) ---
+        if 'logEvents' in event: # Decoded payload: no base64 / gzip stage
+            log_debug("Batch processing started", events=len(event['logEvents']))
+            envelope = {key: value for key, value in event.items() if key != 'logEvents'}
+            log_events = iter(event['logEvents'])
         else:
-            print(f"Warning: Could not extract metric ({METRIC_NAME_TO_MONITOR}) value from log events.") # Log warning if extraction fails
+            log_debug("Lambda function started", payload_chars=len(event['awslogs']['data']))
+            envelope = {}
+            log_events = iter_log_events(event['awslogs']['data'], envelope)
+        first_event = next(log_events, None)
+        if first_event is None:
+            log_info("No log events received in this batch.")
+            return { 'statusCode': 200, 'body': 'No log events to process' } # Exit gracefully if no logs
+
+        log_info("Processing log events", log_group=envelope.get('logGroup'), log_stream=envelope.get('logStream'))
+        log_events = itertools.chain([first_event], log_events) # Put the peeked event back in front of the stream
+        checkpoint_key = delivery_checkpoint_key(envelope, first_event) if checkpoint else None
+        outcomes = load_event_outcomes(checkpoint_key, envelope) # Per-event outcome tracking (None unless DEAD_LETTER_SINK / CHECKPOINT_TTL_SECONDS is set)
+
+        # --- 2. Extract All Monitored Metrics from Log Events, Grouped by GROUP_BY (single parse pass) ---
+        timestamp_groups = {} if WINDOW_SAMPLES or SKETCH_WINDOW_SECONDS or ANOMALY_DETECTION == 'hour_of_week' else None # Sample timestamps are only needed by the time-based evaluations
+        with stage_timer('extract', nested=STREAM_STAGES):
+            if GROUP_BY in envelope: # Batch-level dimension (logStream / logGroup): one group per batch
+                metric_groups = extract_metric_columns(log_events, METRIC_NAMES_TO_MONITOR, default_group=str(envelope[GROUP_BY]), timestamps=timestamp_groups, extractor=LOG_EXTRACTOR, outcomes=outcomes)
+            else: # Message-level dimension (instance_id, hostname, ...), falling back to the log stream
+                metric_groups = extract_metric_columns(log_events, METRIC_NAMES_TO_MONITOR, group_field=GROUP_BY, default_group=envelope.get('logStream'), timestamps=timestamp_groups, extractor=LOG_EXTRACTOR, outcomes=outcomes)
+
+        if not metric_groups:
+            if outcomes is not None and outcomes.skipped == outcomes.events:
+                log_info("All log events were processed by an earlier delivery attempt", events=outcomes.events)
+            else:
+                log_warning(f"Could not extract metrics ({', '.join(METRIC_NAMES_TO_MONITOR)}) from log events.") # Log warning if extraction fails
+
+        shed_if_behind('parse')
+
+        # --- 3. Check Alarm Thresholds per Group and Trigger Actions (a failing group does not stop the others) ---
+        failed_groups = []
+        with stage_timer('evaluate'):
+            for group, metric_columns in metric_groups.items():
+                try:
+                    evaluate_group(group, metric_columns, timestamp_groups[group] if timestamp_groups is not None else None)
+                except Exception as e:
+                    log_error(f"Evaluation failed for group {group}: {e}", group=group, error_type=type(e).__name__)
+                    failed_groups.append(group)
+        shed_if_behind('evaluate')
+
+        # --- 4. Quarantine Unparseable Events and Checkpoint the Processed Ones ---
+        event_counts = save_event_outcomes(outcomes, checkpoint_key, failed_groups)
 
     except KeyError as e:
-        print(f"**KeyError processing event data:** {e}. Check event structure and environment variables.")
         # More specific error handling for common issues
-        log_error(f"KeyError: {e}. Event data structure issue. Event: {event}")
+        log_error(f"KeyError: {e}. Event data structure issue. Check event structure and environment variables.")
         return { 'statusCode': 400, 'body': f'Error: KeyError - {e}. Check event data structure.' } # Return error status
 
     except json.JSONDecodeError as e:
-        print(f"**JSONDecodeError:** {e}. Could not decode log data. Check CloudWatch Logs data format.")
-        log_error(f"JSONDecodeError: {e}. Could not decode log data. Event: {event}")
+        log_error(f"JSONDecodeError: {e}. Could not decode log data. Check CloudWatch Logs data format.")
         return { 'statusCode': 400, 'body': f'Error: JSONDecodeError - {e}. Check log data format.' } # Return error status
 
     except Exception as e:
-        print(f"**Unexpected error:** {e}")
-        log_error(f"Unexpected error: {e}. Event: {event}") # Log full exception details
+        log_error(f"Unexpected error: {e}", error_type=type(e).__name__) # Log exception details
         return { 'statusCode': 500, 'body': f'Error: Unexpected error - {e}. Check function logs.' } # Return error status
 
-    print("Lambda function finished")
-    return { 'statusCode': 200, 'body': 'CloudWatch Metric Processing Completed' }
+    log_debug("Lambda function finished")
+    if failed_groups:
+        response = { 'statusCode': 500, 'body': 'CloudWatch Metric Processing Partially Failed' } # lambda_handler raises on this (with checkpoints), so the delivery is retried
+    else:
+        response = { 'statusCode': 200, 'body': 'CloudWatch Metric Processing Completed' }
+    if event_counts is not None:
+        response['events'] = event_counts
+    return response
+
+
+# --- Streaming Payload Decoding ---
+_LOG_EVENTS_KEY = re.compile(r'"logEvents"\s*:\s*\[') # Start of the logEvents array in the awslogs payload
+_EVENT_SEPARATORS = re.compile(r'[\s,]*') # Whitespace and commas between array entries
+
+
+def iter_payload_text(encoded_data):
+    """
+    Yields the uncompressed awslogs payload as text chunks.
+    - Base64-decodes and inflates the gzip stream incrementally, so only one chunk of each stage is held at a time.
+    - Each yielded chunk is at most STREAM_CHUNK_SIZE characters (multi-byte UTF-8 sequences are never split).
+    """
+    timings = _stage_timings.get() # Per-stage instrumentation (None when disabled)
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16) # Expect a gzip header and trailer
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    step = max(4, STREAM_CHUNK_SIZE - STREAM_CHUNK_SIZE % 4) # Base64 decodes in 4-character groups
+    for start in range(0, len(encoded_data), step):
+        started = time.perf_counter()
+        compressed = base64.b64decode(encoded_data[start:start + step])
+        if timings is not None:
+            timings.add('decode', time.perf_counter() - started, nbytes=len(compressed))
+        while compressed:
+            started = time.perf_counter()
+            inflated = decompressor.decompress(compressed, STREAM_CHUNK_SIZE)
+            text = text_decoder.decode(inflated)
+            compressed = decompressor.unconsumed_tail # Bound inflated output per step for highly compressible batches
+            if timings is not None:
+                timings.add('decompress', time.perf_counter() - started, nbytes=len(inflated))
+            if text:
+                yield text
+    text = text_decoder.decode(decompressor.flush(), final=True)
+    if text:
+        yield text
 
 
-def extract_metric_value_from_logs(log_events, metric_name):
+def iter_log_events(encoded_data, envelope=None):
     """
-    Extracts the metric value from CloudWatch Logs events.
-    - Assumes log events are in JSON format and contain the metric name as a key.
-    - Adapt this function based on your actual log format.
+    Streams log events out of a base64 + gzip encoded CloudWatch Logs subscription payload.
+    - Yields each entry of `logEvents` as soon as it has been parsed, instead of materializing the whole batch.
+    - The other payload fields (logGroup, logStream, ...) are stored in `envelope` when a dict is passed.
+    - Raises KeyError if the payload has no `logEvents` array and json.JSONDecodeError if it is malformed.
     """
-    for log_event in log_events:
+    decoder = json.JSONDecoder()
+    chunks = iter_payload_text(encoded_data)
+    timings = _stage_timings.get() # Per-stage instrumentation (None when disabled)
+
+    # --- Payload fields before logEvents ---
+    buffer = ''
+    match = None
+    for chunk in chunks:
+        scan_from = max(0, len(buffer) - 16) # Key may straddle two chunks
+        buffer += chunk
+        match = _LOG_EVENTS_KEY.search(buffer, scan_from)
+        if match:
+            break
+    if match is None:
+        payload = json.loads(buffer) # Surfaces JSONDecodeError for malformed payloads
+        raise KeyError('logEvents') if isinstance(payload, dict) else TypeError('Log payload is not a JSON object')
+    header = buffer[:match.start()].rstrip().rstrip(',')
+    if envelope is not None:
+        envelope.update(json.loads(header + '}'))
+
+    # --- logEvents entries, one at a time ---
+    buffer = buffer[match.end():]
+    pos = 0
+    while True:
+        pos = _EVENT_SEPARATORS.match(buffer, pos).end()
+        if pos < len(buffer) and buffer[pos] == ']':
+            break
         try:
-            message_json = json.loads(log_event['message']) # Parse log message as JSON
-            if metric_name in message_json: # Check if metric name exists in JSON
-                metric_value = float(message_json[metric_name]) # Get metric value and convert to float
-                return metric_value
+            if pos == len(buffer):
+                raise json.JSONDecodeError('Unterminated logEvents array', buffer, pos)
+            if timings is None:
+                log_event, pos = decoder.raw_decode(buffer, pos)
             else:
-                print(f"Warning: Metric name '{metric_name}' not found in log message: {log_event['message']}") # Log warning if metric name is missing
+                started = time.perf_counter()
+                log_event, end = decoder.raw_decode(buffer, pos)
+                timings.add('parse', time.perf_counter() - started, events=1, nbytes=end - pos)
+                pos = end
         except json.JSONDecodeError:
-            print(f"Warning: Log message is not in JSON format: {log_event['message']}") # Log warning for non-JSON logs
-        except ValueError:
-            print(f"Warning: Metric value is not a valid number in log message: {log_event['message']}") # Log warning for invalid metric values
+            chunk = next(chunks, None) # Entry may be incomplete; pull more text and retry
+            if chunk is None:
+                raise
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield log_event
+
+    # --- Payload fields after logEvents (if any) ---
+    trailer = (buffer[pos + 1:] + ''.join(chunks)).strip()
+    if trailer.startswith(','):
+        fields = json.loads('{' + trailer[1:])
+        if envelope is not None:
+            envelope.update(fields)
+    elif trailer != '}':
+        raise json.JSONDecodeError('Expecting end of log payload', trailer, 0)
+
+
+@functools.lru_cache(maxsize=None)
+def default_extractor(metric_names):
+    """
+    Returns the top-level JSON extractor for a tuple of metric names (cached, so it is compiled once per container).
+    """
+    return extractors.compile_extractor('json', metric_names, loads=json_loads)
+
+
+def extract_metric_columns(log_events, metric_names, group_field=None, default_group=None, timestamps=None, extractor=None, outcomes=None):
+    """
+    Extracts every monitored metric from CloudWatch Logs events in a single pass, grouped per host / log stream.
+    - Each log message is parsed once by `extractor` (see extractors.py; default: top-level JSON keys) and all
+      configured metric names are read from the same parsed fields.
+    - Samples are grouped by the message's `group_field` value (e.g. instance_id), or `default_group` when it is absent.
+    - Returns a dict of group -> {metric name -> array('d') of float samples (in log event order)}.
+    - Messages rejected by the extractor's prefilter (no metric key in the raw text) are skipped before parsing.
+    - If a `timestamps` dict is passed, it is filled with the same layout holding each sample's log event time (epoch seconds).
+    - If an `outcomes` tracker (event_outcomes.EventOutcomes) is passed, events it already holds as processed are
+      skipped, the group of each event with samples is recorded and unparseable events are quarantined.
+    """
+    groups = {}
+    extractor = extractor or default_extractor(tuple(metric_names))
+    may_contain_metric, parse, parse_errors = extractor.prefilter, extractor.parse, extractor.parse_errors
+    position = -1
+    for position, log_event in enumerate(log_events):
+        if outcomes is not None and outcomes.already_processed(position): # Processed by an earlier attempt of this delivery
+            outcomes.skipped += 1
+            continue
+        try:
+            if may_contain_metric is not None and not may_contain_metric(log_event['message']): # Prefilter: no metric key anywhere in the raw text
+                log_message_warning('missing_metric', log_event['message']) # Counted, summarized at flush
+                continue
+            message_fields = parse(log_event['message']) # Parse log message (once for all metrics)
+            found = False
+            columns = None
+            for metric_name in metric_names:
+                if metric_name in message_fields: # Check if metric name exists in the message
+                    found = True
+                    try:
+                        metric_value = message_fields[metric_name]
+                        if type(metric_value) is list: # EMF: several samples of one metric in a single document
+                            metric_values = array('d', map(float, metric_value))
+                        else:
+                            metric_value = float(metric_value) # Get metric value and convert to float
+                            metric_values = None
+                        if columns is None:
+                            group = str(message_fields.get(group_field) or default_group) if group_field else default_group
+                            columns = groups.get(group)
+                            if columns is None: # First sample for this group: allocate its metric columns
+                                columns = groups[group] = {name: array('d') for name in metric_names}
+                                if timestamps is not None:
+                                    timestamps[group] = {name: array('d') for name in metric_names}
+                            timestamp_columns = timestamps[group] if timestamps is not None else None
+                            if outcomes is not None:
+                                outcomes.add_sample_event(position, group)
+                        if metric_values is None:
+                            columns[metric_name].append(metric_value)
+                        else:
+                            columns[metric_name].extend(metric_values)
+                        if timestamp_columns is not None:
+                            timestamp = log_event.get('timestamp', time.time() * 1000) / 1000
+                            timestamp_columns[metric_name].extend(array('d', [timestamp]) * (1 if metric_values is None else len(metric_values)))
+                    except (TypeError, ValueError):
+                        log_message_warning('invalid_value', log_event['message'], metric=metric_name) # Log warning for invalid metric values
+                        if outcomes is not None:
+                            outcomes.quarantine(position, log_event, 'invalid_value', f'{metric_name}={message_fields[metric_name]!r}')
+            if not found:
+                log_message_warning('missing_metric', log_event['message']) # Log warning if metric names are missing
+        except parse_errors as e:
+            log_message_warning('not_json', log_event['message']) # Log warning for messages not in the configured format (e.g. non-JSON)
+            if outcomes is not None:
+                outcomes.quarantine(position, log_event, 'not_json', str(e))
         except Exception as e:
-            print(f"Warning: Error parsing log message: {log_event['message']} - Error: {e}") # General parsing error logging
+            log_message_warning('parse_error', log_event.get('message'), error=str(e)) # General parsing error logging
+            if outcomes is not None:
+                outcomes.quarantine(position, log_event, 'parse_error', str(e))
 
-    return None # Return None if metric value could not be extracted from any log event
+    if outcomes is not None:
+        outcomes.events = position + 1
+    return groups
 
 
-def trigger_alarm_actions(metric_value):
+def evaluate_group(group, metric_columns, timestamp_columns=None):
     """
-    Triggers alarm actions: send notification and execute recovery script.
+    Evaluates the batch aggregates of one group (host / log stream) against the thresholds.
+    - With WINDOW_SAMPLES set, a metric alarms only if at least WINDOW_MIN_BREACHES of its last WINDOW_SAMPLES
+      samples (across invocations) breached; otherwise the ALARM_AGGREGATE value is compared.
+    - With SKETCH_WINDOW_SECONDS set, window_p50/p95/p99 over that period are added to the batch aggregates.
+    - With ANOMALY_DETECTION set, a metric alarms when ANOMALY_MIN_FLAGGED samples lie ANOMALY_SIGMA deviations above
+      its learned baseline, instead of comparing against the static threshold (used while the baseline warms up).
+    - With alarm rules configured, the rules are evaluated against all of the group's aggregates instead (evaluate_rules).
+    - `timestamp_columns` holds the samples' timestamps, as needed by the time-based evaluations.
+    - Triggers alarm actions for each metric of the group that breaches its threshold.
     """
-    send_notification(metric_value)
-    execute_recovery_script()
+    rule_aggregates = {} if ALARM_RULE_SET is not None else None
+    for metric_name, values in metric_columns.items():
+        aggregates = aggregate_samples(values)
+        if aggregates is None: # No samples of this metric for this group
+            continue
+        if SKETCH_WINDOW_SECONDS:
+            aggregates.update(update_sketch(group, metric_name, timestamp_columns[metric_name], values))
+        metric_value = aggregates[ALARM_AGGREGATE] # Evaluate the whole batch, not just the first sample
+        threshold = METRIC_THRESHOLDS[metric_name]
+        log_info("Monitored metric", metric=metric_name, group=group, aggregate=ALARM_AGGREGATE, value=metric_value, count=aggregates['count'], min=aggregates['min'], max=aggregates['max'], mean=aggregates['mean'])
+        if rule_aggregates is not None:
+            rule_aggregates[metric_name] = aggregates
+            continue
+
+        anomalies = detect_anomalies(group, metric_name, timestamp_columns, values) if ANOMALY_DETECTION != 'off' else None
+        if anomalies is not None and anomalies['baseline'] is not None:
+            threshold = round(anomalies['upper'], 3) # Reported as the threshold in the alarm notification
+            breached = anomalies['high'] >= ANOMALY_MIN_FLAGGED
+            log_debug("Anomaly baseline", metric=metric_name, group=group, **anomalies)
+        elif WINDOW_SAMPLES:
+            window = update_window(group, metric_name, timestamp_columns[metric_name], values, threshold)
+            breached = window.sustained(WINDOW_MIN_BREACHES)
+            log_debug("Sliding window", metric=metric_name, group=group, breaches=window.breaches, samples=window.count)
+        else:
+            breached = metric_value >= threshold
+        if breached:
+            log_warning(f"Alarm Triggered! Metric ({metric_name}) on {group} exceeds threshold ({format_metric_value(metric_name, threshold)}): {format_metric_value(metric_name, metric_value)}", metric=metric_name, group=group)
+            if claim_alert(group, metric_name):
+                trigger_alarm_actions(group, metric_name, metric_value, threshold)
+            else:
+                log_info(f"Alarm actions suppressed: ({metric_name}) on {group} already alerted within {ALERT_COOLDOWN_SECONDS:g}s cooldown", metric=metric_name, group=group)
+        else:
+            log_debug(f"Metric ({metric_name}) on {group} is within normal range.")
+    if rule_aggregates:
+        evaluate_rules(group, rule_aggregates)
 
 
-def send_notification(metric_value):
+def evaluate_rules(group, aggregates_by_metric):
     """
-    Sends notification via SNS Topic.
+    Evaluates every compiled alarm rule against the aggregates of one group in a single call.
+    - Values a rule needs but the batch lacks read as NaN, so their comparisons (negated ones included) are false.
+    - Rules with "for <duration>" match once their condition has held that long (see rule_condition_held).
+    - Triggers the actions of each matching rule, subject to the alert cooldown (keyed by rule).
     """
-    if SNS_TOPIC_ARN:
+    values = dict.fromkeys(ALARM_RULE_SET.references, math.nan)
+    for metric_name, aggregate in ALARM_RULE_SET.references:
+        aggregates = aggregates_by_metric.get(metric_name)
+        if aggregates is not None and aggregates.get(aggregate) is not None:
+            values[(metric_name, aggregate)] = aggregates[aggregate]
+    for rule, matched in zip(ALARM_RULE_SET.rules, ALARM_RULE_SET.evaluate(values)):
+        if rule.duration:
+            matched = rule_condition_held(rule, group, matched)
+        if not matched:
+            continue
+        observed = ', '.join(f"{metric_name}.{aggregate}={format_metric_value(metric_name, values[(metric_name, aggregate)])}" for metric_name, aggregate in rule.references)
+        log_warning(f"Alarm Triggered! Rule '{rule.source}' matched on {group}: {observed}", rule=rule.source, group=group)
+        if not claim_alert(group, f'rule:{rule.source}'):
+            log_info(f"Alarm actions suppressed: rule '{rule.source}' on {group} already alerted within {ALERT_COOLDOWN_SECONDS:g}s cooldown", rule=rule.source, group=group)
+            continue
+        if 'notify' in rule.actions:
+            queue_notification(f"{NOTIFICATION_MESSAGE_PREFIX}Rule '{rule.source}' matched on {group}: {observed}")
+        if 'restart' in rule.actions:
+            queue_recovery(group)
+
+
+def rule_condition_held(rule, group, matched):
+    """
+    Tracks since when the condition of a "for <duration>" rule has held for a group; True once it held long enough.
+    - The start time is kept in the durable STATE_STORE (warm memory without one) and cleared when the condition fails,
+      or expires when no batch confirms the condition for RULE_STATE_GAP_SECONDS.
+    """
+    key = f'rule:{rule.source}:{group}'
+    store = get_state_store() or _warm_state
+    try:
+        since = store.get(key)
+        if not matched:
+            if since is not None:
+                store.put(key, None, 1)
+            return False
+        now = time.time()
+        store.put(key, since or now, RULE_STATE_GAP_SECONDS)
+        return now - (since or now) >= rule.duration
+    except Exception as e:
+        log_error(f"Rule state update failed: {e}", rule=rule.source, group=group)
+        return False
+
+
+def format_metric_value(metric_name, value):
+    """
+    Formats a metric value with its unit (METRIC_UNITS, else % for *Utilization metrics) for log lines and alerts.
+    """
+    unit = METRIC_UNIT_OVERRIDES.get(metric_name, '%' if metric_name.endswith('Utilization') else '')
+    return f"{value:g}{unit}"
+
+
+def aggregate_samples(values):
+    """
+    Reduces a column of metric samples into batch aggregates.
+    - Returns a dict with count, min, max, mean, last, p50, p95 and p99, or None for an empty column.
+    - Sum and last read the array('d') directly; a single sort (run in C) serves min, max and all percentiles.
+    - Percentiles use linear interpolation between closest ranks.
+    """
+    count = len(values)
+    if not count:
+        return None
+    ordered = sorted(values)
+    return {
+        'count': count,
+        'min': ordered[0],
+        'max': ordered[-1],
+        'mean': math.fsum(values) / count,
+        'last': values[-1],
+        'p50': _percentile(ordered, 0.50),
+        'p95': _percentile(ordered, 0.95),
+        'p99': _percentile(ordered, 0.99),
+    }
+
+
+def _percentile(ordered, fraction):
+    """
+    Returns the interpolated percentile of an already sorted sequence.
+    """
+    rank = (len(ordered) - 1) * fraction
+    lower = int(rank)
+    if lower + 1 >= len(ordered):
+        return ordered[lower]
+    return ordered[lower] + (ordered[lower + 1] - ordered[lower]) * (rank - lower)
+
+
+# --- Sliding Window (sustained breaches across invocations) ---
+_window_cache = state_store.MemoryStateStore() # Warm-container windows per (metric, group): (version written to STATE_STORE or None, SampleWindow)
+_WINDOW_WRITER_ID = uuid.uuid4().hex[:12] # Tags the window versions this container writes
+_window_versions = itertools.count()
+
+
+def update_window(group, metric_name, timestamps, values, threshold):
+    """
+    Pushes a batch of samples into the sliding window of (metric, group) and returns the window.
+    - The window lives in warm-container memory; with a durable STATE_STORE it is pushed to with an atomic
+      update(), so consecutive batches of a series are evaluated together even when they land on different
+      instances, and concurrent batches do not drop each other's samples.
+    - Each stored window carries the version that wrote it. If the stored version is the one this container wrote
+      last, the warm window is used as-is; otherwise the ring buffer is restored from the state (no replay).
+    """
+    key = f'window:{metric_name}:{group}'
+    durable_store = get_state_store()
+    if durable_store is not None:
+        version = f'{_WINDOW_WRITER_ID}:{next(_window_versions)}'
+        pushed = []
+
+        def push(state):
+            cached = _window_cache.get(key)
+            if not pushed and state and cached is not None and state.get('v') == cached[0]:
+                window = cached[1] # No other instance wrote since: continue from the warm window
+            else:
+                window = sliding_window.SampleWindow.from_state(state, WINDOW_SAMPLES, WINDOW_SECONDS) # Also on a retried update
+            window.extend(timestamps, values, threshold)
+            pushed[:] = [window]
+            state = window.to_state()
+            state['v'] = version
+            return state
+        try:
+            durable_store.update(key, push, WINDOW_STATE_TTL_SECONDS)
+            window = pushed[0]
+        except Exception as e:
+            log_error(f"Window store update failed, using the local window: {e}", metric=metric_name, group=group)
+            if pushed: # The batch is already in it; the next batch reloads from the store
+                _window_cache.put(key, (None, pushed[0]), WINDOW_STATE_TTL_SECONDS)
+                return pushed[0]
+        else:
+            _window_cache.put(key, (version, window), WINDOW_STATE_TTL_SECONDS)
+            return window
+    cached = _window_cache.get(key)
+    window = cached[1] if cached is not None else sliding_window.SampleWindow(WINDOW_SAMPLES, WINDOW_SECONDS)
+    window.extend(timestamps, values, threshold)
+    _window_cache.put(key, (None, window), WINDOW_STATE_TTL_SECONDS)
+    return window
+
+
+# --- Quantile Sketches (tail metrics over SKETCH_WINDOW_SECONDS) ---
+def update_sketch(group, metric_name, timestamps, values):
+    """
+    Merges a batch of samples into the time-bucketed sketches of (metric, group) and returns the window quantiles.
+    - State per series is {bucket start: DDSketch state}; buckets older than SKETCH_WINDOW_SECONDS are dropped.
+    - The merge is an atomic update() on the durable STATE_STORE (warm memory without one), so batches processed
+      concurrently by different instances are all counted.
+    - Returns window_p50/p95/p99 and window_count; if the store fails, the quantiles cover this batch only.
+    """
+    batch = {}
+    for bucket, bucket_values in _bucket_samples(timestamps, values).items():
+        sketch = quantile_sketch.DDSketch(SKETCH_RELATIVE_ACCURACY)
+        sketch.add_all(bucket_values)
+        batch[bucket] = sketch
+
+    def merge(state):
+        buckets = {int(bucket): quantile_sketch.DDSketch.from_state(sketch_state) for bucket, sketch_state in (state or {}).items()}
+        for bucket, sketch in batch.items():
+            buckets[bucket] = buckets[bucket].merge(sketch) if bucket in buckets else sketch
+        oldest = max(buckets) - SKETCH_WINDOW_SECONDS + SKETCH_BUCKET_SECONDS
+        return {str(bucket): sketch.to_state() for bucket, sketch in buckets.items() if bucket >= oldest}
+
+    key = f'sketch:{metric_name}:{group}'
+    try:
+        state = (get_state_store() or _warm_state).update(key, merge, SKETCH_WINDOW_SECONDS + SKETCH_BUCKET_SECONDS)
+    except Exception as e:
+        log_error(f"Sketch store update failed, using this batch only: {e}", metric=metric_name, group=group)
+        state = merge(None)
+    window = quantile_sketch.DDSketch(SKETCH_RELATIVE_ACCURACY)
+    for sketch_state in state.values():
+        window.merge(quantile_sketch.DDSketch.from_state(sketch_state))
+    quantiles = {name: window.quantile(fraction) for name, fraction in WINDOW_QUANTILES.items()}
+    quantiles['window_count'] = window.count
+    return quantiles
+
+
+def _bucket_samples(timestamps, values):
+    """
+    Splits a column of samples into SKETCH_BUCKET_SECONDS time buckets (a batch usually spans one or two).
+    """
+    buckets = {}
+    for timestamp, value in zip(timestamps, values):
+        bucket = int(timestamp // SKETCH_BUCKET_SECONDS * SKETCH_BUCKET_SECONDS)
+        column = buckets.get(bucket)
+        if column is None:
+            column = buckets[bucket] = array('d')
+        column.append(value)
+    return buckets
+
+
+# --- Anomaly Detection (EWMA baselines, optionally per hour of the week) ---
+def detect_anomalies(group, metric_name, timestamp_columns, values):
+    """
+    Flags the batch's samples against the baseline of (metric, group), then folds the batch into the baseline.
+    - The baseline is updated atomically in the durable STATE_STORE (warm memory without one).
+    - Returns the counts of low / high anomalous samples and the bounds used, with baseline None while the series
+      (or, for hour_of_week, both its slot and its global baseline) has fewer than ANOMALY_MIN_SAMPLES samples.
+    """
+    seasonal = ANOMALY_DETECTION == 'hour_of_week'
+    slots = anomaly_detector.split_by_hour_of_week(timestamp_columns[metric_name], values) if seasonal else {None: values}
+    result = {}
+
+    def update(state):
+        detector = anomaly_detector.SeasonalBaseline(ANOMALY_ALPHA, seasonal, state)
+        result.update(baseline=None, low=0, high=0, lower=None, upper=None) # Recomputed if the update is retried
+        for slot, slot_values in slots.items():
+            baseline = detector.baseline_for(slot, ANOMALY_MIN_SAMPLES)
+            if baseline is not None:
+                low, high, lower, upper = anomaly_detector.flag_samples(sorted(slot_values), baseline.mean, baseline.stddev(ANOMALY_MIN_STDDEV), ANOMALY_SIGMA)
+                result.update(
+                    baseline=baseline.mean, low=result['low'] + low, high=result['high'] + high,
+                    lower=lower if result['lower'] is None else min(lower, result['lower']),
+                    upper=upper if result['upper'] is None else max(upper, result['upper']),
+                )
+            detector.update(slot, slot_values)
+        return detector.to_state()
+
+    key = f'baseline:{metric_name}:{group}'
+    try:
+        (get_state_store() or _warm_state).update(key, update, ANOMALY_STATE_TTL_SECONDS)
+    except Exception as e:
+        log_error(f"Baseline store update failed, using static thresholds: {e}", metric=metric_name, group=group)
+        return None
+    return result
+
+
+# --- Alert Cooldown / Deduplication ---
+_warm_state = state_store.MemoryStateStore() # Warm-container layer, checked before the durable store
+_durable_store = None
+
+
+def get_state_store():
+    """
+    Returns the durable state store configured by STATE_STORE (created on first use), or None for memory-only.
+    """
+    global _durable_store
+    if _durable_store is None and STATE_STORE != 'memory':
+        _durable_store = state_store.open_state_store(STATE_STORE, get_client)
+    return _durable_store
+
+
+def claim_alert(group, metric_name):
+    """
+    Claims the alert for (metric, group) for ALERT_COOLDOWN_SECONDS.
+    - Returns False if the same alert already fired within the cooldown, in this container or (with a
+      durable STATE_STORE) in any other instance; alarm actions should then be skipped.
+    """
+    if ALERT_COOLDOWN_SECONDS <= 0:
+        return True
+    key = f'cooldown:{metric_name}:{group}'
+    if not _warm_state.claim(key, ALERT_COOLDOWN_SECONDS):
+        return False
+    durable_store = get_state_store()
+    if durable_store is not None:
         try:
-            subject = NOTIFICATION_SUBJECT  # Use configurable notification subject
-            message = f"{NOTIFICATION_MESSAGE_PREFIX}{METRIC_NAME_TO_MONITOR} exceeds threshold ({ALARM_THRESHOLD_CPU}%): {metric_value}%" # Use configurable prefix and metric name
-            response = sns.publish(
-                TopicArn=SNS_TOPIC_ARN,
-                Subject=subject,
-                Message=message,
-            )
-            print("SNS notification sent successfully:", response)
-            log_info(f"SNS notification sent. Subject: '{subject}', Message: '{message}'") # Log notification details
+            return durable_store.claim(key, ALERT_COOLDOWN_SECONDS)
         except Exception as e:
-            print("SNS notification sending failed:", e)
-            log_error(f"SNS notification sending failed: {e}") # Log SNS sending errors
+            log_error(f"Cooldown store claim failed, alerting anyway: {e}", metric=metric_name, group=group) # Prefer a duplicate alert over a missed one
+    return True
+
+
+def trigger_alarm_actions(group, metric_name, metric_value, threshold):
+    """
+    Triggers alarm actions for one group: queues a notification and a recovery script run against it.
+    - The queued actions are executed concurrently by dispatch_alarm_actions() at the end of the invocation.
+    """
+    send_notification(group, metric_name, metric_value, threshold)
+    queue_recovery(group)
+
+
+def queue_recovery(group):
+    """
+    Queues a recovery script run against `group`, once per group even if several of its metrics / rules matched.
+    """
+    targets = pending_actions()[1]
+    if group not in targets:
+        targets.append(group)
+
+
+# --- Alarm Action Dispatch (notification and recovery run as concurrent tasks under the invocation deadline) ---
+_pending_actions = contextvars.ContextVar('pending_actions', default=None) # (notification messages, recovery targets) queued by the current invocation
+
+
+def pending_actions():
+    """
+    Returns the (messages, targets) lists queued by the current invocation.
+    - handle_event() starts each invocation with empty lists, so concurrent invocations never take each other's
+      actions; outside of it (direct calls, benchmarks) the lists are created on first use per thread / context.
+    """
+    pending = _pending_actions.get()
+    if pending is None:
+        pending = ([], [])
+        _pending_actions.set(pending)
+    return pending
+
+
+def take_alarm_actions():
+    """
+    Returns and clears the notifications and recovery targets queued so far by the current invocation: (messages, targets).
+    """
+    messages, targets = pending_actions()
+    taken = messages[:], targets[:]
+    messages.clear()
+    targets.clear()
+    return taken
+
+
+async def dispatch_alarm_actions(actions=None):
+    """
+    Runs the notification flush and the recovery scripts concurrently and returns a single action report.
+    - `actions` are (messages, targets) from take_alarm_actions(); by default, whatever is queued now.
+    - Actions deferred by an earlier invocation (see defer_actions) are picked up first.
+    - Both are bounded by the invocation deadline, so recovery latency is that of the slowest action, not the sum.
+    - Actions still running at the deadline are cancelled: running scripts are killed and reported as timed out,
+      and recoveries / notifications not yet started are deferred to the next invocation (see defer_actions).
+    - Returns None if no actions were queued.
+    """
+    messages, targets = actions if actions is not None else take_alarm_actions()
+    deferred = take_deferred_actions() if get_state_store() is None else await asyncio.to_thread(take_deferred_actions) # Durable stores are network / disk I/O
+    messages = deferred['notifications'] + messages
+    targets = list(dict.fromkeys(deferred['recoveries'] + targets)) # Deferred first, without duplicates
+    if not targets and not messages:
+        return None
+
+    shed_if_behind('evaluate')
+    invocation_deadline = _deadline.get()
+    deadline = invocation_deadline.remaining() if invocation_deadline is not None else None
+    started = time.perf_counter()
+    tasks = {
+        'notifications': asyncio.create_task(flush_notifications(messages)),
+        'recoveries': asyncio.create_task(run_recovery_scripts(targets)),
+    }
+    done, overran = await asyncio.wait(tasks.values(), timeout=deadline)
+    for task in overran:
+        task.cancel()
+    if overran:
+        await asyncio.wait(overran) # Let cancelled tasks clean up (kill their scripts) before the handler returns
+
+    report = {'deadline_s': deadline, 'resumed': len(deferred['notifications']) + len(deferred['recoveries'])}
+    for name, task in tasks.items():
+        if task in overran:
+            log_error(f"Alarm action '{name}' did not finish before the invocation deadline", deadline_s=deadline)
+        if task.cancelled():
+            report[name] = {'status': 'timed_out'}
+        elif task.exception() is not None:
+            report[name] = {'status': 'error', 'error': str(task.exception())}
+            log_error(f"Alarm action '{name}' failed: {task.exception()}")
+        else:
+            report[name] = task.result() # Also when cut off at the deadline: the summary covers what ran and what was deferred
+    report['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    log_info("Alarm actions dispatched", **report)
+    return report
+
+
+# --- Deadline-Aware Scheduling (time budget from the Lambda context, load shedding, deferred actions) ---
+_deadline = contextvars.ContextVar('deadline', default=None) # InvocationDeadline of the current invocation (per asyncio task)
+DEFERRED_ACTIONS_KEY = 'deferred-actions'
+
+
+class InvocationDeadline:
+    """
+    Time budget of one invocation, derived from context.get_remaining_time_in_millis().
+    - `margin` seconds are kept free at the end; the rest is split across phases by `shares` (DEADLINE_BUDGET).
+    - Without a Lambda context (local runs) there is no deadline: remaining() is None and nothing is ever behind.
+    """
+
+    def __init__(self, context, margin, shares):
+        self.started = time.monotonic()
+        self.end = None
+        self.phase_ends = {}
+        get_remaining = getattr(context, 'get_remaining_time_in_millis', None)
+        if get_remaining is not None:
+            available = max(0.0, get_remaining() / 1000 - margin)
+            self.end = self.started + available
+            total_share = sum(shares.values()) or 1.0
+            elapsed_share = 0.0
+            for phase, share in shares.items(): # Phases run in order; each ends at its cumulative share
+                elapsed_share += share
+                self.phase_ends[phase] = self.started + available * elapsed_share / total_share
+
+    def remaining(self):
+        """
+        Seconds left before the deadline, or None without a deadline.
+        """
+        return None if self.end is None else max(0.0, self.end - time.monotonic())
+
+    def behind(self, phase):
+        """
+        True if the phase's share of the budget is already used up.
+        """
+        phase_end = self.phase_ends.get(phase)
+        return phase_end is not None and time.monotonic() > phase_end
+
+
+def shed_if_behind(phase):
+    """
+    Switches to load-shedding mode if `phase` ran past its budget: verbose logging is dropped and
+    notifications are sent as one short digest without retries for the rest of the invocation.
+    """
+    deadline = _deadline.get()
+    if deadline is not None and not _log_shedding.get() and deadline.behind(phase):
+        log_warning(f"Invocation is behind its time budget after '{phase}', shedding non-essential work", remaining_s=deadline.remaining())
+        set_log_shedding(True)
+
+
+def defer_actions(notifications=(), recoveries=()):
+    """
+    Stores notifications / recovery targets that could not run in time, for the next invocation to retry.
+    - Uses the durable STATE_STORE when configured (any instance can resume them), else warm-container memory.
+    - Appended with an atomic update(), so concurrent deferrals from different instances are all kept.
+    """
+    if not notifications and not recoveries:
+        return
+
+    def append(pending):
+        pending = pending or {'notifications': [], 'recoveries': []}
+        return {
+            'notifications': pending['notifications'] + list(notifications),
+            'recoveries': pending['recoveries'] + [target for target in recoveries if target not in pending['recoveries']],
+        }
+    try:
+        (get_state_store() or _warm_state).update(DEFERRED_ACTIONS_KEY, append, DEFERRED_ACTION_TTL_SECONDS)
+        log_warning("Alarm actions deferred to the next invocation", notifications=len(notifications), recoveries=list(recoveries))
+    except Exception as e:
+        log_error(f"Could not defer alarm actions: {e}", notifications=len(notifications), recoveries=list(recoveries))
+
+
+def take_deferred_actions():
+    """
+    Returns and clears the actions deferred by earlier invocations.
+    - The take is an atomic swap to empty, so concurrent invocations never resume the same deferred action twice.
+    - A plain read comes first, so invocations with nothing deferred do not write to the store.
+    """
+    store = get_state_store() or _warm_state
+    taken = {}
+
+    def swap(pending):
+        taken.clear()
+        taken.update(pending or {})
+        return None
+    try:
+        if store.get(DEFERRED_ACTIONS_KEY):
+            store.update(DEFERRED_ACTIONS_KEY, swap, 1)
+            if taken:
+                return taken
+    except Exception as e:
+        log_error(f"Could not read deferred alarm actions: {e}")
+    return {'notifications': [], 'recoveries': []}
+
+
+# --- Event Outcomes (dead-letter quarantine and checkpoints of processed events per delivery) ---
+_dead_letter_sink = None
+
+
+def get_dead_letter_sink():
+    """
+    Returns the dead-letter sink configured by DEAD_LETTER_SINK (created on first use), or None if unset.
+    """
+    global _dead_letter_sink
+    if _dead_letter_sink is None and DEAD_LETTER_SINK:
+        _dead_letter_sink = event_outcomes.open_dead_letter_sink(DEAD_LETTER_SINK, get_client)
+    return _dead_letter_sink
+
+
+def delivery_checkpoint_key(envelope, first_event):
+    """
+    Identifies one delivery: a retried delivery carries the same log stream and the same log events (event ids).
+    """
+    return f"checkpoint:{envelope.get('logGroup')}:{envelope.get('logStream')}:{first_event.get('id')}"
+
+
+def load_event_outcomes(checkpoint_key, envelope):
+    """
+    Returns the outcome tracker for a delivery, holding the events an earlier attempt already processed.
+    - Returns None (no tracking) unless DEAD_LETTER_SINK or CHECKPOINT_TTL_SECONDS is set; a None checkpoint_key
+      turns checkpoints off for this delivery.
+    """
+    if not DEAD_LETTER_SINK and (CHECKPOINT_TTL_SECONDS <= 0 or checkpoint_key is None):
+        return None
+    processed = None
+    if CHECKPOINT_TTL_SECONDS > 0 and checkpoint_key is not None:
+        try:
+            processed = event_outcomes.decode_bitmap((get_state_store() or _warm_state).get(checkpoint_key))
+        except Exception as e:
+            log_error(f"Could not read the delivery checkpoint, processing all events: {e}", checkpoint=checkpoint_key)
+    outcomes = event_outcomes.EventOutcomes(processed, envelope)
+    if processed:
+        log_info("Resuming a retried delivery", checkpoint=checkpoint_key)
+    return outcomes
+
+
+def save_event_outcomes(outcomes, checkpoint_key, failed_groups=()):
+    """
+    Writes the quarantined events to the dead-letter sink and checkpoints the processed ones; returns the outcome counts.
+    - Events of groups that failed to evaluate stay unprocessed, as do the quarantined events if the dead-letter
+      write failed, so a retried delivery handles exactly those again.
+    """
+    if outcomes is None:
+        return None
+    quarantine_failed = False
+    if outcomes.quarantined and DEAD_LETTER_SINK:
+        try:
+            get_dead_letter_sink().write(outcomes.quarantined)
+            log_warning("Log events quarantined", count=len(outcomes.quarantined), sink=DEAD_LETTER_SINK.partition(':')[0])
+        except Exception as e:
+            quarantine_failed = True
+            log_error(f"Could not write quarantined log events to the dead-letter sink: {e}", count=len(outcomes.quarantined))
+    if CHECKPOINT_TTL_SECONDS > 0 and checkpoint_key is not None:
+        try:
+            bitmap = outcomes.checkpoint_bitmap(failed_groups, quarantine_failed)
+            (get_state_store() or _warm_state).put(checkpoint_key, event_outcomes.encode_bitmap(bitmap), CHECKPOINT_TTL_SECONDS)
+        except Exception as e:
+            log_error(f"Could not checkpoint processed log events: {e}", checkpoint=checkpoint_key)
+    return outcomes.counts(failed_groups)
+
+
+# --- Notifications (queued per invocation, published with SNS PublishBatch) ---
+SNS_PUBLISH_BATCH_SIZE = 10 # PublishBatch accepts at most 10 entries per call
+NOTIFICATION_DIGEST_MAX_LINES = 200 # Alert lines included in a digest message (keeps it well below the 256 KB SNS limit)
+NOTIFICATION_SHED_DIGEST_LINES = 10 # Alert lines included in the digest while shedding load
+NOTIFICATION_MIN_SECONDS = 0.5 # Publish calls are deferred rather than started with less time left than this
+
+
+def send_notification(group, metric_name, metric_value, threshold):
+    """
+    Queues a notification for the SNS Topic; queued notifications are published by flush_notifications().
+    """
+    message = f"{NOTIFICATION_MESSAGE_PREFIX}{metric_name} on {group} exceeds threshold ({format_metric_value(metric_name, threshold)}): {format_metric_value(metric_name, metric_value)}" # Use configurable prefix and metric name
+    queue_notification(message)
+
+
+def queue_notification(message):
+    """
+    Queues a notification message for the SNS Topic.
+    """
+    if SNS_TOPIC_ARN:
+        pending_actions()[0].append(message)
     else:
-        print("SNS_TOPIC_ARN not configured. Skipping notification.")
         log_warning("SNS_TOPIC_ARN not configured, skipping notification.") # Log warning about missing SNS config
 
 
-def execute_recovery_script():
+async def flush_notifications(messages=None):
+    """
+    Publishes notifications (by default: all queued by the current invocation) and returns a report (alerts queued / published / failed, api_calls, digest).
+    - Up to NOTIFICATION_DIGEST_THRESHOLD alerts are sent individually with publish_batch, 10 per call; the calls
+      are made concurrently through the async SNS client.
+    - Above that, they are coalesced into one digest message, so a fleet-wide event costs a single publish.
+    - Failed entries (and throttled calls) are retried up to NOTIFICATION_MAX_ATTEMPTS times; entries the
+      service rejected as sender faults are not retried.
+    - Messages still unsent when retries or the invocation's time run out, or when the flush is cancelled at the
+      invocation deadline, are deferred to the next invocation.
+    - While shedding load, more than one alert is always coalesced into a short digest and not retried.
+    """
+    if messages is None:
+        pending = pending_actions()[0]
+        messages = pending[:]
+        pending.clear()
+    report = {'queued': len(messages), 'published': 0, 'failed': 0, 'deferred': 0, 'api_calls': 0, 'digest': False}
+    if not messages:
+        return report
+
+    deadline = _deadline.get()
+    subject = NOTIFICATION_SUBJECT  # Use configurable notification subject
+    alerts_per_message = 1
+    shedding = _log_shedding.get()
+    max_attempts = 1 if shedding else NOTIFICATION_MAX_ATTEMPTS
+    digest_threshold, digest_lines = (1, NOTIFICATION_SHED_DIGEST_LINES) if shedding else (NOTIFICATION_DIGEST_THRESHOLD, NOTIFICATION_DIGEST_MAX_LINES)
+    if len(messages) > digest_threshold:
+        lines = messages[:digest_lines]
+        if len(messages) > len(lines):
+            lines.append(f"... and {len(messages) - len(lines)} more alerts")
+        messages = ['\n'.join(lines)]
+        subject = f"{NOTIFICATION_SUBJECT} ({report['queued']} alerts)"
+        alerts_per_message = report['queued']
+        report['digest'] = True
+    sns = get_async_client('sns')
+
+    async def publish_entries(pending):
+        """
+        Publishes one batch of up to 10 entries with retries; returns the messages left unsent.
+        - If cancelled, the entries not confirmed yet are returned as unsent (a call already in flight may still
+          deliver them: a duplicate alert is preferred over a missed one).
+        """
+        try:
+            for attempt in range(1, max_attempts + 1):
+                if deadline is not None and deadline.end is not None and deadline.remaining() < NOTIFICATION_MIN_SECONDS:
+                    break # Out of time: defer instead of being cut off mid-call
+                try:
+                    report['api_calls'] += 1
+                    with stage_timer('notify'):
+                        response = await sns.publish_batch(
+                            TopicArn=SNS_TOPIC_ARN,
+                            PublishBatchRequestEntries=[{'Id': entry_id, 'Subject': subject, 'Message': message} for entry_id, message in pending.items()],
+                        )
+                except Exception as e:
+                    log_warning(f"SNS publish_batch failed (attempt {attempt}/{max_attempts}): {e}", entries=len(pending)) # Whole call failed (e.g. throttled)
+                else:
+                    report['published'] += len(response.get('Successful', [])) * alerts_per_message
+                    retryable = {}
+                    for failure in response.get('Failed', []):
+                        if failure.get('SenderFault'):
+                            log_error(f"SNS rejected notification: {failure.get('Code')} {failure.get('Message')}") # Not retryable
+                            report['failed'] += alerts_per_message
+                        else:
+                            retryable[failure['Id']] = pending[failure['Id']]
+                    pending = retryable
+                if not pending:
+                    break
+                if attempt < max_attempts:
+                    await asyncio.sleep(0.05 * 2 ** (attempt - 1)) # Back off before retrying the failed entries only
+        except asyncio.CancelledError: # Invocation deadline
+            pass
+        return list(pending.values())
+
+    batches = [{str(index): message for index, message in enumerate(messages[start:start + SNS_PUBLISH_BATCH_SIZE], start)} for start in range(0, len(messages), SNS_PUBLISH_BATCH_SIZE)]
+    unsent = [message for batch_unsent in await run_to_completion(map(publish_entries, batches)) for message in batch_unsent]
+
+    if unsent:
+        report['deferred'] = len(unsent) * alerts_per_message
+        await asyncio.to_thread(defer_actions, notifications=unsent)
+    if report['failed']:
+        log_error("SNS notification sending failed", **report) # Log SNS sending errors
+    elif report['published']:
+        log_info(f"SNS notifications sent. Subject: '{subject}'", **report) # Log notification details
+    return report
+
+
+# --- Recovery Executor (bounded-concurrency script runs for multi-host incidents) ---
+RECOVERY_STATUSES = ('succeeded', 'failed', 'timed_out', 'skipped', 'error', 'deferred')
+
+
+async def run_recovery_scripts(targets):
+    """
+    Runs the recovery script for every target concurrently, at most RECOVERY_MAX_CONCURRENCY at a time.
+    - Each target gets its own timeout (RECOVERY_TARGET_TIMEOUTS, else RECOVERY_TIMEOUT_SECONDS), capped by the
+      invocation deadline; a target whose turn comes with less than RECOVERY_MIN_SECONDS left is deferred instead.
+    - If cancelled (invocation deadline), running scripts are killed and reported as timed out, and targets still
+      waiting for a slot are deferred.
+    - Returns a summary: per-status counts, elapsed_ms and the per-target outcomes.
+    """
+    deadline = _deadline.get()
+    started = time.perf_counter()
+    slots = asyncio.Semaphore(max(1, RECOVERY_MAX_CONCURRENCY))
+
+    async def run_target(target):
+        try:
+            await slots.acquire()
+        except asyncio.CancelledError: # Never started
+            return {'target': target, 'status': 'deferred', 'return_code': None}
+        try:
+            remaining = deadline.remaining() if deadline is not None else None
+            if remaining is not None and remaining < min(RECOVERY_MIN_SECONDS, recovery_timeout(target)):
+                return {'target': target, 'status': 'deferred', 'return_code': None}
+            return await execute_recovery_script(target, recovery_timeout(target, remaining))
+        finally:
+            slots.release()
+
+    results = []
+    if targets:
+        results = await run_to_completion(map(run_target, targets))
+        deferred = [outcome['target'] for outcome in results if outcome['status'] == 'deferred']
+        if deferred:
+            await asyncio.to_thread(defer_actions, recoveries=deferred)
+    summary = {status: 0 for status in RECOVERY_STATUSES}
+    for outcome in results:
+        summary[outcome['status']] += 1
+    summary['targets'] = len(targets)
+    summary['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    summary['results'] = results
+    return summary
+
+
+async def run_to_completion(coroutines):
+    """
+    Runs coroutines concurrently and returns their results in order, like asyncio.gather.
+    - If the caller is cancelled, the coroutines are cancelled too and still awaited, and their results returned:
+      each of them handles its own cancellation and reports what it did not finish (instead of losing it).
+    """
+    tasks = [asyncio.create_task(coroutine) for coroutine in coroutines]
+    if not tasks:
+        return []
+    try:
+        await asyncio.wait(tasks)
+    except asyncio.CancelledError:
+        for task in tasks:
+            task.cancel()
+        await asyncio.wait(tasks)
+    return [task.result() for task in tasks]
+
+
+def recovery_timeout(target, max_timeout=None):
+    """
+    Returns the script timeout for one target.
+    """
+    timeout = RECOVERY_TIMEOUTS.get(str(target), RECOVERY_TIMEOUT_SECONDS)
+    return timeout if max_timeout is None else min(timeout, max_timeout)
+
+
+async def run_streaming(command, timeout, on_line):
+    """
+    Runs `command` with asyncio.create_subprocess_exec, passing each stdout / stderr line to on_line(stream, line)
+    as soon as it is written.
+    - Both pipes are read by tasks on the event loop, so no reader threads are needed and many scripts can run at once.
+    - Returns the exit code; kills the process and raises subprocess.TimeoutExpired after `timeout` seconds.
+    - The process is also killed if the calling task is cancelled (e.g. at the invocation deadline). It runs in its
+      own session, so the whole process group is killed, including commands the script started.
+    """
+    process = await asyncio.create_subprocess_exec(*command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, start_new_session=True)
+    finished = False
+
+    async def read_lines(stream, name):
+        partial = b''
+        while data := await stream.read(65536):
+            *lines, partial = (partial + data).split(b'\n')
+            for line in lines:
+                on_line(name, line.decode(errors='replace'))
+        if partial: # Stream closed
+            on_line(name, partial.decode(errors='replace'))
+
+    tasks = [asyncio.create_task(read_lines(process.stdout, 'stdout')), asyncio.create_task(read_lines(process.stderr, 'stderr')), asyncio.create_task(process.wait())]
+    try:
+        _, running = await asyncio.wait(tasks, timeout=timeout)
+        if running:
+            raise subprocess.TimeoutExpired(command, timeout)
+        finished = True
+        return process.returncode
+    finally:
+        if not finished:
+            with contextlib.suppress(ProcessLookupError):
+                os.killpg(process.pid, signal.SIGKILL)
+            await asyncio.wait(tasks, timeout=1.0) # Reap the process and drain its pipes
+            for task in tasks:
+                task.cancel()
+
+
+async def execute_recovery_script(target, timeout=RECOVERY_TIMEOUT_SECONDS):
     """
-    Executes the recovery script (Bash script example).
+    Executes the recovery script (Bash script example) for one target (host / log stream).
+    - The target is passed to the script as its first argument.
+    - Output lines are logged (DEBUG) as they arrive; the last RECOVERY_OUTPUT_TAIL_LINES are kept in the outcome.
+    - Returns an outcome dict: target, status (succeeded, failed, timed_out, skipped, error), return_code and output tails.
     """
+    outcome = {'target': target, 'status': 'skipped', 'return_code': None}
     if os.path.exists(RECOVERY_SCRIPT_PATH):
+        tails = {'stdout': collections.deque(maxlen=RECOVERY_OUTPUT_TAIL_LINES), 'stderr': collections.deque(maxlen=RECOVERY_OUTPUT_TAIL_LINES)}
+
+        def on_line(stream, line):
+            tails[stream].append(line)
+            log_debug(line, target=target, stream=stream) # Streamed script output
+
         try:
-            print(f"Executing recovery script: {RECOVERY_SCRIPT_PATH}")
-            log_info(f"Executing recovery script: {RECOVERY_SCRIPT_PATH}") # Log recovery script execution start
-            import subprocess
-            result = subprocess.run([RECOVERY_SCRIPT_PATH], capture_output=True, text=True, timeout=15) # Increased timeout to 15s
-            print(f"Recovery script finished (Return Code: {result.returncode})")
-            if result.returncode != 0:
-                error_message = f"Recovery script error (stderr):\n{result.stderr}"
-                print(error_message)
-                log_error(error_message) # Log recovery script errors
+            log_info(f"Executing recovery script: {RECOVERY_SCRIPT_PATH} {target}", timeout_s=timeout) # Log recovery script execution start
+            with stage_timer('recovery'):
+                return_code = await run_streaming([RECOVERY_SCRIPT_PATH, str(target)], timeout, on_line)
+            outcome['return_code'] = return_code
+            if return_code != 0:
+                outcome['status'] = 'failed'
+                log_error("Recovery script error (stderr):\n" + '\n'.join(tails['stderr']), target=target, return_code=return_code) # Log recovery script errors
             else:
-                output_message = f"Recovery script output (stdout):\n{result.stdout}"
-                print(output_message)
-                log_info(output_message) # Log recovery script output
+                outcome['status'] = 'succeeded'
+                log_info("Recovery script output (stdout):\n" + '\n'.join(tails['stdout']), target=target, return_code=return_code) # Log recovery script output
 
         except FileNotFoundError:
-            error_message = f"Error: Recovery script not found at path: {RECOVERY_SCRIPT_PATH}"
-            print(error_message)
-            log_error(error_message) # Log file not found error
+            outcome['status'] = 'error'
+            log_error(f"Recovery script not found at path: {RECOVERY_SCRIPT_PATH}") # Log file not found error
         except subprocess.TimeoutExpired:
-            error_message = "Error: Recovery script execution timed out (15 seconds)"
-            print(error_message)
-            log_error(error_message) # Log timeout error
+            outcome['status'] = 'timed_out'
+            log_error(f"Recovery script execution timed out ({timeout:g} seconds)", target=target) # Log timeout error
+        except asyncio.CancelledError: # Invocation deadline; run_streaming killed the script
+            outcome['status'] = 'timed_out'
+            log_error("Recovery script killed at the invocation deadline", target=target)
         except Exception as e:
-            error_message = f"Error executing recovery script: {e}"
-            print(error_message)
-            log_error(error_message) # Log general recovery script execution errors
+            outcome['status'] = 'error'
+            log_error(f"Error executing recovery script: {e}", target=target) # Log general recovery script execution errors
     else:
-        warning_message = f"Warning: Recovery script path does not exist: {RECOVERY_SCRIPT_PATH}. Skipping recovery."
-        print(warning_message)
-        log_warning(warning_message) # Log warning about missing recovery script
+        log_warning(f"Recovery script path does not exist: {RECOVERY_SCRIPT_PATH}. Skipping recovery.") # Log warning about missing recovery script
+        return outcome
+    outcome['stdout_tail'] = list(tails['stdout'])
+    outcome['stderr_tail'] = list(tails['stderr'])
+    return outcome
 
 
-# --- Logging Helper Functions (Using print for Lambda logs, can be enhanced with proper logging library) ---
-def log_info(message):
-    print(f"INFO: {message}")
+# --- Per-Stage Timing Instrumentation ---
+STREAM_STAGES = ('decode', 'decompress', 'parse') # Stages interleaved with extraction by the streaming decoder
+_stage_timings = contextvars.ContextVar('stage_timings', default=None) # StageTimings of the current invocation (per asyncio task), or None when instrumentation is disabled
 
-def log_warning(message):
-    print(f"WARNING: {message}")
 
-def log_error(message):
-    print(f"ERROR: {message}")
\ No newline at end of file
+class StageTimings:
+    """
+    Wall time and events / bytes processed per handler pipeline stage, for one invocation.
+    """
+
+    def __init__(self):
+        self.stages = {} # Stage -> [seconds, events, bytes]
+
+    def add(self, stage, seconds, events=0, nbytes=0):
+        totals = self.stages.get(stage)
+        if totals is None:
+            totals = self.stages[stage] = [0.0, 0, 0]
+        totals[0] += seconds
+        totals[1] += events
+        totals[2] += nbytes
+
+    def seconds(self, stages):
+        return sum(self.stages[stage][0] for stage in stages if stage in self.stages)
+
+    @contextlib.contextmanager
+    def measure(self, stage, nested=()):
+        """
+        Times a block as `stage`, excluding time recorded for `nested` stages while it ran.
+        """
+        nested_before = self.seconds(nested)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started - (self.seconds(nested) - nested_before))
+
+    def as_dict(self):
+        return {
+            stage: {'ms': round(seconds * 1000, 3), 'events': events, 'bytes': nbytes}
+            for stage, (seconds, events, nbytes) in self.stages.items()
+        }
+
+    def emf_documents(self, namespace):
+        """
+        Yields one CloudWatch Embedded Metric Format document per stage (dimension: Stage).
+        """
+        timestamp = int(time.time() * 1000)
+        for stage, (seconds, events, nbytes) in self.stages.items():
+            yield {
+                '_aws': {
+                    'Timestamp': timestamp,
+                    'CloudWatchMetrics': [{
+                        'Namespace': namespace,
+                        'Dimensions': [['Stage']],
+                        'Metrics': [
+                            {'Name': 'StageDuration', 'Unit': 'Milliseconds'},
+                            {'Name': 'StageEvents', 'Unit': 'Count'},
+                            {'Name': 'StageBytes', 'Unit': 'Bytes'},
+                        ],
+                    }],
+                },
+                'Stage': stage,
+                'StageDuration': seconds * 1000,
+                'StageEvents': events,
+                'StageBytes': nbytes,
+            }
+
+
+def stage_timer(stage, nested=()):
+    """
+    Context manager timing a block as `stage` for the current invocation (a no-op when disabled).
+    """
+    timings = _stage_timings.get()
+    if timings is None:
+        return contextlib.nullcontext()
+    return timings.measure(stage, nested)
+
+
+# --- Structured Logging (JSON lines, buffered per invocation and written with a single stdout write) ---
+_LOG_LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+_log_threshold = _LOG_LEVELS.get(LOG_LEVEL, 20)
+_log_shedding = contextvars.ContextVar('log_shedding', default=False) # Set when the current invocation is behind its time budget: only warnings and errors are kept
+_log_buffer = []
+_message_warning_counts = contextvars.ContextVar('message_warning_counts', default={}) # Warning kind -> number of log messages it applied to in the current invocation (the default dict is shared by calls outside one)
+_MESSAGE_WARNING_SUMMARIES = {
+    'missing_metric': 'log messages did not contain a monitored metric',
+    'not_json': 'log messages were not in JSON format',
+    'invalid_value': 'metric values were not valid numbers',
+    'parse_error': 'log messages could not be parsed',
+}
+LOG_MESSAGE_PREVIEW_CHARS = 256 # Log message text included in sampled warnings
+
+
+def log(level, message, **fields):
+    """
+    Buffers one structured log line if `level` passes LOG_LEVEL.
+    - Extra keyword fields are added to the JSON line as-is.
+    """
+    if _LOG_LEVELS[level] < _log_threshold or (_log_shedding.get() and _LOG_LEVELS[level] < _LOG_LEVELS['WARNING']):
+        return
+    entry = {'level': level, 'message': message}
+    entry.update(fields)
+    _log_buffer.append(json.dumps(entry, default=str))
+    if len(_log_buffer) >= LOG_BUFFER_MAX_LINES:
+        flush_logs()
+
+
+def log_debug(message, **fields):
+    log('DEBUG', message, **fields)
+
+def log_info(message, **fields):
+    log('INFO', message, **fields)
+
+def log_warning(message, **fields):
+    log('WARNING', message, **fields)
+
+def log_error(message, **fields):
+    log('ERROR', message, **fields)
+
+
+def log_message_warning(kind, log_message, **fields):
+    """
+    Rate-limited warning about a single log message.
+    - The first LOG_WARNING_SAMPLES messages of each kind are logged with a preview; the rest are only counted
+      and reported as one summary line when the invocation's logs are flushed.
+    """
+    counts = _message_warning_counts.get()
+    count = counts[kind] = counts.get(kind, 0) + 1
+    if count <= LOG_WARNING_SAMPLES and not _log_shedding.get() and _LOG_LEVELS['WARNING'] >= _log_threshold:
+        log_warning(_MESSAGE_WARNING_SUMMARIES[kind], kind=kind, log_message=str(log_message)[:LOG_MESSAGE_PREVIEW_CHARS], **fields)
+
+
+def set_log_shedding(enabled):
+    """
+    Drops DEBUG / INFO lines and per-message warning samples while `enabled` (invocation behind its time budget).
+    - Applies to the current invocation only (context variable), not to concurrent ones.
+    """
+    _log_shedding.set(enabled)
+
+
+def log_metric(document):
+    """
+    Buffers a metric document (e.g. EMF) as a raw JSON log line, regardless of LOG_LEVEL.
+    """
+    _log_buffer.append(json.dumps(document, default=str))
+
+
+def flush_logs(summarize=False):
+    """
+    Writes all buffered log lines to stdout at once.
+    - With `summarize`, the current invocation's per-message warning counts are appended first and reset.
+    """
+    if summarize:
+        counts = _message_warning_counts.get()
+        for kind, count in counts.items():
+            log_warning(f"{count} {_MESSAGE_WARNING_SUMMARIES[kind]}", kind=kind, count=count)
+        counts.clear()
+    if _log_buffer:
+        taken = _log_buffer[:] # Lines appended meanwhile by a worker thread stay for the next flush
+        del _log_buffer[:len(taken)]
+        sys.stdout.write('\n'.join(taken) + '\n')
+        sys.stdout.flush()
@@ -0,0 +1,147 @@
+"""
+Mergeable quantile sketch (DDSketch) for tail metrics such as "p99 CPU over the last 5 minutes".
+- Values are counted in logarithmic bins; every quantile estimate is within `relative_accuracy` of the true value.
+- State is bounded by `max_bins` per sign (the lowest bins are collapsed beyond it), typically a few hundred counters.
+- Sketches built from disjoint sets of samples merge exactly (counts add up), so per-batch / per-instance sketches
+  can be combined in any order.
+- to_state() / from_state() give a compact JSON-serializable form for state_store backends.
+"""
+import collections
+import math
+
+MIN_INDEXABLE_VALUE = 1e-9 # Magnitudes below this are counted as zero
+
+
+class DDSketch:
+    """
+    DDSketch with positive / negative logarithmic stores and a zero bucket.
+    """
+
+    def __init__(self, relative_accuracy=0.01, max_bins=2048):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError(f"relative_accuracy must be between 0 and 1, got {relative_accuracy}")
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {} # Bin index -> count, for values gamma^(i-1) < v <= gamma^i
+        self.negative = {} # Same for -v
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add_all(self, values):
+        """
+        Adds a column of samples (e.g. an array('d')); binning is counted in C by collections.Counter.
+        """
+        if not values:
+            return
+        log, ceil, log_gamma = math.log, math.ceil, self._log_gamma
+        positive = collections.Counter(ceil(log(value) / log_gamma) for value in values if value > MIN_INDEXABLE_VALUE)
+        negative = collections.Counter(ceil(log(-value) / log_gamma) for value in values if value < -MIN_INDEXABLE_VALUE)
+        _add_counts(self.positive, positive)
+        _add_counts(self.negative, negative)
+        self.zero_count += len(values) - sum(positive.values()) - sum(negative.values())
+        self.count += len(values)
+        self.sum += math.fsum(values)
+        self.min = min(self.min, min(values))
+        self.max = max(self.max, max(values))
+        self._collapse()
+
+    def merge(self, other):
+        """
+        Adds the samples counted by `other` (same relative accuracy) to this sketch.
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError(f"Cannot merge sketches with relative accuracy {self.relative_accuracy} and {other.relative_accuracy}")
+        _add_counts(self.positive, other.positive)
+        _add_counts(self.negative, other.negative)
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._collapse()
+        return self
+
+    def quantile(self, fraction):
+        """
+        Returns the estimated value at `fraction` (0..1), or None for an empty sketch.
+        """
+        if not self.count:
+            return None
+        rank = fraction * (self.count - 1)
+        seen = 0
+        for index in sorted(self.negative, reverse=True): # Most negative values first
+            seen += self.negative[index]
+            if seen > rank:
+                return max(self.min, -self._bin_value(index))
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.positive):
+            seen += self.positive[index]
+            if seen > rank:
+                return min(self.max, self._bin_value(index))
+        return self.max
+
+    def _bin_value(self, index):
+        return 2 * self.gamma ** index / (self.gamma + 1) # Value with equal relative error to both bin bounds
+
+    def _collapse(self):
+        for store in (self.positive, self.negative):
+            excess = len(store) - self.max_bins
+            if excess > 0: # Fold the lowest-magnitude bins into the first bin kept
+                indexes = sorted(store)
+                store[indexes[excess]] += sum(store.pop(index) for index in indexes[:excess])
+
+    def to_state(self):
+        """
+        Returns the sketch as a JSON-serializable dict; each store is [first index, count, count, ...].
+        """
+        return {
+            'a': self.relative_accuracy,
+            'n': self.count,
+            's': self.sum,
+            'lo': self.min if self.count else None,
+            'hi': self.max if self.count else None,
+            'z': self.zero_count,
+            'p': _encode_store(self.positive),
+            'm': _encode_store(self.negative),
+        }
+
+    @classmethod
+    def from_state(cls, state, max_bins=2048):
+        sketch = cls(state['a'], max_bins)
+        sketch.count = state['n']
+        sketch.sum = state['s']
+        sketch.min = state['lo'] if state['n'] else math.inf
+        sketch.max = state['hi'] if state['n'] else -math.inf
+        sketch.zero_count = state['z']
+        sketch.positive = _decode_store(state['p'])
+        sketch.negative = _decode_store(state['m'])
+        return sketch
+
+
+def _add_counts(store, counts):
+    for index, count in counts.items():
+        store[index] = store.get(index, 0) + count
+
+
+def _encode_store(store):
+    """
+    Dense encoding: metric values cluster in a narrow range, so consecutive bins are mostly non-empty.
+    """
+    if not store:
+        return []
+    first = min(store)
+    return [first] + [store.get(index, 0) for index in range(first, max(store) + 1)]
+
+
+def _decode_store(encoded):
+    if not encoded:
+        return {}
+    first = encoded[0]
+    return {first + offset: count for offset, count in enumerate(encoded[1:]) if count}
@@ -0,0 +1,202 @@
+"""
+Declarative alarm rules, compiled once (at cold start) into a single Python function.
+- Syntax, one rule per line or separated by ';' ('#' starts a comment):
+      cpu > 90 and mem > 85 for 3m -> restart
+      disk.max >= 95 or (cpu.p99 > 98 and not mem < 10) -> notify
+  A condition compares `metric[.aggregate]` with a number (>, >=, <, <=) and combines comparisons with and / or /
+  not and parentheses. The aggregate defaults to the configured one (e.g. p95); metric aliases (cpu, mem, ...)
+  map to metric names. `for <n>s|m|h` requires the condition to hold that long across batches. Actions: notify, restart.
+- All rules compile into one function returning a tuple of booleans, so a group's aggregates are evaluated
+  against every rule in a single call. Missing values read as NaN, which fails every comparison; a `not` over a
+  condition reading a missing value is false as well, so an absent metric never makes a rule match.
+"""
+import re
+
+RULE_ACTIONS = ('notify', 'restart')
+COMPARISON_OPERATORS = ('>=', '<=', '>', '<')
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600}
+
+_TOKEN_PATTERN = re.compile(r'\s*(?:(?P<number>-?\d+(?:\.\d+)?)|(?P<op>>=|<=|>|<|->|\(|\)|,)|(?P<name>[A-Za-z_][\w.]*))')
+
+
+class Rule:
+    """
+    One compiled rule: its source text, the actions it triggers, how long it must hold (seconds, 0 = at once)
+    and the (metric, aggregate) values its condition reads.
+    """
+
+    def __init__(self, source, actions, duration, references):
+        self.source = source
+        self.actions = actions
+        self.duration = duration
+        self.references = references
+
+    def __repr__(self):
+        return f'Rule({self.source!r})'
+
+
+class RuleSet:
+    """
+    Compiled rules plus the (metric, aggregate) values they reference.
+    - evaluate(values) takes a dict keyed by the references and returns one boolean per rule.
+    """
+
+    def __init__(self, rules, references, evaluate):
+        self.rules = rules
+        self.references = references
+        self.evaluate = evaluate
+
+    @property
+    def metric_names(self):
+        return list(dict.fromkeys(metric for metric, _ in self.references))
+
+
+class RuleSyntaxError(ValueError):
+    pass
+
+
+def compile_rules(text, aliases=None, default_aggregate='p95', aggregates=()):
+    """
+    Parses and compiles rule text; raises RuleSyntaxError (a ValueError) with the offending rule on errors.
+    - `aliases` maps short names (cpu) to metric names; `aggregates` lists the selectable aggregate names.
+    """
+    aliases = aliases or {}
+    rules, conditions, references = [], [], {}
+    for line in text.replace(';', '\n').splitlines():
+        source = line.split('#', 1)[0].strip()
+        if not source:
+            continue
+        try:
+            parser = _RuleParser(source, aliases, default_aggregate, aggregates, references)
+            condition, actions, duration = parser.parse()
+        except RuleSyntaxError as e:
+            raise RuleSyntaxError(f"Invalid rule '{source}': {e}") from None
+        rules.append(Rule(source, actions, duration, tuple(parser.rule_references)))
+        conditions.append(condition)
+    code = f"lambda v: ({''.join(condition + ', ' for condition in conditions)})"
+    evaluate = eval(compile(code, '<alarm rules>', 'eval'), {'__builtins__': {}}) # Built only from validated tokens
+    return RuleSet(rules, list(references), evaluate)
+
+
+class _RuleParser:
+    """
+    Recursive-descent parser emitting a Python expression over `v[(metric, aggregate)]`.
+    """
+
+    def __init__(self, source, aliases, default_aggregate, aggregates, references):
+        self.tokens = _tokenize(source)
+        self.position = 0
+        self.aliases = aliases
+        self.default_aggregate = default_aggregate
+        self.aggregates = aggregates
+        self.references = references
+        self.rule_references = {}
+        self.comparison_references = [] # Reference of every comparison parsed so far, in order
+
+    def parse(self):
+        condition = self.parse_or()
+        duration = 0
+        if self.accept('name', 'for'):
+            duration = self.parse_duration()
+        self.expect('op', '->')
+        actions = [self.parse_action()]
+        while self.accept('op', ','):
+            actions.append(self.parse_action())
+        if self.position < len(self.tokens):
+            raise RuleSyntaxError(f"unexpected '{self.tokens[self.position][1]}'")
+        return condition, tuple(dict.fromkeys(actions)), duration
+
+    def parse_or(self):
+        terms = [self.parse_and()]
+        while self.accept('name', 'or'):
+            terms.append(self.parse_and())
+        return terms[0] if len(terms) == 1 else '(' + ' or '.join(terms) + ')'
+
+    def parse_and(self):
+        terms = [self.parse_not()]
+        while self.accept('name', 'and'):
+            terms.append(self.parse_not())
+        return terms[0] if len(terms) == 1 else '(' + ' and '.join(terms) + ')'
+
+    def parse_not(self):
+        if self.accept('name', 'not'):
+            first = len(self.comparison_references)
+            condition = self.parse_not()
+            present = ' and '.join(f'v[{reference!r}] == v[{reference!r}]' for reference in dict.fromkeys(self.comparison_references[first:])) # NaN != NaN
+            return f'({present} and not {condition})'
+        if self.accept('op', '('):
+            condition = self.parse_or()
+            self.expect('op', ')')
+            return condition
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        reference = self.parse_reference()
+        kind, operator = self.next()
+        if kind != 'op' or operator not in COMPARISON_OPERATORS:
+            raise RuleSyntaxError(f"expected a comparison ({', '.join(COMPARISON_OPERATORS)}) after '{reference[0]}', got '{operator}'")
+        kind, number = self.next()
+        if kind != 'number':
+            raise RuleSyntaxError(f"expected a number after '{operator}', got '{number}'")
+        self.references[reference] = None
+        self.rule_references[reference] = None
+        self.comparison_references.append(reference)
+        return f'(v[{reference!r}] {operator} {float(number)!r})'
+
+    def parse_reference(self):
+        kind, name = self.next()
+        if kind != 'name' or name in ('and', 'or', 'not', 'for'):
+            raise RuleSyntaxError(f"expected a metric name, got '{name}'")
+        metric, _, aggregate = name.partition('.')
+        aggregate = aggregate or self.default_aggregate
+        if aggregate not in self.aggregates:
+            raise RuleSyntaxError(f"unknown aggregate '{aggregate}' (expected one of {', '.join(self.aggregates)})")
+        return self.aliases.get(metric, metric), aggregate
+
+    def parse_duration(self):
+        kind, value = self.next()
+        match = re.fullmatch(r'(\d+(?:\.\d+)?)([smh]?)', value) if kind in ('number', 'name') else None
+        if kind == 'number' and self.position < len(self.tokens) and self.tokens[self.position][1] in DURATION_UNITS:
+            match = re.fullmatch(r'(\d+(?:\.\d+)?)([smh])', value + self.next()[1])
+        if match is None:
+            raise RuleSyntaxError(f"invalid duration '{value}' (e.g. 90s, 3m, 1h)")
+        return float(match.group(1)) * DURATION_UNITS.get(match.group(2), 1)
+
+    def parse_action(self):
+        kind, action = self.next()
+        if action not in RULE_ACTIONS:
+            raise RuleSyntaxError(f"unknown action '{action}' (expected {', '.join(RULE_ACTIONS)})")
+        return action
+
+    def next(self):
+        if self.position >= len(self.tokens):
+            raise RuleSyntaxError("unexpected end of rule")
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def accept(self, kind, value):
+        if self.position < len(self.tokens) and self.tokens[self.position] == (kind, value):
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, kind, value):
+        if not self.accept(kind, value):
+            found = self.tokens[self.position][1] if self.position < len(self.tokens) else 'end of rule'
+            raise RuleSyntaxError(f"expected '{value}', got '{found}'")
+
+
+def _tokenize(source):
+    tokens = []
+    position = 0
+    while position < len(source):
+        match = _TOKEN_PATTERN.match(source, position)
+        if match is None or match.end() == position:
+            if source[position:].strip():
+                raise RuleSyntaxError(f"unexpected character '{source[position:].strip()[0]}'")
+            break
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+        position = match.end()
+    return tokens
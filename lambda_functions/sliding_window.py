@@ -0,0 +1,117 @@
+"""
+Sliding-window threshold evaluation ("value >= threshold for M of the last N samples / T seconds").
+- SampleWindow keeps the breach flags of the last N samples of one series (host, metric) in a fixed-size ring buffer.
+- Memory per series is constant (N timestamps + N flags); each push is O(1) amortized, evaluation is O(1).
+- Windows serialize to a compact JSON-able dict (the raw ring buffer), so they can be kept in any state_store backend
+  between invocations and restored without replaying their samples.
+"""
+import base64
+from array import array
+
+
+class SampleWindow:
+    """
+    Ring buffer of (timestamp, breached) for the last `size` samples of a series, optionally limited to `seconds`.
+    - `breaches` is the number of breaching samples currently in the window (maintained incrementally).
+    - Samples older than `seconds` before the newest sample are expired on push (0 disables the time limit).
+    """
+
+    def __init__(self, size, seconds=0):
+        if size < 1:
+            raise ValueError(f"Window size must be at least 1, got {size}")
+        self.size = size
+        self.seconds = seconds
+        self.count = 0
+        self.breaches = 0
+        self._timestamps = array('d', bytes(8 * size))
+        self._flags = bytearray(size)
+        self._start = 0 # Index of the oldest sample
+
+    def push(self, timestamp, breached):
+        """
+        Adds a sample, evicting the oldest one when the window is full, then expires samples older than `seconds`.
+        """
+        if self.count == self.size:
+            self._drop_oldest()
+        index = (self._start + self.count) % self.size
+        self._timestamps[index] = timestamp
+        self._flags[index] = breached
+        self.count += 1
+        self.breaches += breached
+        if self.seconds:
+            self.expire(timestamp - self.seconds)
+
+    def extend(self, timestamps, values, threshold):
+        """
+        Pushes a column of samples (in log event order), flagging those at or above `threshold`.
+        """
+        for timestamp, value in zip(timestamps, values):
+            self.push(timestamp, value >= threshold)
+
+    def expire(self, cutoff):
+        """
+        Drops samples with a timestamp at or before `cutoff`.
+        """
+        while self.count and self._timestamps[self._start] <= cutoff:
+            self._drop_oldest()
+
+    def _drop_oldest(self):
+        self.breaches -= self._flags[self._start]
+        self._start = (self._start + 1) % self.size
+        self.count -= 1
+
+    def sustained(self, min_breaches):
+        """
+        True if at least `min_breaches` samples in the window breached.
+        """
+        return self.breaches >= min_breaches
+
+    def to_state(self):
+        """
+        Returns the ring buffer as a JSON-serializable dict: size, seconds, start index, count, breach count and the raw
+        timestamp / flag arrays (base64), so from_state() restores it with two buffer copies instead of N pushes.
+        """
+        return {
+            'n': self.size,
+            's': self.seconds,
+            'i': self._start,
+            'c': self.count,
+            'k': self.breaches,
+            't': base64.b64encode(self._timestamps.tobytes()).decode(),
+            'b': base64.b64encode(self._flags).decode(),
+        }
+
+    @classmethod
+    def from_state(cls, state, size, seconds=0):
+        """
+        Rebuilds a window from to_state() output.
+        - The ring buffer is restored as-is when `size` and `seconds` are unchanged; otherwise (or for the older
+          list-based state) the stored samples are replayed oldest first, applying the new limits.
+        """
+        window = cls(size, seconds)
+        if not state:
+            return window
+        if state.get('n') == size and state.get('s') == seconds:
+            window._timestamps = array('d')
+            window._timestamps.frombytes(base64.b64decode(state['t']))
+            window._flags = bytearray(base64.b64decode(state['b']))
+            window._start, window.count, window.breaches = state['i'], state['c'], state['k']
+            return window
+        for timestamp, breached in _stored_samples(state):
+            window.push(timestamp, breached)
+        return window
+
+
+def _stored_samples(state):
+    """
+    Yields the (timestamp, breached) samples of a stored window, oldest first.
+    """
+    if 'n' not in state: # List-based state (samples oldest first, flags as hex)
+        yield from zip(state['t'], bytes.fromhex(state['b']))
+        return
+    timestamps = array('d')
+    timestamps.frombytes(base64.b64decode(state['t']))
+    flags = base64.b64decode(state['b'])
+    for offset in range(state['c']):
+        index = (state['i'] + offset) % state['n']
+        yield timestamps[index], flags[index]
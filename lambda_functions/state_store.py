@@ -0,0 +1,206 @@
+"""
+Key-value stores for state that must outlive a single invocation (alert cooldowns, ...).
+- MemoryStateStore: warm-container memory with TTL eviction (lost on cold start, not shared between instances).
+- SqliteStateStore: local SQLite file; a durable stand-in for tests, local runs and long-running deployments.
+- DynamoDBStateStore: DynamoDB table shared by all concurrently running Lambda instances.
+
+Every store implements:
+- get(key) -> value or None (expired entries read as None)
+- put(key, value, ttl_seconds) -> None
+- claim(key, ttl_seconds, value=True) -> bool: atomically set `key` unless a live entry exists; True if this caller set it.
+- update(key, fn, ttl_seconds) -> new value: atomically replace the value with fn(current value or None).
+Values must be JSON-serializable.
+"""
+import collections
+import json
+import threading
+import time
+
+
+class MemoryStateStore:
+    """
+    In-memory store with TTL eviction, bounded to `max_entries` (oldest entries are evicted first).
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict() # Key -> (expires_at, value), in insertion order
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._entries[key]
+                return None
+            return entry[1]
+
+    def put(self, key, value, ttl_seconds):
+        with self._lock:
+            self._set(key, value, ttl_seconds)
+
+    def claim(self, key, ttl_seconds, value=True):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                return False
+            self._set(key, value, ttl_seconds)
+            return True
+
+    def update(self, key, fn, ttl_seconds):
+        with self._lock:
+            entry = self._entries.get(key)
+            value = fn(entry[1] if entry is not None and entry[0] > time.time() else None)
+            self._set(key, value, ttl_seconds)
+            return value
+
+    def _set(self, key, value, ttl_seconds):
+        self._entries.pop(key, None)
+        self._entries[key] = (time.time() + ttl_seconds, value)
+        if len(self._entries) > self.max_entries:
+            self._evict()
+
+    def _evict(self):
+        now = time.time()
+        for key in [key for key, (expires_at, _) in self._entries.items() if expires_at <= now]:
+            del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class SqliteStateStore:
+    """
+    SQLite-backed store; expired rows are ignored on read and replaced on write.
+    """
+
+    def __init__(self, path):
+        import sqlite3
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)')
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute('SELECT value FROM state WHERE key = ? AND expires_at > ?', (key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, key, value, ttl_seconds):
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), time.time() + ttl_seconds),
+            )
+
+    def claim(self, key, ttl_seconds, value=True):
+        now = time.time()
+        with self._lock:
+            cursor = self._connection.execute(
+                'INSERT INTO state (key, value, expires_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at '
+                'WHERE state.expires_at <= ?',
+                (key, json.dumps(value), now + ttl_seconds, now),
+            )
+            return cursor.rowcount == 1
+
+    def update(self, key, fn, ttl_seconds):
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE') # Also serializes writers in other processes sharing the file
+            try:
+                row = self._connection.execute('SELECT value FROM state WHERE key = ? AND expires_at > ?', (key, time.time())).fetchone()
+                value = fn(json.loads(row[0]) if row else None)
+                self._connection.execute(
+                    'INSERT OR REPLACE INTO state (key, value, expires_at) VALUES (?, ?, ?)',
+                    (key, json.dumps(value), time.time() + ttl_seconds),
+                )
+            except BaseException:
+                self._connection.execute('ROLLBACK')
+                raise
+            self._connection.execute('COMMIT')
+        return value
+
+
+class DynamoDBStateStore:
+    """
+    DynamoDB-backed store. The table needs a string partition key `pk`; enable DynamoDB TTL on `expires_at`
+    so expired items are also deleted server-side.
+    - update() is an optimistic read-modify-write on a `version` attribute, retried on conflicting writes.
+    """
+    UPDATE_ATTEMPTS = 5
+
+    def __init__(self, table_name, client):
+        self.table_name = table_name
+        self._client = client
+
+    def get(self, key):
+        item = self._client.get_item(TableName=self.table_name, Key={'pk': {'S': key}}, ConsistentRead=True).get('Item')
+        if item is None or float(item['expires_at']['N']) <= time.time():
+            return None
+        return json.loads(item['value']['S'])
+
+    def put(self, key, value, ttl_seconds):
+        self._client.put_item(TableName=self.table_name, Item=self._item(key, value, ttl_seconds))
+
+    def claim(self, key, ttl_seconds, value=True):
+        try:
+            self._client.put_item(
+                TableName=self.table_name,
+                Item=self._item(key, value, ttl_seconds),
+                ConditionExpression='attribute_not_exists(pk) OR expires_at <= :now',
+                ExpressionAttributeValues={':now': {'N': repr(time.time())}},
+            )
+            return True
+        except Exception as e:
+            if _is_conditional_check_failure(e):
+                return False
+            raise
+
+    def update(self, key, fn, ttl_seconds):
+        for _ in range(self.UPDATE_ATTEMPTS):
+            item = self._client.get_item(TableName=self.table_name, Key={'pk': {'S': key}}, ConsistentRead=True).get('Item')
+            live = item is not None and float(item['expires_at']['N']) > time.time()
+            value = fn(json.loads(item['value']['S']) if live else None)
+            new_item = self._item(key, value, ttl_seconds)
+            if item is None:
+                new_item['version'] = {'N': '1'}
+                condition = {'ConditionExpression': 'attribute_not_exists(pk)'}
+            elif 'version' in item:
+                new_item['version'] = {'N': str(int(item['version']['N']) + 1)}
+                condition = {'ConditionExpression': 'version = :version', 'ExpressionAttributeValues': {':version': item['version']}}
+            else: # Written by put() / claim()
+                new_item['version'] = {'N': '1'}
+                condition = {'ConditionExpression': 'attribute_not_exists(version)'}
+            try:
+                self._client.put_item(TableName=self.table_name, Item=new_item, **condition)
+                return value
+            except Exception as e:
+                if not _is_conditional_check_failure(e):
+                    raise
+        raise RuntimeError(f"Update of '{key}' kept conflicting with concurrent writers ({self.UPDATE_ATTEMPTS} attempts)")
+
+    def _item(self, key, value, ttl_seconds):
+        return {
+            'pk': {'S': key},
+            'value': {'S': json.dumps(value)},
+            'expires_at': {'N': repr(time.time() + ttl_seconds)},
+        }
+
+
+def _is_conditional_check_failure(error):
+    return getattr(error, 'response', {}).get('Error', {}).get('Code') == 'ConditionalCheckFailedException'
+
+
+def open_state_store(spec, get_client):
+    """
+    Creates a store from a spec string: 'memory', 'sqlite:<path>' or 'dynamodb:<table name>'.
+    - `get_client` is used to obtain the DynamoDB client lazily.
+    """
+    kind, _, location = spec.partition(':')
+    if kind == 'memory':
+        return MemoryStateStore()
+    if kind == 'sqlite':
+        return SqliteStateStore(location or ':memory:')
+    if kind == 'dynamodb':
+        return DynamoDBStateStore(location, get_client('dynamodb'))
+    raise ValueError(f"Unknown state store '{spec}' (expected memory, sqlite:<path> or dynamodb:<table>)")
@@ -2,8 +2,9 @@
 # restart_service.sh - Example recovery script (service restart)
 
 SERVICE_NAME="your-service-name"  # Service name to restart (change to your actual service name)
+TARGET="${1:-local}"  # Host / log stream that breached the threshold (passed by the Lambda function)
 
-echo "Starting service restart: $SERVICE_NAME"
+echo "Starting service restart: $SERVICE_NAME (target: $TARGET)"
 
 # Use systemctl command to restart service (assuming systemd-based system)
 if command -v systemctl &> /dev/null
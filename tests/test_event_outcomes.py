@@ -0,0 +1,195 @@
+"""
+Tests for per-event outcome tracking: checkpoint bitmaps, dead-letter sinks and the resume of a retried delivery.
+"""
+import base64
+import gzip
+import json
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda_functions'))
+os.environ.setdefault('AWS_CLIENT_BACKEND', 'local')
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+import event_outcomes  # noqa: E402
+import extractors  # noqa: E402
+import metric_processor  # noqa: E402
+
+
+def processed_positions(bitmap, events):
+    outcomes = event_outcomes.EventOutcomes(bitmap)
+    return [position for position in range(events) if outcomes.already_processed(position)]
+
+
+class CheckpointBitmapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.outcomes = event_outcomes.EventOutcomes()
+        for position in range(11):
+            self.outcomes.add_sample_event(position, 'a' if position % 2 else 'b')
+        self.outcomes.events = 12
+        self.outcomes.quarantine(11, {'id': '11', 'message': 'oops'}, 'not_json')
+
+    def test_all_events_processed(self):
+        self.assertEqual(processed_positions(self.outcomes.checkpoint_bitmap(), 16), list(range(12)))
+
+    def test_failed_groups_stay_unprocessed(self):
+        bitmap = self.outcomes.checkpoint_bitmap(failed_groups=['a'])
+        self.assertEqual(processed_positions(bitmap, 16), [0, 2, 4, 6, 8, 10, 11])
+        self.assertEqual(self.outcomes.counts(['a']), {'events': 12, 'skipped': 0, 'quarantined': 1, 'failed': 5, 'processed': 7})
+
+    def test_failed_quarantine_write_keeps_quarantined_events(self):
+        bitmap = self.outcomes.checkpoint_bitmap(failed_groups=['b'], quarantine_failed=True)
+        self.assertEqual(processed_positions(bitmap, 16), [1, 3, 5, 7, 9])
+
+    def test_bitmap_round_trip(self):
+        for events in (0, 1, 7, 8, 9, 1000):
+            outcomes = event_outcomes.EventOutcomes()
+            outcomes.events = events
+            with self.subTest(events=events):
+                bitmap = event_outcomes.decode_bitmap(event_outcomes.encode_bitmap(outcomes.checkpoint_bitmap()))
+                self.assertEqual(processed_positions(bitmap, events + 9), list(range(events)))
+        self.assertEqual(event_outcomes.decode_bitmap(None), bytearray())
+
+    def test_quarantine_once_per_event(self):
+        self.outcomes.quarantine(11, {'id': '11', 'message': 'oops'}, 'invalid_value')
+        self.assertEqual([record['reason'] for record in self.outcomes.quarantined], ['not_json'])
+
+
+class RecordingSQS:
+
+    def __init__(self):
+        self.batches = []
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.batches.append([entry['MessageBody'] for entry in Entries])
+        return {'Successful': [{'Id': entry['Id']} for entry in Entries], 'Failed': []}
+
+
+class SqsDeadLetterSinkTest(unittest.TestCase):
+    LIMIT = event_outcomes.SqsDeadLetterSink.MAX_BATCH_BYTES
+
+    def write(self, records):
+        client = RecordingSQS()
+        event_outcomes.SqsDeadLetterSink('https://sqs.example/queue', client).write(records)
+        for batch in client.batches:
+            self.assertLessEqual(len(batch), 10)
+            self.assertLessEqual(sum(len(body.encode()) for body in batch), self.LIMIT)
+        return [json.loads(body) for batch in client.batches for body in batch], client.batches
+
+    def test_small_records_ten_per_batch(self):
+        records = [{'id': str(index), 'message': 'x'} for index in range(25)]
+        sent, batches = self.write(records)
+        self.assertEqual([len(batch) for batch in batches], [10, 10, 5])
+        self.assertEqual(sent, records)
+
+    def test_batches_split_by_encoded_size(self):
+        records = [{'id': str(index), 'message': 'a' * 100000} for index in range(5)]
+        sent, batches = self.write(records)
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(sent, records)
+
+    def test_non_ascii_message_truncated_to_fit(self):
+        for text in ('é', '日本', '😀', 'a\\"é'):
+            records = [{'id': '1', 'reason': 'not_json', 'message': text * event_outcomes.DEAD_LETTER_MESSAGE_MAX_CHARS}]
+            with self.subTest(text=text):
+                sent, batches = self.write(records)
+                self.assertEqual(len(batches), 1)
+                self.assertTrue(sent[0]['truncated'])
+                self.assertTrue(records[0]['message'].startswith(sent[0]['message']))
+                self.assertGreater(len(batches[0][0]), self.LIMIT - 12) # Cut close to the limit, not emptied
+
+    def test_truncation_keeps_escape_sequences_whole(self):
+        for limit in range(60, 120):
+            body = event_outcomes.encode_record({'id': '1', 'message': '😀é"\\日' * 10}, limit)
+            with self.subTest(limit=limit):
+                self.assertLessEqual(len(body), limit)
+                self.assertNotIn('\\ud83d"', body) # No lone high surrogate at the cut
+                json.loads(body)
+
+
+class RetriedDeliveryTest(unittest.TestCase):
+    """
+    lambda_handler with CHECKPOINT_TTL_SECONDS: a partially failed delivery raises, and its retry handles only the rest.
+    Decoded payloads handled with checkpoint=False (metric_daemon.py) are processed in full every time.
+    """
+
+    def setUp(self):
+        dead_letter_file = tempfile.NamedTemporaryFile(suffix='.jsonl', delete=False)
+        dead_letter_file.close()
+        self.dead_letter_path = dead_letter_file.name
+        self.addCleanup(os.remove, self.dead_letter_path)
+        patcher = mock.patch.multiple(
+            metric_processor,
+            CHECKPOINT_TTL_SECONDS=600,
+            DEAD_LETTER_SINK=f'file:{self.dead_letter_path}',
+            GROUP_BY='host',
+            LOG_EXTRACTOR=extractors.compile_extractor('json', metric_processor.METRIC_NAMES_TO_MONITOR, None, 'host'),
+            ALARM_RULE_SET=None,
+            WINDOW_SAMPLES=0,
+            _dead_letter_sink=None,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        metric_name = metric_processor.METRIC_NAMES_TO_MONITOR[0]
+        messages = [json.dumps({metric_name: 10, 'host': f'host-{index % 2}'}) for index in range(6)] + [f'{{"{metric_name}": oops}}'] # Passes the prefilter, fails to parse
+        stream = f'stream-{id(self)}' # Own checkpoint key per test
+        payload = {'logGroup': 'g', 'logStream': stream, 'logEvents': [{'id': f'{stream}-{index}', 'timestamp': index, 'message': message} for index, message in enumerate(messages)]}
+        self.event = {'awslogs': {'data': base64.b64encode(gzip.compress(json.dumps(payload).encode())).decode()}}
+        self.evaluate_group = metric_processor.evaluate_group
+
+    def invoke(self, failing_group=None):
+        def evaluate_group(group, *args):
+            if group == failing_group:
+                raise RuntimeError('store unavailable')
+            return self.evaluate_group(group, *args)
+        with mock.patch.object(metric_processor, 'evaluate_group', evaluate_group), mock.patch('sys.stdout'):
+            return metric_processor.lambda_handler(self.event, None)
+
+    def dead_letters(self):
+        with open(self.dead_letter_path) as dead_letter_file:
+            return [json.loads(line) for line in dead_letter_file]
+
+    def test_retry_handles_only_the_failed_groups_events(self):
+        with self.assertRaises(metric_processor.PartialFailureError) as raised:
+            self.invoke(failing_group='host-1')
+        self.assertEqual(raised.exception.response['statusCode'], 500)
+        self.assertEqual(raised.exception.response['events'], {'events': 7, 'skipped': 0, 'quarantined': 1, 'failed': 3, 'processed': 4})
+        self.assertEqual([record['reason'] for record in self.dead_letters()], ['not_json'])
+
+        response = self.invoke()
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual(response['events'], {'events': 7, 'skipped': 4, 'quarantined': 0, 'failed': 0, 'processed': 3})
+        self.assertEqual(len(self.dead_letters()), 1) # Not quarantined twice
+
+        response = self.invoke()
+        self.assertEqual(response['events'], {'events': 7, 'skipped': 7, 'quarantined': 0, 'failed': 0, 'processed': 0})
+
+    def test_failed_dead_letter_write_is_retried(self):
+        with mock.patch.object(event_outcomes.FileDeadLetterSink, 'write', side_effect=OSError('disk full')):
+            response = self.invoke()
+        self.assertEqual(response['events']['processed'], 7) # Evaluation succeeded; only the quarantine write failed
+        response = self.invoke()
+        self.assertEqual(response['events'], {'events': 7, 'skipped': 6, 'quarantined': 1, 'failed': 0, 'processed': 1})
+        self.assertEqual(len(self.dead_letters()), 1)
+
+    def test_no_exception_without_checkpoints(self):
+        with mock.patch.object(metric_processor, 'CHECKPOINT_TTL_SECONDS', 0):
+            response = self.invoke(failing_group='host-1')
+        self.assertEqual(response['statusCode'], 500)
+        self.assertEqual(response['body'], 'CloudWatch Metric Processing Partially Failed')
+
+    def test_decoded_payload_without_checkpoints(self):
+        payload = json.loads(gzip.decompress(base64.b64decode(self.event['awslogs']['data']))) # As batched by metric_daemon.py, whose event ids repeat
+        for _ in range(2):
+            with mock.patch('sys.stdout'):
+                response = metric_processor.run_coroutine(metric_processor.handle_event(payload, None, checkpoint=False))
+            self.assertEqual(response['events'], {'events': 7, 'skipped': 0, 'quarantined': 1, 'failed': 0, 'processed': 7})
+        self.assertEqual(len(self.dead_letters()), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+"""
+Tests for the compiled log message extractors (extractors.compile_extractor).
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda_functions'))
+
+import extractors  # noqa: E402
+
+
+def extract(extractor, message):
+    """
+    Applies an extractor like extract_metric_columns does: prefilter first, then parse.
+    """
+    if extractor.prefilter is not None and not extractor.prefilter(message):
+        return {}
+    return extractor.parse(message)
+
+
+class JsonPathTest(unittest.TestCase):
+
+    def test_nested_paths_and_list_indices(self):
+        extractor = extractors.compile_extractor('json', ['CPUUtilization', 'MemoryUtilization'], {'CPUUtilization': 'metrics.cpu.0', 'MemoryUtilization': 'metrics.mem.util'}, 'host.name')
+        for message, expected in (
+            ('{"metrics": {"cpu": [55, 60], "mem": {"util": 40}}, "host": {"name": "a"}}', {'CPUUtilization': 55, 'MemoryUtilization': 40, 'host.name': 'a'}),
+            ('{"metrics": {"cpu": [55]}}', {'CPUUtilization': 55}),
+            ('{"metrics": {"cpu": []}}', {}),
+            ('{"other": 1}', {}),
+        ):
+            with self.subTest(message=message):
+                self.assertEqual(extract(extractor, message), expected)
+
+    def test_index_only_path_has_no_prefilter(self):
+        extractor = extractors.compile_extractor('json', ['CPUUtilization'], {'CPUUtilization': '0'})
+        self.assertIsNone(extractor.prefilter)
+        self.assertEqual(extract(extractor, '[7, 8]'), {'CPUUtilization': 7})
+
+    def test_dotted_metric_name_reads_the_literal_key_first(self):
+        for log_format in ('json', 'json_scan'):
+            extractor = extractors.compile_extractor(log_format, ['system.cpu.util'])
+            with self.subTest(log_format=log_format):
+                self.assertEqual(float(extract(extractor, '{"system.cpu.util": 95}')['system.cpu.util']), 95.0)
+                self.assertEqual(extract(extractor, '{"cpu": 95}'), {})
+        extractor = extractors.compile_extractor('json', ['system.cpu.util'])
+        self.assertEqual(extract(extractor, '{"system": {"cpu": {"util": 90}}}'), {'system.cpu.util': 90})
+
+    def test_json_scan_rejects_nested_metric_fields(self):
+        with self.assertRaises(ValueError):
+            extractors.compile_extractor('json_scan', ['CPUUtilization'], {'CPUUtilization': 'metrics.cpu'})
+
+
+if __name__ == '__main__':
+    unittest.main()
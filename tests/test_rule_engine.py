@@ -0,0 +1,163 @@
+"""
+Tests for the declarative alarm rules: rule_engine.compile_rules and the rule evaluation in metric_processor.
+Run with: python -m unittest discover -s tests (or pytest).
+"""
+import math
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda_functions'))
+os.environ.setdefault('AWS_CLIENT_BACKEND', 'local')
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+import metric_processor  # noqa: E402
+import rule_engine  # noqa: E402
+
+ALIASES = {'cpu': 'CPUUtilization', 'mem': 'MemoryUtilization', 'disk': 'DiskUtilization'}
+AGGREGATES = ('max', 'mean', 'p95', 'p99')
+
+
+def compile_rules(text):
+    return rule_engine.compile_rules(text, ALIASES, 'p95', AGGREGATES)
+
+
+def evaluate(text, **values):
+    """
+    Evaluates one rule against p95 values given by alias (missing aliases read as NaN, as in evaluate_rules).
+    """
+    rule_set = compile_rules(text)
+    given = {(ALIASES[alias], 'p95'): value for alias, value in values.items()}
+    return rule_set.evaluate({reference: given.get(reference, math.nan) for reference in rule_set.references})[0]
+
+
+class RuleSyntaxTest(unittest.TestCase):
+
+    def test_accepted_rules(self):
+        rule_set = compile_rules("""
+            cpu > 90 and mem > 85 for 3m -> restart   # comment
+            disk.max >= 95 or (cpu.p99 > 98 and not mem < 10) -> notify, restart; MemoryUtilization.mean <= 5 -> notify
+        """)
+        self.assertEqual([rule.actions for rule in rule_set.rules], [('restart',), ('notify', 'restart'), ('notify',)])
+        self.assertEqual([rule.duration for rule in rule_set.rules], [180, 0, 0])
+        self.assertEqual(rule_set.rules[1].references, (('DiskUtilization', 'max'), ('CPUUtilization', 'p99'), ('MemoryUtilization', 'p95')))
+        self.assertEqual(rule_set.metric_names, ['CPUUtilization', 'MemoryUtilization', 'DiskUtilization'])
+
+    def test_durations(self):
+        for text, seconds in (('90s', 90), ('90', 90), ('1.5m', 90), ('2h', 7200), ('2 h', 7200)):
+            with self.subTest(duration=text):
+                self.assertEqual(compile_rules(f'cpu > 90 for {text} -> notify').rules[0].duration, seconds)
+
+    def test_rejected_rules(self):
+        for text in (
+            'cpu > 90',                       # No action
+            'cpu > 90 -> reboot',             # Unknown action
+            'cpu = 90 -> notify',             # Unknown operator
+            'cpu > high -> notify',           # Not a number
+            'cpu.p42 > 90 -> notify',         # Unknown aggregate
+            '(cpu > 90 -> notify',            # Unbalanced parenthesis
+            'cpu > 90 and -> notify',         # Missing comparison
+            'not > 90 -> notify',             # Keyword as metric name
+            'cpu > 90 for soon -> notify',    # Invalid duration
+            'cpu > 90 -> notify restart',     # Missing comma
+            'cpu > 90 $ -> notify',           # Unexpected character
+        ):
+            with self.subTest(rule=text), self.assertRaises(rule_engine.RuleSyntaxError) as raised:
+                compile_rules(text)
+            self.assertIn(text.split('$')[0].strip(), str(raised.exception))
+
+    def test_syntax_error_is_a_value_error(self):
+        self.assertTrue(issubclass(rule_engine.RuleSyntaxError, ValueError))
+
+
+class RuleEvaluationTest(unittest.TestCase):
+
+    def test_comparisons_and_combinations(self):
+        for text, values, expected in (
+            ('cpu > 90 -> notify', {'cpu': 95}, True),
+            ('cpu > 90 -> notify', {'cpu': 90}, False),
+            ('cpu >= 90 -> notify', {'cpu': 90}, True),
+            ('cpu < 10 or mem < 10 -> notify', {'cpu': 50, 'mem': 5}, True),
+            ('cpu > 90 and mem > 85 -> notify', {'cpu': 95, 'mem': 80}, False),
+            ('not (cpu > 90 or mem > 90) -> notify', {'cpu': 50, 'mem': 50}, True),
+            ('not not cpu > 90 -> notify', {'cpu': 95}, True),
+        ):
+            with self.subTest(rule=text, values=values):
+                self.assertIs(evaluate(text, **values), expected)
+
+    def test_missing_metrics_never_match(self):
+        for text, values, expected in (
+            ('cpu > 90 -> notify', {}, False),
+            ('cpu < 90 -> notify', {}, False),
+            ('cpu > 90 and not mem < 10 -> notify', {'cpu': 95}, False),
+            ('cpu > 90 and not mem < 10 -> notify', {'cpu': 95, 'mem': 50}, True),
+            ('not mem < 10 -> notify', {}, False),
+            ('not (cpu > 90 or mem < 10) -> notify', {'cpu': 50}, False),
+            ('not (cpu > 90 and mem < 10) -> notify', {'cpu': 95}, False),
+            ('not not mem > 10 -> notify', {}, False),
+            ('cpu > 90 or mem > 90 -> notify', {'cpu': 95}, True),
+            ('cpu > 90 or mem > 90 -> notify', {'cpu': 50}, False),
+            ('cpu > 90 or not mem > 90 -> notify', {'cpu': 50}, False),
+            ('disk > 90 or not mem > 90 -> notify', {'mem': 50}, True),
+        ):
+            with self.subTest(rule=text, values=values):
+                self.assertIs(evaluate(text, **values), expected)
+
+    def test_missing_metric_queues_no_action(self):
+        rule_set = compile_rules('cpu > 90 and not mem < 10 -> notify, restart')
+        with mock.patch.multiple(metric_processor, ALARM_RULE_SET=rule_set, SNS_TOPIC_ARN='arn:test', ALERT_COOLDOWN_SECONDS=0):
+            metric_processor.take_alarm_actions()
+            metric_processor.evaluate_rules('host-a', {'CPUUtilization': {'p95': 95.0}})
+            self.assertEqual(metric_processor.take_alarm_actions(), ([], []))
+            metric_processor.evaluate_rules('host-a', {'CPUUtilization': {'p95': 95.0}, 'MemoryUtilization': {'p95': 50.0}})
+            messages, targets = metric_processor.take_alarm_actions()
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(targets, ['host-a'])
+
+
+class RuleConditionHeldTest(unittest.TestCase):
+    """
+    "for <duration>" state, kept in warm-container memory (STATE_STORE=memory) with a mocked clock.
+    """
+
+    def setUp(self):
+        self.now = 1_700_000_000.0
+        patcher = mock.patch('time.time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.rule = compile_rules('cpu > 90 for 3m -> notify').rules[0]
+        self.group = f'host-{id(self)}'
+
+    def held(self, matched, after=0):
+        self.now += after
+        return metric_processor.rule_condition_held(self.rule, self.group, matched)
+
+    def test_holds_once_the_duration_has_passed(self):
+        self.assertFalse(self.held(True))
+        self.assertFalse(self.held(True, after=120))
+        self.assertTrue(self.held(True, after=60))
+        self.assertTrue(self.held(True, after=60))
+
+    def test_failed_condition_restarts_the_duration(self):
+        self.assertFalse(self.held(True))
+        self.assertFalse(self.held(True, after=150))
+        self.assertFalse(self.held(False, after=10))
+        self.assertFalse(self.held(True, after=10))
+        self.assertFalse(self.held(True, after=150))
+        self.assertTrue(self.held(True, after=30))
+
+    def test_start_expires_without_confirming_batches(self):
+        gap = metric_processor.RULE_STATE_GAP_SECONDS
+        self.rule = compile_rules(f'cpu > 90 for {3 * gap:g}s -> notify').rules[0]
+        self.assertFalse(self.held(True))
+        self.assertFalse(self.held(True, after=gap - 1)) # Confirmed within the gap: the start is kept
+        self.assertFalse(self.held(True, after=gap - 1))
+        self.assertFalse(self.held(True, after=gap - 1))
+        self.assertTrue(self.held(True, after=3))
+        self.assertFalse(self.held(True, after=gap + 1)) # Silent for longer than the gap: starts over
+        self.assertFalse(self.held(True, after=gap - 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+"""
+Tests for the streaming awslogs decoder (metric_processor.iter_log_events) at small STREAM_CHUNK_SIZE values, so that
+base64 groups, gzip blocks, multi-byte UTF-8 sequences, log events and payload keys straddle chunk boundaries.
+"""
+import base64
+import gzip
+import json
+import os
+import random
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda_functions'))
+os.environ.setdefault('AWS_CLIENT_BACKEND', 'local')
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+import metric_processor  # noqa: E402
+
+CHUNK_SIZES = (1, 2, 3, 4, 5, 7, 13, 64, 1000, 64 * 1024)
+MESSAGES = (
+    '{"CPUUtilization": 91.5, "host": "web-1"}',
+    'plain text with "quotes", commas, ] brackets and {"logEvents": [ inside',
+    '{"host": "hôte-é", "note": "日本語のログ", "emoji": "😀🚀"}',
+    '',
+    '\\ backslash \\" and \n newline',
+)
+
+
+def encode(payload_text):
+    return base64.b64encode(gzip.compress(payload_text.encode())).decode()
+
+
+def build_payload(log_events, trailer=True, ensure_ascii=False):
+    """
+    Payload text with fields before logEvents and, optionally, after it (the order CloudWatch Logs does not guarantee).
+    """
+    head = {'messageType': 'DATA_MESSAGE', 'owner': '123456789012', 'logGroup': 'grüppe', 'logStream': 'i-0abc'}
+    text = json.dumps(head, ensure_ascii=ensure_ascii)[:-1] + ', "logEvents": ' + json.dumps(log_events, ensure_ascii=ensure_ascii)
+    if trailer:
+        text += ', "subscriptionFilters": ["filter-ü"], "policyLevel": "ACCOUNT_LEVEL_POLICY"'
+    return text + '}'
+
+
+def decode(encoded, chunk_size):
+    envelope = {}
+    with mock.patch.object(metric_processor, 'STREAM_CHUNK_SIZE', chunk_size):
+        log_events = list(metric_processor.iter_log_events(encoded, envelope))
+    return log_events, envelope
+
+
+class IterLogEventsTest(unittest.TestCase):
+
+    def assert_decodes(self, payload_text, chunk_sizes=CHUNK_SIZES):
+        expected = json.loads(payload_text)
+        expected_events = expected.pop('logEvents')
+        encoded = encode(payload_text)
+        for chunk_size in chunk_sizes:
+            with self.subTest(chunk_size=chunk_size):
+                log_events, envelope = decode(encoded, chunk_size)
+                self.assertEqual(log_events, expected_events)
+                self.assertEqual(envelope, expected)
+
+    def test_multibyte_text_and_fields_after_log_events(self):
+        log_events = [{'id': str(index), 'timestamp': 1700000000000 + index, 'message': message} for index, message in enumerate(MESSAGES)]
+        for trailer in (True, False):
+            for ensure_ascii in (False, True):
+                with self.subTest(trailer=trailer, ensure_ascii=ensure_ascii):
+                    self.assert_decodes(build_payload(log_events, trailer, ensure_ascii))
+
+    def test_empty_log_events(self):
+        self.assert_decodes(build_payload([]))
+
+    def test_whitespace_between_entries(self):
+        payload_text = '{ "logGroup" : "g" ,\n "logEvents" : [ \n {"id": "1", "message": "a"} ,\n\t{"id": "2", "message": "é"}\n ] ,\n "logStream": "s" }'
+        self.assert_decodes(payload_text)
+
+    def test_random_payloads(self):
+        generator = random.Random(1)
+        alphabet = 'abc xyz{}[]",:\\é日😀\n'
+        for _ in range(20):
+            log_events = [
+                {'id': str(index), 'timestamp': index, 'message': ''.join(generator.choice(alphabet) for _ in range(generator.randint(0, 60)))}
+                for index in range(generator.randint(0, 12))
+            ]
+            self.assert_decodes(build_payload(log_events, trailer=generator.random() < 0.5, ensure_ascii=generator.random() < 0.5), chunk_sizes=(1, 3, 5, 17))
+
+    def test_malformed_payloads(self):
+        for payload_text, error in (
+            ('{"logGroup": "g"}', KeyError),
+            ('{"logGroup": "g", "logEvents": [{"id": "1"', json.JSONDecodeError),
+            ('{"logGroup": "g", "logEvents": [{"id": "1"}] "x": 1}', json.JSONDecodeError),
+            ('not json', json.JSONDecodeError),
+        ):
+            for chunk_size in (1, 5, 64 * 1024):
+                with self.subTest(payload=payload_text, chunk_size=chunk_size), self.assertRaises(error):
+                    decode(encode(payload_text), chunk_size)
+
+
+if __name__ == '__main__':
+    unittest.main()